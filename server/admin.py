@@ -0,0 +1,125 @@
+import threading
+
+from cache import MemoryCacheBackend
+from migrations import STAT_COUNTERS
+from pagination import Keyset
+
+# 管理界面的用户目录
+#
+# 用户列表按页读取（keyset分页），搜索和排序都在SQL中完成，只查询页面显示的列。
+# 用户列表页、单个用户的基本信息和各用户的数据总数放在一个短TTL的进程内缓存中，
+# 管理员来回翻页、进入用户详情时不必每次都查询数据库；新用户注册时清空列表页缓存，
+# 其他数据的变化最多延迟 TTL 秒显示。
+
+# 用户列表的排序方式：username 和 email 本身唯一，不需要再用id区分
+USER_SORTS = {
+    'created': Keyset(('created_at', True, False), ('id', True, False)),
+    'username': Keyset(('username', False, False)),
+    'email': Keyset(('email', False, False)),
+}
+DEFAULT_USER_SORT = 'created'
+
+# 管理页面只读取模板中显示的列（不读取密码哈希和日记正文）
+USER_COLUMNS = 'id, username, email, created_at, updated_at, last_login_at'
+
+_LIST_GROUP = ('users',)
+
+
+def search_clause(query):
+    """返回按用户名或邮箱模糊搜索（不区分大小写）的WHERE条件及参数，query为空时不过滤"""
+    if not query:
+        return '1', []
+    pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    return "(username LIKE ? ESCAPE '\\' OR email LIKE ? ESCAPE '\\')", [pattern, pattern]
+
+
+class UserDirectory:
+    """
+    用户列表页、用户基本信息和各用户数据总数的读穿透缓存
+
+    每个工作进程各持有一份，与列表缓存一样依靠读取前记录的epoch避免写入过期数据
+    """
+
+    def __init__(self, max_entries=1024, ttl=10):
+        self._backend = MemoryCacheBackend(max_entries=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0}
+
+    def _count(self, key, amount=1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def _cached(self, key, group, load):
+        value = self._backend.get(key)
+        if value is not None:
+            self._count('hits')
+            return value
+        self._count('misses')
+        epoch = self._backend.epoch()
+        value = load()
+        self._backend.set_if_epoch(key, value, group, epoch)
+        return value
+
+    def page(self, key, load):
+        """缓存一页用户列表，load() 返回 (行列表, 下一页游标)"""
+        return self._cached(('page',) + key, _LIST_GROUP, load)
+
+    def total(self, cursor, query):
+        """匹配搜索条件的用户总数"""
+        def load():
+            where, params = search_clause(query)
+            cursor.execute(f'SELECT COUNT(*) FROM users WHERE {where}', params)
+            return cursor.fetchone()[0]
+        return self._cached(('total', query), _LIST_GROUP, load)
+
+    def user(self, cursor, user_id):
+        """返回用户的基本信息（字典），用户不存在时返回None，不存在的结果不缓存"""
+        value = self._backend.get(('user', user_id))
+        if value is not None:
+            self._count('hits')
+            return value
+        self._count('misses')
+        epoch = self._backend.epoch()
+        cursor.execute(f'SELECT {USER_COLUMNS} FROM users WHERE id = ?', (user_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        value = dict(row)
+        self._backend.set_if_epoch(('user', user_id), value, ('user', user_id), epoch)
+        return value
+
+    def counts(self, cursor, user_ids):
+        """返回 {user_id: {资源: 数量}}，未缓存的用户合并为一次按主键的 IN 查询"""
+        result = {}
+        missing = []
+        for user_id in user_ids:
+            value = self._backend.get(('counts', user_id))
+            if value is None:
+                missing.append(user_id)
+            else:
+                result[user_id] = value
+        self._count('hits', len(result))
+        if not missing:
+            return result
+
+        self._count('misses', len(missing))
+        epoch = self._backend.epoch()
+        placeholders = ', '.join('?' for _ in missing)
+        cursor.execute(f"SELECT user_id, {', '.join(STAT_COUNTERS)} FROM user_stats "
+                       f"WHERE user_id IN ({placeholders})", missing)
+        loaded = {row[0]: dict(zip(STAT_COUNTERS, row[1:])) for row in cursor.fetchall()}
+        for user_id in missing:
+            value = loaded.get(user_id) or dict.fromkeys(STAT_COUNTERS, 0)
+            self._backend.set_if_epoch(('counts', user_id), value, ('counts', user_id), epoch)
+            result[user_id] = value
+        return result
+
+    def invalidate_users(self):
+        """用户增加后调用，清空用户列表页和总数的缓存"""
+        self._backend.invalidate_group(_LIST_GROUP)
+
+    def stats(self):
+        snapshot = self._backend.stats()
+        with self._lock:
+            snapshot.update(self._stats)
+        return snapshot
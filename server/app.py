@@ -1,15 +1,49 @@
-from flask import Flask, jsonify, request, render_template, redirect, url_for, send_from_directory
+from flask import (Blueprint, Flask, Response, abort, current_app, g, jsonify, request, render_template, redirect,
+                   url_for)
 from flask_cors import CORS
 import sqlite3
 import json
 import datetime
+import functools
+import logging
+import time
 import uuid
 import os
 import re
+import zlib
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
+from db import configure_pool, get_pool
+from migrations import run_migrations
+from pagination import DEFAULT_PAGE_SIZE, Keyset, parse_page_args, fetch_page
+from sync import (collect_changes, decode_sync_token, encode_sync_token, prune_tombstones, table_version,
+                  row_version)
+from serializers import (install_json_provider, MAPPERS, JOURNAL_MAPPER, CATEGORY_MAPPER, HABIT_MAPPER,
+                         TODO_MAPPER)
+from cache import configure_list_cache, get_list_cache
+from uploads import (UploadError, create_session, get_session, write_chunk, complete_session, abort_session,
+                     prune_sessions_if_due)
+from blobstore import BlobCollector, blob_path, spool_stream, store_file, resolve_file, release_file
+from thumbnails import (SIZES as THUMBNAIL_SIZES, ThumbnailPool, is_image, derivative_key, derivative_path,
+                        derivative_is_fresh)
+from media import serve_media
+from search import parse_search_args, search_journals
+from stats import parse_stats_args, read_stats
+from checkins import (MAX_CHECKINS_PER_REQUEST, apply_checkins, parse_date, stats_for_habits,
+                      parse_stats_args as parse_habit_stats_args)
+from admin import DEFAULT_USER_SORT, USER_COLUMNS, USER_SORTS, UserDirectory, search_clause
+from auth import PasswordHasher, PoolSaturated, TokenBucketLimiter, needs_rehash
+from tokens import (TokenError, TokenSigner, RevocationCache, load_secret, store_refresh_token,
+                    rotate_refresh_token, revoke_refresh_family)
+from metrics import Metrics
+from logs import configure_logging, get_logger, log_event
+from mutations import (MAX_BATCH_OPERATIONS, PreconditionFailed, to_snake_case_keys, prepare_insert,
+                       prepare_update, insert_record, update_record, delete_record, apply_batch)
+from writequeue import GroupCommitWriter, WriterSaturated
 
-app = Flask(__name__)
-CORS(app)  # 允许跨域请求
+# 所有接口注册在该蓝图上，由 create_app() 创建应用时挂载
+bp = Blueprint('momentkeep', __name__)
 
 # 数据库配置
 # DATABASE = 'server/moment_keep.db'
@@ -20,11 +54,167 @@ UPLOAD_FOLDER = './uploads'  # 使用相对路径，相对于server目录
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'mp4', 'mp3', 'wav'}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16 MB
 
-# 确保上传文件夹存在
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+STREAM_FETCH_SIZE = 200  # 流式响应每次从游标读取的行数
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+# 应用默认配置
+# 每一项都可以通过 MOMENTKEEP_ 前缀的环境变量覆盖，例如 MOMENTKEEP_DATABASE=/data/moment_keep.db、
+# MOMENTKEEP_LIST_CACHE_TTL=60（值按JSON解析）
+DEFAULT_CONFIG = {
+    'DATABASE': DATABASE,
+    'UPLOAD_FOLDER': UPLOAD_FOLDER,
+    'MAX_CONTENT_LENGTH': MAX_CONTENT_LENGTH,
+    # 分块续传上传（/api/uploads）：单个文件的大小上限、建议的分块大小、会话闲置多久后过期。
+    # 每个分块是一个独立请求，分块大小不能超过 MAX_CONTENT_LENGTH
+    'MAX_UPLOAD_SIZE': 1024 * 1024 * 1024,  # 1 GB
+    'UPLOAD_CHUNK_SIZE': 8 * 1024 * 1024,  # 8 MB
+    'UPLOAD_SESSION_TTL': 24 * 60 * 60,  # 秒
+    # 去重文件存储的垃圾回收：引用计数归零的内容保留 BLOB_GC_GRACE 秒后删除
+    'BLOB_GC_ENABLED': True,
+    'BLOB_GC_INTERVAL': 60 * 60,  # 秒
+    'BLOB_GC_GRACE': 60 * 60,  # 秒
+    # 上传文件的发送方式（见 media.py）：None 由Python发送；'x-sendfile' 或 'x-accel-redirect' 交给前置代理发送
+    'MEDIA_SENDFILE': None,
+    'MEDIA_ACCEL_PREFIX': '/_protected_uploads/',  # x-accel-redirect 模式下nginx中指向 UPLOAD_FOLDER 的internal location
+    # 图片缩略图/预览图（见 thumbnails.py，需要安装Pillow）
+    'THUMBNAIL_WORKERS': 2,
+    'THUMBNAIL_QUEUE_SIZE': 256,
+    'THUMBNAIL_WAIT_TIMEOUT': 10,  # 按需生成时请求最多等待的秒数（含排队），超时返回原图
+    'THUMBNAIL_FAILURE_TTL': 300,  # 生成失败的派生图在这段时间（秒）内直接返回原图，不再重试
+    # 不分页的全量列表以流式JSON返回，逐批从游标读取并序列化，内存占用与数据量无关
+    'STREAM_LIST_RESPONSES': True,
+    # 列表查询缓存配置（见 cache.py）
+    # 进程内缓存命中后仍会按数据版本核对（见 serve_list）；多进程部署时可将 LIST_CACHE_BACKEND 设为 'redis'
+    # 并配置 LIST_CACHE_REDIS_URL，使各进程共享缓存，命中时不访问数据库
+    'LIST_CACHE_ENABLED': True,
+    'LIST_CACHE_BACKEND': 'memory',
+    'LIST_CACHE_REDIS_URL': None,  # 例如 'redis://localhost:6379/0'，需要安装redis包
+    'LIST_CACHE_MAX_ENTRIES': 2048,
+    'LIST_CACHE_TTL': 30,  # 秒
+    'LIST_CACHE_MAX_ENTRY_BYTES': 512 * 1024,  # 超过该大小的响应不缓存
+    # 密码哈希（见 auth.py）：scrypt:N:r:p，N越大越慢；每次计算约占用 128*N*r 字节内存。
+    # 哈希在 PASSWORD_HASH_WORKERS 个后台线程中计算，排队超过 PASSWORD_HASH_QUEUE_SIZE 时返回503
+    'PASSWORD_HASH_METHOD': 'scrypt:32768:8:1',
+    'PASSWORD_HASH_WORKERS': 2,
+    'PASSWORD_HASH_QUEUE_SIZE': 32,
+    'PASSWORD_HASH_TIMEOUT': 10,  # 秒
+    # 登录/注册限流：每个邮箱和每个客户端IP各一个令牌桶，每分钟补充 LOGIN_RATE_PER_MINUTE 个令牌
+    'LOGIN_RATE_LIMIT_ENABLED': True,
+    'LOGIN_RATE_PER_MINUTE': 10,
+    'LOGIN_RATE_BURST': 5,
+    'LOGIN_RATE_MAX_KEYS': 100000,
+    # 前面反向代理的层数：大于0时按 X-Forwarded-For 取真实客户端IP（werkzeug ProxyFix），
+    # 否则限流看到的都是代理的地址；未经代理直接对外时必须保持为0，以免客户端伪造该请求头
+    'PROXY_FIX_X_FOR': 0,
+    # 访问令牌（见 tokens.py）：TOKEN_SECRET 为空时使用数据库旁自动生成的 <DATABASE>.token_secret 文件。
+    # AUTH_REQUIRE_TOKEN 为False时，未携带令牌的旧客户端仍可通过 user_id 参数访问；所有客户端升级后应改为True
+    'AUTH_REQUIRE_TOKEN': False,
+    'TOKEN_SECRET': None,
+    'ACCESS_TOKEN_TTL': 15 * 60,  # 秒
+    'REFRESH_TOKEN_TTL': 30 * 24 * 60 * 60,  # 秒
+    'TOKEN_REVOCATION_CACHE_SIZE': 10000,
+    'TOKEN_REVOCATION_SYNC_INTERVAL': 1.0,  # 秒，其他工作进程的退出登录最多延迟这么久生效
+    # 管理界面用户目录缓存（见 admin.py）：用户列表页、用户信息和各用户数据总数
+    'ADMIN_DIRECTORY_CACHE_TTL': 10,  # 秒
+    'ADMIN_DIRECTORY_CACHE_MAX_ENTRIES': 1024,
+    # 请求与SQL指标（见 metrics.py），GET /metrics 以Prometheus文本格式输出
+    'METRICS_ENABLED': True,
+    'METRICS_MAX_SQL_SHAPES': 500,
+    # 结构化日志（见 logs.py）：LOG_FORMAT 为 'json' 或 'text'；DEBUG/INFO 日志按 LOG_SAMPLE_RATE 采样。
+    # 每个请求结束时记录一条DEBUG日志，耗时超过 SLOW_REQUEST_THRESHOLD 秒的请求记录为WARNING
+    'LOG_LEVEL': 'INFO',
+    'LOG_FORMAT': 'json',
+    'LOG_SAMPLE_RATE': 1.0,
+    'SLOW_REQUEST_THRESHOLD': 1.0,  # 秒
+    # 合并写入（见 writequeue.py）：单条写接口交给每个进程唯一的写线程，WRITE_BATCH_LINGER_MS 毫秒内
+    # 到达的写入（最多 WRITE_BATCH_MAX_SIZE 个）合并为一个事务提交；队列超过 WRITE_QUEUE_SIZE 时返回503
+    'WRITE_COALESCING_ENABLED': False,
+    'WRITE_BATCH_MAX_SIZE': 64,
+    'WRITE_BATCH_LINGER_MS': 2,
+    'WRITE_QUEUE_SIZE': 1024,
+}
+
+logger = get_logger('app')
+
+
+def create_app(config=None):
+    """
+    创建并配置Flask应用
+
+    配置优先级：参数 config > MOMENTKEEP_ 环境变量 > DEFAULT_CONFIG。
+    这里不会创建或升级表结构，部署时由 init_db() 在启动前执行一次
+    （gunicorn.conf.py 在主进程中完成，开发服务器在 __main__ 中完成）
+    """
+    app = Flask(__name__)
+    app.config.update(DEFAULT_CONFIG)
+    app.config.from_prefixed_env('MOMENTKEEP')
+    if config:
+        app.config.update(config)
+
+    if app.config['PROXY_FIX_X_FOR']:
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_X_FOR'])
+
+    CORS(app, expose_headers=['ETag'])  # 允许跨域请求，并允许客户端读取ETag
+    install_json_provider(app)  # 安装了orjson时使用orjson编码响应
+
+    configure_logging(app.config['LOG_LEVEL'], app.config['LOG_FORMAT'], app.config['LOG_SAMPLE_RATE'])
+    if app.config['METRICS_ENABLED']:
+        app.extensions['metrics'] = Metrics(app.config['METRICS_MAX_SQL_SHAPES'])
+    
+    # 数据库连接池（按线程复用连接，启用WAL模式）；连接在首次请求时才创建，
+    # 因此在gunicorn主进程中创建应用后再fork出工作进程是安全的
+    metrics = app.extensions.get('metrics')
+    configure_pool(app.config['DATABASE'], sql_metrics=metrics.sql if metrics else None)
+    configure_list_cache(app.config)
+
+    # 上传目录在启动时转换为绝对路径，文件服务接口不必每次请求都重新计算
+    app.config['UPLOAD_FOLDER'] = os.path.abspath(app.config['UPLOAD_FOLDER'])
+    app.config['USE_X_SENDFILE'] = app.config['MEDIA_SENDFILE'] == 'x-sendfile'
+    
+    # 确保上传文件夹存在
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    # 每个工作进程各启动一个后台线程回收不再被引用的文件内容
+    if app.config['BLOB_GC_ENABLED']:
+        app.extensions['blob_collector'] = BlobCollector(
+            get_db_connection, app.config['UPLOAD_FOLDER'],
+            interval=app.config['BLOB_GC_INTERVAL'], grace=app.config['BLOB_GC_GRACE']
+        ).start()
+
+    # 后台生成图片派生图的线程池（未安装Pillow时不启动线程）
+    app.extensions['thumbnails'] = ThumbnailPool(
+        workers=app.config['THUMBNAIL_WORKERS'], queue_size=app.config['THUMBNAIL_QUEUE_SIZE'],
+        failure_ttl=app.config['THUMBNAIL_FAILURE_TTL']
+    ).start()
+
+    # 密码哈希线程池和登录限流器（每个工作进程各一份）
+    app.extensions['password_hasher'] = PasswordHasher(
+        method=app.config['PASSWORD_HASH_METHOD'], workers=app.config['PASSWORD_HASH_WORKERS'],
+        queue_size=app.config['PASSWORD_HASH_QUEUE_SIZE'], timeout=app.config['PASSWORD_HASH_TIMEOUT']
+    ).start()
+    app.extensions['login_limiter'] = TokenBucketLimiter(
+        rate_per_minute=app.config['LOGIN_RATE_PER_MINUTE'], burst=app.config['LOGIN_RATE_BURST'],
+        max_keys=app.config['LOGIN_RATE_MAX_KEYS'], enabled=app.config['LOGIN_RATE_LIMIT_ENABLED']
+    )
+
+    app.extensions['token_signer'] = TokenSigner(
+        load_secret(app.config['TOKEN_SECRET'], app.config['DATABASE']),
+        access_ttl=app.config['ACCESS_TOKEN_TTL'], refresh_ttl=app.config['REFRESH_TOKEN_TTL'],
+        revocations=RevocationCache(app.config['TOKEN_REVOCATION_CACHE_SIZE'], connect=get_db_connection,
+                                    sync_interval=app.config['TOKEN_REVOCATION_SYNC_INTERVAL'])
+    )
+
+    app.extensions['user_directory'] = UserDirectory(
+        max_entries=app.config['ADMIN_DIRECTORY_CACHE_MAX_ENTRIES'], ttl=app.config['ADMIN_DIRECTORY_CACHE_TTL']
+    )
+
+    if app.config['WRITE_COALESCING_ENABLED']:
+        app.extensions['write_queue'] = GroupCommitWriter(
+            get_db_connection, max_batch=app.config['WRITE_BATCH_MAX_SIZE'],
+            linger=app.config['WRITE_BATCH_LINGER_MS'] / 1000.0, queue_size=app.config['WRITE_QUEUE_SIZE']
+        ).start()
+
+    app.register_blueprint(bp)
+    return app
 
 # 检查文件扩展名是否允许
 def allowed_file(filename):
@@ -33,113 +223,303 @@ def allowed_file(filename):
 
 # 初始化数据库
 
-def init_db():
+def init_db(database=DATABASE):
     """
-    初始化应用数据库，创建所有必要的表结构
+    初始化应用数据库，将表结构升级到最新版本
+    
+    每次部署只需在启动工作进程前执行一次；使用独立的连接，不占用连接池
     
-    创建以下表：
+    表结构和索引由 migrations.py 中的版本化迁移维护：
     - users: 存储用户账户信息
     - journals: 存储日记内容
     - categories: 存储日记分类
     - habits: 存储习惯追踪数据
     - todos: 存储待办事项
     
-    表结构包含必要的字段和外键约束，确保数据完整性
+    当前结构版本记录在 PRAGMA user_version 中，只会执行尚未应用的迁移
     """
-    conn = sqlite3.connect(DATABASE)
-    cursor = conn.cursor()
-    
-    # 创建用户表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id TEXT PRIMARY KEY,
-            username TEXT UNIQUE NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            last_login_at TEXT
-        )
-    ''')
-    
-    # 创建日记表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS journals (
-            id TEXT PRIMARY KEY,
-            category_id TEXT NOT NULL,
-            title TEXT NOT NULL,
-            content TEXT NOT NULL,
-            tags TEXT NOT NULL,
-            date TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            user_id TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # 创建分类表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS categories (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            type TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            user_id TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # 创建习惯表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS habits (
-            id TEXT PRIMARY KEY,
-            name TEXT NOT NULL,
-            description TEXT,
-            frequency TEXT NOT NULL,
-            target TEXT NOT NULL,
-            start_date TEXT NOT NULL,
-            end_date TEXT,
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            user_id TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    # 创建待办事项表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS todos (
-            id TEXT PRIMARY KEY,
-            title TEXT NOT NULL,
-            description TEXT,
-            is_completed INTEGER NOT NULL DEFAULT 0,
-            due_date TEXT,
-            priority TEXT NOT NULL DEFAULT 'medium',
-            created_at TEXT NOT NULL,
-            updated_at TEXT NOT NULL,
-            user_id TEXT NOT NULL,
-            FOREIGN KEY (user_id) REFERENCES users (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
+    conn = sqlite3.connect(database)
+    conn.row_factory = sqlite3.Row
+    try:
+        run_migrations(conn)
+        prune_tombstones(conn)
+    finally:
+        conn.close()
 
 # 获取当前时间的ISO格式字符串
 def get_current_time():
     return datetime.datetime.now().isoformat()
 
 # 数据库连接辅助函数
+# 从连接池借出连接，调用conn.close()时连接会归还给连接池而不是真正关闭
 def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
-    return conn
+    return get_pool().acquire()
+
+# 执行单条写接口的写操作：func(cursor, *args) 执行本次请求的全部写语句，返回其返回值。
+# 启用合并写入时交给写线程，与同时到达的其他写入在同一个事务中提交；否则借出连接单独提交
+def run_write(func, *args):
+    writer = current_app.extensions.get('write_queue')
+    if writer is not None:
+        return writer.run(func, *args)
+    conn = get_db_connection()
+    try:
+        result = func(conn.cursor(), *args)
+        conn.commit()
+        return result
+    finally:
+        conn.close()
+
+# 请求指标和请求日志
+@bp.before_app_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics = current_app.extensions.get('metrics')
+    if metrics:
+        metrics.sql.begin_request()
+
+@bp.after_app_request
+def record_request(response):
+    started = g.pop('request_started', None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else '<unmatched>'
+    metrics = current_app.extensions.get('metrics')
+    sql_count, sql_seconds = metrics.sql.request_totals() if metrics else (0, 0.0)
+    if metrics:
+        metrics.requests.observe(route, request.method, response.status_code, elapsed,
+                                 request.content_length or 0, response.content_length)
+    
+    level = logging.WARNING if elapsed >= current_app.config['SLOW_REQUEST_THRESHOLD'] else logging.DEBUG
+    log_event(logger, level, 'request', method=request.method, route=route, status=response.status_code,
+              duration_ms=round(elapsed * 1000, 2), sql_count=sql_count, sql_ms=round(sql_seconds * 1000, 2))
+    return response
+
+# 各列表接口分页使用的排序键：(列名, 是否降序, 是否可为NULL)，最后一列为唯一的id
+JOURNAL_KEYSET = Keyset(('date', True, False), ('id', True, False))
+CATEGORY_KEYSET = Keyset(('name', False, False), ('id', False, False))
+HABIT_KEYSET = Keyset(('name', False, False), ('id', False, False))
+TODO_KEYSET = Keyset(('is_completed', False, False), ('due_date', False, True), ('id', False, False))
+
+# 以流式JSON数组返回查询结果
+# 每次从游标读取 STREAM_FETCH_SIZE 行并立即序列化输出，不在内存中构造完整列表；
+# 连接在响应关闭（发送完毕或客户端断开）时才归还连接池。
+# 提供 on_body 时，响应体不超过 capture_limit 字节才会在发送完毕后以完整字节串回调（用于写入缓存）
+def stream_json_array(conn, cursor, serialize, on_body=None, capture_limit=0):
+    # 生成器在请求上下文结束后才被迭代，需要提前取出编码函数
+    dumps = current_app.json.dumps_bytes
+    
+    def generate():
+        captured = [b'['] if on_body else None
+        captured_size = 1
+        yield b'['
+        first = True
+        while True:
+            rows = cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            chunk = b','.join([dumps(serialize(row)) for row in rows])
+            if not first:
+                chunk = b',' + chunk
+            if captured is not None:
+                captured_size += len(chunk)
+                if captured_size > capture_limit:
+                    captured = None
+                else:
+                    captured.append(chunk)
+            yield chunk
+            first = False
+        yield b']'
+        if captured is not None:
+            captured.append(b']')
+            on_body(b''.join(captured))
+    
+    response = Response(generate(), mimetype='application/json')
+    response.call_on_close(conn.close)
+    return response
+
+# 执行列表查询并构造响应
+# 客户端传入 limit 或 cursor 时按排序键分页，只读取一页数据并返回 {items, next_cursor}；
+# 否则沿用原来的全量查询，旧客户端仍收到数组。
+# on_body 在响应体生成完毕后以完整字节串回调，流式响应超过缓存上限时不回调
+def list_response(conn, sql, params, legacy_order_by, keyset, page, serialize, on_body=None):
+    cursor = conn.cursor()
+    
+    if page is None:
+        if legacy_order_by:
+            sql += f' ORDER BY {legacy_order_by}'
+        cursor.execute(sql, params)
+        if current_app.config['STREAM_LIST_RESPONSES']:
+            return stream_json_array(conn, cursor, serialize, on_body, get_list_cache().max_entry_bytes)
+        rows = cursor.fetchall()
+        conn.close()
+        response = jsonify([serialize(row) for row in rows])
+    else:
+        limit, after = page
+        rows, next_cursor = fetch_page(cursor, sql, params, keyset, limit, after)
+        conn.close()
+        response = jsonify({'items': [serialize(row) for row in rows], 'next_cursor': next_cursor})
+    
+    if on_body:
+        on_body(response.get_data())
+    return response
+
+# 列表缓存键中的查询参数部分（user_id 已单独作为键的一部分）
+def list_cache_variant():
+    return '&'.join(f'{key}={value}' for key, value in sorted(request.args.items(multi=True)) if key != 'user_id')
+
+# 返回缓存的列表响应体（或304）
+def cached_list_response(cached):
+    etag, body = cached
+    return not_modified(etag) or with_etag(Response(body, mimetype='application/json'), etag)
+
+# 列表接口的统一处理：缓存 -> 条件请求 -> 查询数据库
+# 共享缓存（redis）命中时不访问数据库；进程内缓存可能已被其他工作进程的写入过期，
+# 命中后先用索引查找计算当前ETag，一致时才返回缓存的响应体，不执行列表查询
+def serve_list(table, user_id, sql, params, legacy_order_by, keyset, page, serialize):
+    cache = get_list_cache()
+    variant = list_cache_variant()
+    cached, epoch = cache.lookup(user_id, table, variant)
+    if cached is not None and cache.shared:
+        return cached_list_response(cached)
+    
+    conn = get_db_connection()
+    etag = list_etag(conn.cursor(), table, user_id)
+    if cached is not None and cache.is_current(cached, etag):
+        conn.close()
+        return cached_list_response(cached)
+    cached = not_modified(etag)
+    if cached:
+        conn.close()
+        return cached
+    
+    def store(body):
+        cache.store(user_id, table, variant, etag, body, epoch)
+    
+    response = list_response(conn, sql, params, legacy_order_by, keyset, page, serialize, store)
+    return with_etag(response, etag)
+
+# 条件请求（ETag / If-None-Match）
+# ETag取自数据的同步序号（见 sync.table_version / sync.row_version），只需索引查找；
+# 版本号在读取数据之前获取，即使期间有并发写入，ETag也只会偏旧而不会返回错误的304
+
+# 列表的弱ETag：资源版本号 + 查询参数摘要（分页、过滤条件不同的请求内容不同）
+def list_etag(cursor, table, user_id):
+    version = table_version(cursor, table, user_id)
+    variant = zlib.crc32(request.query_string)
+    return f'{table}-{version}-{variant:08x}'
+
+# 单条记录的弱ETag，记录不存在或不属于当前用户时返回None。
+# 所有者在比较 If-None-Match 之前检查，其他用户无法通过304得知记录是否存在及其版本
+def item_etag(cursor, table, record_id, user_id):
+    version = row_version(cursor, table, record_id)
+    if version is None or not owns(version[1], user_id):
+        return None
+    return f'{table}-{version[0]}'
+
+# 为响应设置弱ETag，并要求客户端每次使用前重新验证
+def with_etag(response, etag):
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# 客户端缓存的版本仍然有效时返回304响应，否则返回None
+def not_modified(etag):
+    if etag is None or not request.if_none_match.contains_weak(etag):
+        return None
+    return with_etag(Response(status=304), etag)
+
+# 更新/删除请求 If-Match 中的记录版本（item_etag 中的同步序号），未提供或为 * 时返回None。
+# 只支持一个ETag；多个ETag或不是该表单条记录ETag的值不会与任何版本一致（-1），写入时返回412
+def if_match_version(table):
+    if_match = request.if_match
+    if not if_match or if_match.star_tag:
+        return None
+    etags = if_match.as_set(include_weak=True)
+    if len(etags) != 1:
+        return -1
+    prefix, _, version = etags.pop().rpartition('-')
+    if prefix != table or not version.isdigit():
+        return -1
+    return int(version)
+
+# 请求认证
+# 携带 Authorization: Bearer <访问令牌> 时，当前用户取自令牌，只校验签名和有效期，不查询数据库；
+# 未携带令牌且 AUTH_REQUIRE_TOKEN 为False时，沿用旧客户端传入的 user_id（查询参数、JSON请求体或表单）
+
+def legacy_user_id():
+    user_id = request.args.get('user_id')
+    if user_id is None and request.is_json:
+        data = request.get_json(silent=True)
+        if isinstance(data, dict):
+            user_id = data.get('user_id') or data.get('userId')
+    if user_id is None:
+        user_id = request.form.get('user_id')
+    return user_id
+
+# 路由装饰器：校验访问令牌，并以关键字参数 user_id 传入当前用户
+# 令牌中的用户与请求中显式传入的 user_id 不一致时返回403
+def authenticated(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        header = request.headers.get('Authorization', '')
+        if header.startswith('Bearer '):
+            try:
+                g.token = current_app.extensions['token_signer'].decode(header[7:].strip(), 'access')
+            except TokenError as e:
+                return jsonify({'error': str(e)}), 401
+            claimed = legacy_user_id()
+            if claimed is not None and claimed != g.token['sub']:
+                return jsonify({'error': 'user_id does not match access token'}), 403
+            return view(*args, user_id=g.token['sub'], **kwargs)
+        
+        if current_app.config['AUTH_REQUIRE_TOKEN']:
+            return jsonify({'error': 'Missing access token'}), 401
+        g.token = None
+        return view(*args, user_id=legacy_user_id(), **kwargs)
+    return wrapper
+
+# 使用令牌访问时只能读写自己的数据；旧客户端不做校验
+def owns(record_user_id, user_id):
+    return g.token is None or record_user_id == user_id
+
+# 使用令牌访问时作为写操作的数据所有者，旧客户端为None
+def token_owner(user_id):
+    return user_id if g.token is not None else None
 
 # 认证相关路由
 
-@app.route('/api/auth/register', methods=['POST'])
+# 登录/注册前先按邮箱和客户端IP限流，超过频率时返回429，不会占用哈希线程池
+def rate_limited(email=None):
+    keys = [f'ip:{request.remote_addr}']
+    if email:
+        keys.append(f'email:{str(email).strip().lower()}')
+    allowed, retry_after = current_app.extensions['login_limiter'].acquire(*keys)
+    if allowed:
+        return None
+    response = jsonify({'error': 'Too many attempts, please retry later'})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(int(retry_after + 0.999), 1))
+    return response
+
+# 哈希线程池或写入队列已满时返回503，客户端稍后重试
+def server_busy():
+    response = jsonify({'error': 'Server busy, please retry later'})
+    response.status_code = 503
+    response.headers['Retry-After'] = '1'
+    return response
+
+@bp.errorhandler(WriterSaturated)
+def write_queue_full(e):
+    return server_busy()
+
+# If-Match 中的版本与记录当前版本不一致：记录已被其他请求修改，客户端应重新读取后再提交
+@bp.errorhandler(PreconditionFailed)
+def precondition_failed(e):
+    return jsonify({'error': 'Record has been modified'}), 412
+
+@bp.route('/api/auth/register', methods=['POST'])
 def register():
     data = request.get_json()
     
@@ -147,31 +527,50 @@ def register():
     if not data or not 'username' in data or not 'email' in data or not 'password' in data:
         return jsonify({'error': 'Missing required fields'}), 400
     
+    limited = rate_limited()
+    if limited:
+        return limited
+    
     # 检查用户是否已存在
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE username = ? OR email = ?', (data['username'], data['email']))
+    cursor.execute('SELECT id FROM users WHERE username = ? OR email = ?', (data['username'], data['email']))
     existing_user = cursor.fetchone()
     
     if existing_user:
         conn.close()
         return jsonify({'error': 'Username or email already exists'}), 400
     
+    # 在哈希线程池中计算密码哈希，计算期间不占用数据库连接
+    conn.close()
+    try:
+        password_hash = current_app.extensions['password_hasher'].hash(str(data['password']))
+    except PoolSaturated:
+        return server_busy()
+    
     # 创建新用户
     user_id = str(uuid.uuid4())
     now = get_current_time()
     
-    cursor.execute('''
-        INSERT INTO users (id, username, email, password, created_at, updated_at, last_login_at)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, data['username'], data['email'], data['password'], now, now, now))
-    
-    conn.commit()
-    conn.close()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('''
+            INSERT INTO users (id, username, email, password, created_at, updated_at, last_login_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, data['username'], data['email'], password_hash, now, now, now))
+        conn.commit()
+    except sqlite3.IntegrityError:
+        # 计算哈希期间其他请求注册了相同的用户名或邮箱
+        conn.rollback()
+        return jsonify({'error': 'Username or email already exists'}), 400
+    finally:
+        conn.close()
     
+    current_app.extensions['user_directory'].invalidate_users()
     return jsonify({'message': 'User registered successfully'}), 201
 
-@app.route('/api/auth/login', methods=['POST'])
+@bp.route('/api/auth/login', methods=['POST'])
 def login():
     data = request.get_json()
     
@@ -179,726 +578,931 @@ def login():
     if not data or not 'email' in data or not 'password' in data:
         return jsonify({'error': 'Missing required fields'}), 400
     
+    limited = rate_limited(data['email'])
+    if limited:
+        return limited
+    
     # 检查用户是否存在
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users WHERE email = ? AND password = ?', (data['email'], data['password']))
+    cursor.execute('SELECT * FROM users WHERE email = ?', (data['email'],))
     user = cursor.fetchone()
+    conn.close()
     
-    if not user:
-        conn.close()
+    # 在哈希线程池中校验密码；用户不存在时同样完成一次校验，响应时间不泄露邮箱是否已注册
+    hasher = current_app.extensions['password_hasher']
+    try:
+        if user:
+            valid = hasher.verify(user['password'], str(data['password']))
+        else:
+            valid = hasher.verify_missing_user(str(data['password']))
+        # 旧版明文密码或哈希参数已调整的用户，登录成功时升级为当前参数的哈希
+        new_hash = hasher.hash(str(data['password'])) if valid and needs_rehash(user['password'], hasher.method) else None
+    except PoolSaturated:
+        return server_busy()
+    
+    if not valid:
         return jsonify({'error': 'Invalid email or password'}), 401
     
     # 更新最后登录时间
     now = get_current_time()
-    cursor.execute('''
-        UPDATE users SET last_login_at = ?, updated_at = ?
-        WHERE id = ?
-    ''', (now, now, user['id']))
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    if new_hash:
+        cursor.execute('''
+            UPDATE users SET last_login_at = ?, updated_at = ?, password = ?
+            WHERE id = ? AND password = ?
+        ''', (now, now, new_hash, user['id'], user['password']))
+    else:
+        cursor.execute('''
+            UPDATE users SET last_login_at = ?, updated_at = ?
+            WHERE id = ?
+        ''', (now, now, user['id']))
+    # 签发访问令牌和刷新令牌，刷新令牌的轮换状态与登录时间在同一事务中写入
+    tokens, refresh = current_app.extensions['token_signer'].issue(user['id'])
+    store_refresh_token(cursor, refresh)
     conn.commit()
     conn.close()
     
-    # 返回用户信息（实际应用中应返回JWT token）
+    # 返回用户信息和令牌
     return jsonify({
         'id': user['id'],
         'username': user['username'],
         'email': user['email'],
         'last_login_at': now,
         'created_at': user['created_at'],
-        'updated_at': now
+        'updated_at': now,
+        **tokens
     }), 200
 
+# 使用刷新令牌换取新的一对令牌，旧的刷新令牌随即作废
+@bp.route('/api/auth/refresh', methods=['POST'])
+def refresh_tokens():
+    data = request.get_json(silent=True)
+    
+    if not data or not data.get('refresh_token'):
+        return jsonify({'error': 'Missing refresh_token'}), 400
+    
+    conn = get_db_connection()
+    try:
+        tokens = rotate_refresh_token(conn, current_app.extensions['token_signer'], data['refresh_token'])
+    except TokenError as e:
+        return jsonify({'error': str(e)}), 401
+    finally:
+        conn.close()
+    
+    return jsonify(tokens), 200
+
+# 退出登录：吊销当前访问令牌，并作废请求体中刷新令牌所在的整个家族
+@bp.route('/api/auth/logout', methods=['POST'])
+@authenticated
+def logout(user_id):
+    signer = current_app.extensions['token_signer']
+    if g.token is not None:
+        signer.revocations.revoke(g.token['jti'], g.token['exp'])
+    
+    data = request.get_json(silent=True) or {}
+    if data.get('refresh_token'):
+        conn = get_db_connection()
+        try:
+            revoke_refresh_family(conn, signer, data['refresh_token'])
+        finally:
+            conn.close()
+    
+    return jsonify({'message': 'Logged out'}), 200
+
 # 日记相关路由
 
-@app.route('/api/journals', methods=['GET'])
-def get_journals():
-    user_id = request.args.get('user_id')
+@bp.route('/api/journals', methods=['GET'])
+@authenticated
+def get_journals(user_id):
+    tag = request.args.get('tag')
     
     if not user_id:
         return jsonify({'error': 'Missing user_id parameter'}), 400
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM journals WHERE user_id = ? ORDER BY date DESC', (user_id,))
-    journals = cursor.fetchall()
-    conn.close()
+    try:
+        page = parse_page_args(request.args, JOURNAL_KEYSET)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    result = []
-    for journal in journals:
-        result.append({
-            'id': journal['id'],
-            'category_id': journal['category_id'],
-            'title': journal['title'],
-            'content': journal['content'],  # 直接返回加密后的内容，不要进行JSON解析
-            'tags': json.loads(journal['tags']),
-            'date': journal['date'],
-            'created_at': journal['created_at'],
-            'updated_at': journal['updated_at'],
-            'user_id': journal['user_id']
-        })
+    query = f'SELECT {JOURNAL_MAPPER.columns} FROM journals WHERE user_id = ?'
+    params = [user_id]
     
-    return jsonify(result), 200
+    # 按标签过滤时从标签索引中取出日记id，不需要解析每篇日记的tags
+    if tag:
+        query += ' AND id IN (SELECT journal_id FROM journal_tags WHERE user_id = ? AND tag = ?)'
+        params += [user_id, tag]
+    
+    return serve_list('journals', user_id, query, params, 'date DESC', JOURNAL_KEYSET, page, JOURNAL_MAPPER)
 
-@app.route('/api/journals', methods=['POST'])
-def create_journal():
+@bp.route('/api/journals', methods=['POST'])
+@authenticated
+def create_journal(user_id):
     data = request.get_json()
     
-    # 添加日志，查看请求内容
-    print(f"[DEBUG] Received journal creation request: {data}")
-    
     # 转换驼峰命名为下划线命名，兼容客户端请求
-    formatted_data = {}
-    for key, value in data.items():
-        # 将驼峰命名转换为下划线命名
-        formatted_key = re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', key).lower()
-        formatted_data[formatted_key] = value
+    formatted_data = to_snake_case_keys(data) if data else {}
+    if user_id is not None:
+        formatted_data['user_id'] = user_id
     
-    # 如果客户端没有提供user_id，检查是否有userId字段
-    if 'user_id' not in formatted_data and 'userid' in formatted_data:
-        formatted_data['user_id'] = formatted_data['userid']
+    # 只记录字段名，不记录日记内容
+    log_event(logger, logging.DEBUG, 'journal_create', fields=sorted(formatted_data))
     
-    print(f"[DEBUG] Formatted request data: {formatted_data}")
-    print(f"[DEBUG] Required fields check: category_id={ 'category_id' in formatted_data }, title={ 'title' in formatted_data }, content={ 'content' in formatted_data }, user_id={ 'user_id' in formatted_data }")
-    
-    # 允许category_id为空字符串
-    if not data or not 'title' in formatted_data or not 'content' in formatted_data or not 'user_id' in formatted_data:
+    now = get_current_time()
+    try:
+        journal_id, values = prepare_insert('journals', formatted_data, now)
+    except ValueError:
+        log_event(logger, logging.INFO, 'journal_create_invalid', fields=sorted(formatted_data))
         return jsonify({'error': 'Missing required fields', 'received': data, 'formatted': formatted_data}), 400
     
+    run_write(insert_record, 'journals', values)
+    get_list_cache().invalidate(formatted_data['user_id'], 'journals')
+    
+    return jsonify({'id': journal_id, 'message': 'Journal created successfully'}), 201
+
+# 日记全文检索：GET /api/journals/search?user_id=&q=&limit=&cursor=
+# 返回 {items, next_cursor}，items 中每篇日记附带命中位置的摘要 snippet（命中词以<mark>标记）
+@bp.route('/api/journals/search', methods=['GET'])
+@authenticated
+def search_journals_route(user_id):
+    if not user_id:
+        return jsonify({'error': 'Missing user_id parameter'}), 400
+    
+    try:
+        terms, limit, offset = parse_search_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     conn = get_db_connection()
-    cursor = conn.cursor()
+    try:
+        results, next_cursor = search_journals(conn.cursor(), user_id, terms, limit, offset)
+    finally:
+        conn.close()
     
-    journal_id = str(uuid.uuid4())
-    now = get_current_time()
+    items = []
+    for row, snippet in results:
+        item = JOURNAL_MAPPER(row)
+        item['snippet'] = snippet
+        items.append(item)
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+# 标签统计：GET /api/tags?user_id= 返回 [{tag, count}]，按标签名排序
+# 直接在标签索引上分组计数；结果只随日记变化，因此与日记列表共用缓存失效和ETag版本
+@bp.route('/api/tags', methods=['GET'])
+@authenticated
+def get_tags(user_id):
+    if not user_id:
+        return jsonify({'error': 'Missing user_id parameter'}), 400
     
-    cursor.execute('''
-        INSERT INTO journals (id, category_id, title, content, tags, date, created_at, updated_at, user_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        journal_id,
-        formatted_data.get('category_id', ''),
-        formatted_data['title'],
-        formatted_data['content'],  # 已经是字符串格式，不需要再次json.dumps
-        json.dumps(formatted_data.get('tags', [])),
-        formatted_data.get('date', now),
-        formatted_data.get('created_at', now),
-        formatted_data.get('updated_at', now),
-        formatted_data['user_id']
-    ))
+    cache = get_list_cache()
+    variant = 'tags?' + list_cache_variant()
+    cached, epoch = cache.lookup(user_id, 'journals', variant)
+    if cached is not None and cache.shared:
+        return cached_list_response(cached)
     
-    conn.commit()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    etag = 'tags-' + list_etag(cursor, 'journals', user_id)
+    if cached is not None and cache.is_current(cached, etag):
+        conn.close()
+        return cached_list_response(cached)
+    cached = not_modified(etag)
+    if cached:
+        conn.close()
+        return cached
+    
+    cursor.execute('SELECT tag, COUNT(*) FROM journal_tags WHERE user_id = ? GROUP BY tag ORDER BY tag', (user_id,))
+    rows = cursor.fetchall()
     conn.close()
     
-    return jsonify({'id': journal_id, 'message': 'Journal created successfully'}), 201
+    response = jsonify([{'tag': tag, 'count': count} for tag, count in rows])
+    cache.store(user_id, 'journals', variant, etag, response.get_data(), epoch)
+    return with_etag(response, etag)
 
-@app.route('/api/journals/<journal_id>', methods=['GET'])
-def get_journal(journal_id):
+@bp.route('/api/journals/<journal_id>', methods=['GET'])
+@authenticated
+def get_journal(journal_id, user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM journals WHERE id = ?', (journal_id,))
+    etag = item_etag(cursor, 'journals', journal_id, user_id)
+    if etag is None:
+        conn.close()
+        return jsonify({'error': 'Journal not found'}), 404
+    cached = not_modified(etag)
+    if cached:
+        conn.close()
+        return cached
+    
+    cursor.execute(f'SELECT {JOURNAL_MAPPER.columns} FROM journals WHERE id = ?', (journal_id,))
     journal = cursor.fetchone()
     conn.close()
     
-    if not journal:
+    if not journal or not owns(journal['user_id'], user_id):
         return jsonify({'error': 'Journal not found'}), 404
     
-    return jsonify({
-        'id': journal['id'],
-        'category_id': journal['category_id'],
-        'title': journal['title'],
-        'content': journal['content'],  # 直接返回加密后的内容，不要进行JSON解析
-        'tags': json.loads(journal['tags']),
-        'date': journal['date'],
-        'created_at': journal['created_at'],
-        'updated_at': journal['updated_at'],
-        'user_id': journal['user_id']
-    }), 200
+    return with_etag(jsonify(JOURNAL_MAPPER(journal)), etag)
 
-@app.route('/api/journals/<journal_id>', methods=['PUT'])
-def update_journal(journal_id):
+@bp.route('/api/journals/<journal_id>', methods=['PUT'])
+@authenticated
+def update_journal(journal_id, user_id):
     data = request.get_json()
     
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM journals WHERE id = ?', (journal_id,))
-    journal = cursor.fetchone()
-    
-    if not journal:
-        conn.close()
-        return jsonify({'error': 'Journal not found'}), 404
-    
     # 更新日记
     now = get_current_time()
-    updates = []
-    update_values = []
-    
-    if 'category_id' in data:
-        updates.append('category_id = ?')
-        update_values.append(data['category_id'])
-    if 'title' in data:
-        updates.append('title = ?')
-        update_values.append(data['title'])
-    if 'content' in data:
-        updates.append('content = ?')
-        update_values.append(data['content'])  # 直接保存加密后的内容，不要进行JSON序列化
-    if 'tags' in data:
-        updates.append('tags = ?')
-        update_values.append(json.dumps(data['tags']))
-    if 'date' in data:
-        updates.append('date = ?')
-        update_values.append(data['date'])
-    
-    # 添加更新时间和ID
-    updates.append('updated_at = ?')
-    update_values.append(now)
-    update_values.append(journal_id)
-    
-    update_query = f"UPDATE journals SET {', '.join(updates)} WHERE id = ?"
-    cursor.execute(update_query, tuple(update_values))
+    columns, update_values = prepare_update('journals', data, now)
+    owner = run_write(update_record, 'journals', journal_id, columns, update_values, token_owner(user_id),
+                      if_match_version('journals'))
     
-    conn.commit()
-    conn.close()
+    if owner is None:
+        return jsonify({'error': 'Journal not found'}), 404
+    get_list_cache().invalidate(owner, 'journals')
     
     return jsonify({'message': 'Journal updated successfully'}), 200
 
-@app.route('/api/journals/<journal_id>', methods=['DELETE'])
-def delete_journal(journal_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM journals WHERE id = ?', (journal_id,))
-    journal = cursor.fetchone()
+@bp.route('/api/journals/<journal_id>', methods=['DELETE'])
+@authenticated
+def delete_journal(journal_id, user_id):
+    owner = run_write(delete_record, 'journals', journal_id, token_owner(user_id), if_match_version('journals'))
     
-    if not journal:
-        conn.close()
+    if owner is None:
         return jsonify({'error': 'Journal not found'}), 404
-    
-    cursor.execute('DELETE FROM journals WHERE id = ?', (journal_id,))
-    conn.commit()
-    conn.close()
+    get_list_cache().invalidate(owner, 'journals')
     
     return jsonify({'message': 'Journal deleted successfully'}), 200
 
 # 分类相关路由
 
-@app.route('/api/categories', methods=['GET'])
-def get_categories():
-    user_id = request.args.get('user_id')
+@bp.route('/api/categories', methods=['GET'])
+@authenticated
+def get_categories(user_id):
     type_filter = request.args.get('type')
     
     if not user_id:
         return jsonify({'error': 'Missing user_id parameter'}), 400
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    try:
+        page = parse_page_args(request.args, CATEGORY_KEYSET)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    query = 'SELECT * FROM categories WHERE user_id = ?'
+    query = f'SELECT {CATEGORY_MAPPER.columns} FROM categories WHERE user_id = ?'
     params = [user_id]
     
     if type_filter:
         query += ' AND type = ?'
         params.append(type_filter)
     
-    cursor.execute(query, params)
-    categories = cursor.fetchall()
-    conn.close()
-    
-    result = []
-    for category in categories:
-        result.append({
-            'id': category['id'],
-            'name': category['name'],
-            'type': category['type'],
-            'created_at': category['created_at'],
-            'updated_at': category['updated_at'],
-            'user_id': category['user_id']
-        })
-    
-    return jsonify(result), 200
+    return serve_list('categories', user_id, query, params, None, CATEGORY_KEYSET, page, CATEGORY_MAPPER)
 
-@app.route('/api/categories', methods=['POST'])
-def create_category():
+@bp.route('/api/categories', methods=['POST'])
+@authenticated
+def create_category(user_id):
     data = request.get_json()
     
+    if data and user_id is not None:
+        data['user_id'] = user_id
     if not data or not 'name' in data or not 'type' in data or not 'user_id' in data:
         return jsonify({'error': 'Missing required fields'}), 400
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     category_id = str(uuid.uuid4())
     now = get_current_time()
     
-    cursor.execute('''
-        INSERT INTO categories (id, name, type, created_at, updated_at, user_id)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (category_id, data['name'], data['type'], now, now, data['user_id']))
+    def insert(cursor):
+        cursor.execute('''
+            INSERT INTO categories (id, name, type, created_at, updated_at, user_id)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (category_id, data['name'], data['type'], now, now, data['user_id']))
     
-    conn.commit()
-    conn.close()
+    run_write(insert)
+    get_list_cache().invalidate(data['user_id'], 'categories')
     
     return jsonify({'id': category_id, 'message': 'Category created successfully'}), 201
 
 # 习惯相关路由
 
-@app.route('/api/habits', methods=['GET'])
-def get_habits():
-    user_id = request.args.get('user_id')
-    
+@bp.route('/api/habits', methods=['GET'])
+@authenticated
+def get_habits(user_id):
     if not user_id:
         return jsonify({'error': 'Missing user_id parameter'}), 400
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM habits WHERE user_id = ? ORDER BY name', (user_id,))
-    habits = cursor.fetchall()
-    conn.close()
+    try:
+        page = parse_page_args(request.args, HABIT_KEYSET)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    result = []
-    for habit in habits:
-        result.append({
-            'id': habit['id'],
-            'name': habit['name'],
-            'description': habit['description'],
-            'frequency': habit['frequency'],
-            'target': habit['target'],
-            'start_date': habit['start_date'],
-            'end_date': habit['end_date'],
-            'created_at': habit['created_at'],
-            'updated_at': habit['updated_at'],
-            'user_id': habit['user_id']
-        })
+    query = f'SELECT {HABIT_MAPPER.columns} FROM habits WHERE user_id = ?'
+    if 'stats' in request.args.get('include', '').split(','):
+        return habits_with_stats(user_id, query, page)
     
-    return jsonify(result), 200
+    return serve_list('habits', user_id, query, (user_id,), 'name', HABIT_KEYSET, page, HABIT_MAPPER)
 
-@app.route('/api/habits', methods=['POST'])
-def create_habit():
-    data = request.get_json()
-    
-    if not data or not 'name' in data or not 'frequency' in data or not 'target' in data or not 'start_date' in data or not 'user_id' in data:
-        return jsonify({'error': 'Missing required fields'}), 400
+# GET /api/habits?include=stats：每个习惯附带 stats（连续打卡、完成率，见 checkins.py），
+# 可选参数 window（完成率统计的天数，默认30）和 today（客户端本地日期 YYYY-MM-DD）。
+# 统计结果随日期变化，因此不经过列表缓存，也不返回ETag
+def habits_with_stats(user_id, query, page):
+    try:
+        today, window = parse_habit_stats_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
     conn = get_db_connection()
-    cursor = conn.cursor()
+    try:
+        cursor = conn.cursor()
+        if page is None:
+            cursor.execute(query + ' ORDER BY name', (user_id,))
+            rows, next_cursor = cursor.fetchall(), None
+        else:
+            limit, after = page
+            rows, next_cursor = fetch_page(cursor, query, (user_id,), HABIT_KEYSET, limit, after)
+        stats = stats_for_habits(conn, user_id,
+                                 [(row['id'], row['frequency'], row['target'], row['start_date']) for row in rows],
+                                 today, window)
+    finally:
+        conn.close()
+    
+    items = []
+    for row in rows:
+        item = HABIT_MAPPER(row)
+        item['stats'] = stats[row['id']]
+        items.append(item)
+    if page is None:
+        return jsonify(items)
+    return jsonify({'items': items, 'next_cursor': next_cursor})
+
+@bp.route('/api/habits', methods=['POST'])
+@authenticated
+def create_habit(user_id):
+    data = request.get_json()
+    if isinstance(data, dict) and user_id is not None:
+        data['user_id'] = user_id
     
-    habit_id = str(uuid.uuid4())
     now = get_current_time()
+    try:
+        habit_id, values = prepare_insert('habits', data, now)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    cursor.execute('''
-        INSERT INTO habits (id, name, description, frequency, target, start_date, end_date, created_at, updated_at, user_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        habit_id,
-        data['name'],
-        data.get('description', ''),
-        data['frequency'],
-        data['target'],
-        data['start_date'],
-        data.get('end_date'),
-        now,
-        now,
-        data['user_id']
-    ))
-    
-    conn.commit()
-    conn.close()
+    run_write(insert_record, 'habits', values)
+    get_list_cache().invalidate(data['user_id'], 'habits')
     
     return jsonify({'id': habit_id, 'message': 'Habit created successfully'}), 201
 
-@app.route('/api/habits/<habit_id>', methods=['GET'])
-def get_habit(habit_id):
+@bp.route('/api/habits/<habit_id>', methods=['GET'])
+@authenticated
+def get_habit(habit_id, user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM habits WHERE id = ?', (habit_id,))
+    etag = item_etag(cursor, 'habits', habit_id, user_id)
+    if etag is None:
+        conn.close()
+        return jsonify({'error': 'Habit not found'}), 404
+    cached = not_modified(etag)
+    if cached:
+        conn.close()
+        return cached
+    
+    cursor.execute(f'SELECT {HABIT_MAPPER.columns} FROM habits WHERE id = ?', (habit_id,))
     habit = cursor.fetchone()
     conn.close()
     
-    if not habit:
+    if not habit or not owns(habit['user_id'], user_id):
         return jsonify({'error': 'Habit not found'}), 404
     
-    return jsonify({
-        'id': habit['id'],
-        'name': habit['name'],
-        'description': habit['description'],
-        'frequency': habit['frequency'],
-        'target': habit['target'],
-        'start_date': habit['start_date'],
-        'end_date': habit['end_date'],
-        'created_at': habit['created_at'],
-        'updated_at': habit['updated_at'],
-        'user_id': habit['user_id']
-    }), 200
+    return with_etag(jsonify(HABIT_MAPPER(habit)), etag)
 
-@app.route('/api/habits/<habit_id>', methods=['PUT'])
-def update_habit(habit_id):
+@bp.route('/api/habits/<habit_id>', methods=['PUT'])
+@authenticated
+def update_habit(habit_id, user_id):
     data = request.get_json()
     
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM habits WHERE id = ?', (habit_id,))
-    habit = cursor.fetchone()
-    
-    if not habit:
-        conn.close()
-        return jsonify({'error': 'Habit not found'}), 404
-    
     # 更新习惯
     now = get_current_time()
-    updates = []
-    update_values = []
-    
-    if 'name' in data:
-        updates.append('name = ?')
-        update_values.append(data['name'])
-    if 'description' in data:
-        updates.append('description = ?')
-        update_values.append(data['description'])
-    if 'frequency' in data:
-        updates.append('frequency = ?')
-        update_values.append(data['frequency'])
-    if 'target' in data:
-        updates.append('target = ?')
-        update_values.append(data['target'])
-    if 'start_date' in data:
-        updates.append('start_date = ?')
-        update_values.append(data['start_date'])
-    if 'end_date' in data:
-        updates.append('end_date = ?')
-        update_values.append(data['end_date'])
-    
-    # 添加更新时间和ID
-    updates.append('updated_at = ?')
-    update_values.append(now)
-    update_values.append(habit_id)
-    
-    update_query = f"UPDATE habits SET {', '.join(updates)} WHERE id = ?"
-    cursor.execute(update_query, tuple(update_values))
+    columns, update_values = prepare_update('habits', data, now)
+    owner = run_write(update_record, 'habits', habit_id, columns, update_values, token_owner(user_id),
+                      if_match_version('habits'))
     
-    conn.commit()
-    conn.close()
+    if owner is None:
+        return jsonify({'error': 'Habit not found'}), 404
+    get_list_cache().invalidate(owner, 'habits')
     
     return jsonify({'message': 'Habit updated successfully'}), 200
 
-@app.route('/api/habits/<habit_id>', methods=['DELETE'])
-def delete_habit(habit_id):
+@bp.route('/api/habits/<habit_id>', methods=['DELETE'])
+@authenticated
+def delete_habit(habit_id, user_id):
+    owner = run_write(delete_record, 'habits', habit_id, token_owner(user_id), if_match_version('habits'))
+    
+    if owner is None:
+        return jsonify({'error': 'Habit not found'}), 404
+    get_list_cache().invalidate(owner, 'habits')
+    
+    return jsonify({'message': 'Habit deleted successfully'}), 200
+
+# 习惯打卡路由
+
+@bp.route('/api/habits/<habit_id>/checkins', methods=['GET'])
+@authenticated
+def get_habit_checkins(habit_id, user_id):
+    # 返回习惯在 [from, to]（YYYY-MM-DD，均可省略）内的打卡记录 [{date, count}]，按日期升序
+    try:
+        first_day = parse_date(request.args.get('from', '0000-01-01'))
+        last_day = parse_date(request.args.get('to', '9999-12-31'))
+    except ValueError:
+        return jsonify({'error': 'Invalid date range'}), 400
+    
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM habits WHERE id = ?', (habit_id,))
+    cursor.execute('SELECT user_id FROM habits WHERE id = ?', (habit_id,))
     habit = cursor.fetchone()
     
-    if not habit:
+    if not habit or not owns(habit['user_id'], user_id):
         conn.close()
         return jsonify({'error': 'Habit not found'}), 404
     
-    cursor.execute('DELETE FROM habits WHERE id = ?', (habit_id,))
-    conn.commit()
+    cursor.execute('SELECT date, count FROM habit_checkins WHERE habit_id = ? AND date BETWEEN ? AND ? ORDER BY date',
+                   (habit_id, first_day.isoformat(), last_day.isoformat()))
+    checkins = [{'date': day, 'count': count} for day, count in cursor.fetchall()]
     conn.close()
     
-    return jsonify({'message': 'Habit deleted successfully'}), 200
+    return jsonify(checkins), 200
 
-# 待办事项相关路由
+@bp.route('/api/checkins', methods=['POST', 'DELETE'])
+@authenticated
+def bulk_checkins(user_id):
+    """
+    批量打卡（POST）或取消打卡（DELETE）
 
-@app.route('/api/todos', methods=['GET'])
-def get_todos():
-    user_id = request.args.get('user_id')
+    请求体：{"checkins": [{"habit_id": "...", "date": "YYYY-MM-DD", "count": 1}, ...]}
     
-    if not user_id:
-        return jsonify({'error': 'Missing user_id parameter'}), 400
+    所有记录在一个事务中写入，同一习惯同一天再次打卡时覆盖当天的 count；
+    响应中的 results 按请求顺序给出每条记录的 status（201/200/400/404）
+    """
+    data = request.get_json(silent=True)
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM todos WHERE user_id = ? ORDER BY is_completed, due_date', (user_id,))
-    todos = cursor.fetchall()
-    conn.close()
+    if not data or not isinstance(data.get('checkins'), list):
+        return jsonify({'error': 'Missing checkins'}), 400
     
-    result = []
-    for todo in todos:
-        result.append({
-            'id': todo['id'],
-            'title': todo['title'],
-            'description': todo['description'],
-            'is_completed': bool(todo['is_completed']),
-            'due_date': todo['due_date'],
-            'priority': todo['priority'],
-            'created_at': todo['created_at'],
-            'updated_at': todo['updated_at'],
-            'user_id': todo['user_id']
-        })
+    checkins = data['checkins']
+    if len(checkins) > MAX_CHECKINS_PER_REQUEST:
+        return jsonify({'error': f'Too many checkins (max {MAX_CHECKINS_PER_REQUEST})'}), 400
     
-    return jsonify(result), 200
+    conn = get_db_connection()
+    try:
+        results, applied = apply_checkins(conn, checkins, get_current_time(), remove=request.method == 'DELETE',
+                                          owner=token_owner(user_id))
+    finally:
+        conn.close()
+    
+    return jsonify({'results': results, 'applied': applied}), 200
 
-@app.route('/api/todos', methods=['POST'])
-def create_todo():
-    data = request.get_json()
+# 待办事项相关路由
+
+@bp.route('/api/todos', methods=['GET'])
+@authenticated
+def get_todos(user_id):
+    if not user_id:
+        return jsonify({'error': 'Missing user_id parameter'}), 400
     
-    if not data or not 'title' in data or not 'user_id' in data:
-        return jsonify({'error': 'Missing required fields'}), 400
+    try:
+        page = parse_page_args(request.args, TODO_KEYSET)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    return serve_list('todos', user_id, f'SELECT {TODO_MAPPER.columns} FROM todos WHERE user_id = ?', (user_id,),
+                      'is_completed, due_date', TODO_KEYSET, page, TODO_MAPPER)
+
+@bp.route('/api/todos', methods=['POST'])
+@authenticated
+def create_todo(user_id):
+    data = request.get_json()
+    if isinstance(data, dict) and user_id is not None:
+        data['user_id'] = user_id
     
-    todo_id = str(uuid.uuid4())
     now = get_current_time()
+    try:
+        todo_id, values = prepare_insert('todos', data, now)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    cursor.execute('''
-        INSERT INTO todos (id, title, description, is_completed, due_date, priority, created_at, updated_at, user_id)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        todo_id,
-        data['title'],
-        data.get('description', ''),
-        1 if data.get('is_completed', False) else 0,
-        data.get('due_date'),
-        data.get('priority', 'medium'),
-        now,
-        now,
-        data['user_id']
-    ))
-    
-    conn.commit()
-    conn.close()
+    run_write(insert_record, 'todos', values)
+    get_list_cache().invalidate(data['user_id'], 'todos')
     
     return jsonify({'id': todo_id, 'message': 'Todo created successfully'}), 201
 
-@app.route('/api/todos/<todo_id>', methods=['GET'])
-def get_todo(todo_id):
+@bp.route('/api/todos/<todo_id>', methods=['GET'])
+@authenticated
+def get_todo(todo_id, user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
-    cursor.execute('SELECT * FROM todos WHERE id = ?', (todo_id,))
+    etag = item_etag(cursor, 'todos', todo_id, user_id)
+    if etag is None:
+        conn.close()
+        return jsonify({'error': 'Todo not found'}), 404
+    cached = not_modified(etag)
+    if cached:
+        conn.close()
+        return cached
+    
+    cursor.execute(f'SELECT {TODO_MAPPER.columns} FROM todos WHERE id = ?', (todo_id,))
     todo = cursor.fetchone()
     conn.close()
     
-    if not todo:
+    if not todo or not owns(todo['user_id'], user_id):
         return jsonify({'error': 'Todo not found'}), 404
     
-    return jsonify({
-        'id': todo['id'],
-        'title': todo['title'],
-        'description': todo['description'],
-        'is_completed': bool(todo['is_completed']),
-        'due_date': todo['due_date'],
-        'priority': todo['priority'],
-        'created_at': todo['created_at'],
-        'updated_at': todo['updated_at'],
-        'user_id': todo['user_id']
-    }), 200
+    return with_etag(jsonify(TODO_MAPPER(todo)), etag)
 
-@app.route('/api/todos/<todo_id>', methods=['PUT'])
-def update_todo(todo_id):
+@bp.route('/api/todos/<todo_id>', methods=['PUT'])
+@authenticated
+def update_todo(todo_id, user_id):
     data = request.get_json()
     
     if not data:
         return jsonify({'error': 'No data provided'}), 400
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM todos WHERE id = ?', (todo_id,))
-    todo = cursor.fetchone()
-    
-    if not todo:
-        conn.close()
-        return jsonify({'error': 'Todo not found'}), 404
-    
     # 更新待办事项
     now = get_current_time()
-    updates = []
-    update_values = []
-    
-    if 'title' in data:
-        updates.append('title = ?')
-        update_values.append(data['title'])
-    if 'description' in data:
-        updates.append('description = ?')
-        update_values.append(data['description'])
-    if 'is_completed' in data:
-        updates.append('is_completed = ?')
-        update_values.append(1 if data['is_completed'] else 0)
-    if 'due_date' in data:
-        updates.append('due_date = ?')
-        update_values.append(data['due_date'])
-    if 'priority' in data:
-        updates.append('priority = ?')
-        update_values.append(data['priority'])
-    
-    # 添加更新时间和ID
-    updates.append('updated_at = ?')
-    update_values.append(now)
-    update_values.append(todo_id)
-    
-    update_query = f"UPDATE todos SET {', '.join(updates)} WHERE id = ?"
-    cursor.execute(update_query, tuple(update_values))
+    columns, update_values = prepare_update('todos', data, now)
+    owner = run_write(update_record, 'todos', todo_id, columns, update_values, token_owner(user_id),
+                      if_match_version('todos'))
     
-    conn.commit()
-    conn.close()
+    if owner is None:
+        return jsonify({'error': 'Todo not found'}), 404
+    get_list_cache().invalidate(owner, 'todos')
     
     return jsonify({'message': 'Todo updated successfully'}), 200
 
-@app.route('/api/todos/<todo_id>', methods=['DELETE'])
-def delete_todo(todo_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM todos WHERE id = ?', (todo_id,))
-    todo = cursor.fetchone()
+@bp.route('/api/todos/<todo_id>', methods=['DELETE'])
+@authenticated
+def delete_todo(todo_id, user_id):
+    owner = run_write(delete_record, 'todos', todo_id, token_owner(user_id), if_match_version('todos'))
     
-    if not todo:
-        conn.close()
+    if owner is None:
         return jsonify({'error': 'Todo not found'}), 404
-    
-    cursor.execute('DELETE FROM todos WHERE id = ?', (todo_id,))
-    conn.commit()
-    conn.close()
+    get_list_cache().invalidate(owner, 'todos')
     
     return jsonify({'message': 'Todo deleted successfully'}), 200
 
-# 管理界面路由
+# 批量写入路由
 
-@app.route('/admin', strict_slashes=False)
-def admin_index():
-    # 重定向到用户管理页面
-    return redirect(url_for('admin_users'))
+@bp.route('/api/batch', methods=['POST'])
+@authenticated
+def batch_write(user_id):
+    """
+    在一个事务中批量执行日记、习惯和待办事项的创建/更新/删除
 
-@app.route('/admin/users', strict_slashes=False)
-def admin_users():
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute('SELECT * FROM users ORDER BY created_at DESC')
-    users = cursor.fetchall()
-    conn.close()
+    请求体：
+    {
+        "user_id": "...",            # 可选，创建操作未提供user_id时使用
+        "operations": [
+            {"op": "create", "resource": "journals", "data": {...}},
+            {"op": "update", "resource": "todos", "id": "...", "data": {...}},
+            {"op": "delete", "resource": "habits", "id": "..."}
+        ]
+    }
+    
+    每个操作使用与单条接口相同的校验规则，响应中的 results 按请求顺序给出每个操作的
+    status（201/200/400/404）以及 id 或 error
+    """
+    data = request.get_json()
     
-    return render_template('admin_users.html', users=users)
-
-@app.route('/admin/users/<user_id>', strict_slashes=False)
-def admin_user_details(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+    if not data or not isinstance(data.get('operations'), list):
+        return jsonify({'error': 'Missing operations'}), 400
     
-    # 获取用户信息
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-    user = cursor.fetchone()
+    operations = data['operations']
+    if len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({'error': f'Too many operations (max {MAX_BATCH_OPERATIONS})'}), 400
     
-    if not user:
+    conn = get_db_connection()
+    try:
+        results, applied, touched = apply_batch(conn, operations, user_id, get_current_time(),
+                                                owner=token_owner(user_id))
+    finally:
         conn.close()
-        return 'User not found', 404
     
-    # 获取用户数据统计
-    cursor.execute('SELECT COUNT(*) as journal_count FROM journals WHERE user_id = ?', (user_id,))
-    journal_count = cursor.fetchone()['journal_count']
+    for owner_id, resource in touched:
+        get_list_cache().invalidate(owner_id, resource)
     
-    cursor.execute('SELECT COUNT(*) as category_count FROM categories WHERE user_id = ?', (user_id,))
-    category_count = cursor.fetchone()['category_count']
+    return jsonify({'results': results, 'applied': applied}), 200
+
+# 增量同步路由
+
+
+@bp.route('/api/sync', methods=['GET'])
+@authenticated
+def sync_changes(user_id):
+    """
+    返回用户自上次同步以来的全部变更
+
+    查询参数：
+    - user_id: 用户ID
+    - since: 上次同步返回的 next_token，首次同步时省略
     
-    cursor.execute('SELECT COUNT(*) as habit_count FROM habits WHERE user_id = ?', (user_id,))
-    habit_count = cursor.fetchone()['habit_count']
+    响应中 journals/categories/habits/todos 为新增或修改的记录，
+    deleted 为各表被删除记录的id列表，next_token 用于下次同步；
+    reset 为 true 时客户端应丢弃本地数据，以本次返回的全量数据为准
+    """
+    if not user_id:
+        return jsonify({'error': 'Missing user_id parameter'}), 400
     
-    cursor.execute('SELECT COUNT(*) as todo_count FROM todos WHERE user_id = ?', (user_id,))
-    todo_count = cursor.fetchone()['todo_count']
+    try:
+        since = decode_sync_token(request.args.get('since'))
+    except ValueError:
+        return jsonify({'error': 'Invalid since parameter'}), 400
     
+    conn = get_db_connection()
+    changes = collect_changes(conn, user_id, since)
     conn.close()
     
-    return render_template('admin_user_details.html', 
-                         user=user, 
-                         journal_count=journal_count,
-                         category_count=category_count,
-                         habit_count=habit_count,
-                         todo_count=todo_count)
+    result = {
+        table: [serialize(row) for row in changes['rows'][table]]
+        for table, serialize in MAPPERS.items()
+    }
+    result['deleted'] = changes['deleted']
+    result['next_token'] = encode_sync_token(changes['seq'])
+    result['reset'] = changes['reset']
+    
+    return jsonify(result), 200
 
-@app.route('/admin/users/<user_id>/journals', strict_slashes=False)
-def admin_user_journals(user_id):
-    conn = get_db_connection()
-    cursor = conn.cursor()
+# 统计路由
+
+@bp.route('/api/stats', methods=['GET'])
+@authenticated
+def get_stats(user_id):
+    """
+    返回用户的统计数据
+
+    查询参数：
+    - user_id: 用户ID
+    - days / weeks / months: 返回最近多少个日、周、月的日记数和打卡次数（默认30/12/12）
     
-    # 获取用户信息
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-    user = cursor.fetchone()
+    响应中 journals/categories/habits/todos 各有 count；待办事项另有 completed 和 completion_ratio，
+    日记有 by_day/by_week/by_month，习惯有 by_frequency/by_start_month，habit_checkins 有 by_day/by_month，
+    分组计数为按分组倒序的 [{bucket, count}]（周以周一的日期表示）
+    """
+    if not user_id:
+        return jsonify({'error': 'Missing user_id parameter'}), 400
     
-    if not user:
+    try:
+        limits = parse_stats_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    conn = get_db_connection()
+    try:
+        stats = read_stats(conn.cursor(), user_id, limits)
+    finally:
         conn.close()
-        return 'User not found', 404
     
-    # 获取用户日记列表
-    cursor.execute('SELECT * FROM journals WHERE user_id = ? ORDER BY date DESC', (user_id,))
-    journals = cursor.fetchall()
+    return jsonify(stats), 200
+
+# 管理界面路由
+
+@bp.route('/admin/pool_stats', strict_slashes=False)
+def admin_pool_stats():
+    # 返回数据库连接池的命中/未命中等统计
+    return jsonify(get_pool().stats()), 200
+
+@bp.route('/admin/cache_stats', strict_slashes=False)
+def admin_cache_stats():
+    # 返回列表缓存的大小、命中率和淘汰次数
+    return jsonify(get_list_cache().stats()), 200
+
+@bp.route('/admin/thumbnail_stats', strict_slashes=False)
+def admin_thumbnail_stats():
+    # 返回派生图生成队列的深度、完成/失败数和排队/生成耗时
+    return jsonify(current_app.extensions['thumbnails'].stats()), 200
+
+@bp.route('/admin/auth_stats', strict_slashes=False)
+def admin_auth_stats():
+    # 返回密码哈希线程池的队列深度、拒绝数和排队/计算耗时，以及登录限流的计数
+    return jsonify({
+        'password_hasher': current_app.extensions['password_hasher'].stats(),
+        'login_limiter': current_app.extensions['login_limiter'].stats(),
+    }), 200
+
+@bp.route('/admin/write_stats', strict_slashes=False)
+def admin_write_stats():
+    # 返回合并写入的批次数、批大小、排队和提交耗时；未启用合并写入时返回404
+    writer = current_app.extensions.get('write_queue')
+    if writer is None:
+        abort(404)
+    return jsonify(writer.stats()), 200
+
+@bp.route('/metrics', strict_slashes=False)
+def metrics_endpoint():
+    # Prometheus文本格式的请求、SQL指标，附带连接池、列表缓存、密码哈希队列和合并写入队列的当前状态
+    metrics = current_app.extensions.get('metrics')
+    if metrics is None:
+        abort(404)
+    pool = get_pool().stats()
+    cache = get_list_cache().stats()
+    hasher = current_app.extensions['password_hasher'].stats()
+    extra = [
+        ('momentkeep_db_pool_in_use', 'gauge', 'Database connections checked out', pool['in_use']),
+        ('momentkeep_db_pool_hits_total', 'counter', 'Database connections reused from the pool', pool['hits']),
+        ('momentkeep_db_pool_misses_total', 'counter', 'Database connections created on demand', pool['misses']),
+        ('momentkeep_list_cache_hits_total', 'counter', 'List cache hits', cache['hits']),
+        ('momentkeep_list_cache_misses_total', 'counter', 'List cache misses', cache['misses']),
+        ('momentkeep_password_hash_queue_depth', 'gauge', 'Password hash jobs waiting', hasher['queue_depth']),
+    ]
+    writer = current_app.extensions.get('write_queue')
+    if writer is not None:
+        batch_sizes, waits = writer.histograms()
+        extra += [
+            ('momentkeep_write_batch_size', 'histogram', 'Writes committed per group-commit transaction', batch_sizes),
+            ('momentkeep_write_queue_wait_seconds', 'histogram', 'Time writes wait for the writer thread', waits),
+            ('momentkeep_write_queue_depth', 'gauge', 'Writes waiting for the writer thread',
+             writer.stats()['queue_depth']),
+        ]
+    return Response(metrics.render(extra), mimetype='text/plain; version=0.0.4')
+
+@bp.route('/admin/sql_stats', strict_slashes=False)
+def admin_sql_stats():
+    # 返回本进程中最慢的语句形状：?order=total|max|avg（默认total）&limit=20
+    metrics = current_app.extensions.get('metrics')
+    if metrics is None:
+        abort(404)
+    order = request.args.get('order', 'total')
+    if order not in ('total', 'max', 'avg'):
+        return jsonify({'error': 'Invalid order parameter'}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        return jsonify({'error': 'Invalid limit parameter'}), 400
+    return jsonify(metrics.sql.slowest(limit, order)), 200
+
+@bp.route('/admin/directory_stats', strict_slashes=False)
+def admin_directory_stats():
+    # 返回管理界面用户目录缓存的大小和命中数
+    return jsonify(current_app.extensions['user_directory'].stats()), 200
+
+@bp.route('/admin', strict_slashes=False)
+def admin_index():
+    # 重定向到用户管理页面
+    return redirect(url_for('.admin_users'))
+
+# 管理界面的列表都分页显示，只查询模板中显示的列
+ADMIN_LISTS = {
+    'journals': ('id, title, category_id, date, created_at', JOURNAL_KEYSET),
+    'categories': ('id, name, type, created_at', CATEGORY_KEYSET),
+    'habits': ('id, name, frequency, target, start_date, end_date, created_at', HABIT_KEYSET),
+    'todos': ('id, title, is_completed, priority, due_date, created_at', TODO_KEYSET),
+}
+
+def admin_page_args(keyset):
+    """
+    解析管理页面的分页参数，返回 (limit, 游标中的排序键或None, 页码)；参数不合法时返回400
+
+    页码只用于显示序号，翻页由游标决定
+    """
+    try:
+        limit, after = parse_page_args(request.args, keyset) or (DEFAULT_PAGE_SIZE, None)
+    except ValueError as e:
+        abort(400, str(e))
+    try:
+        page = max(int(request.args.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    return limit, after, page
+
+def admin_pager(next_cursor, page, limit):
+    """生成模板中的翻页链接，保留当前页面的其他查询参数"""
+    args = request.args.to_dict()
+    args.pop('cursor', None)
+    args.pop('page', None)
+    next_url = None
+    if next_cursor:
+        next_url = url_for(request.endpoint, **request.view_args, **args, cursor=next_cursor, page=page + 1)
+    return {
+        'start': (page - 1) * limit,
+        'next_url': next_url,
+        'first_url': url_for(request.endpoint, **request.view_args, **args) if page > 1 else None,
+    }
+
+@bp.route('/admin/users', strict_slashes=False)
+def admin_users():
+    # 用户列表：按用户名/邮箱搜索（q），按注册时间、用户名或邮箱排序（sort），每页 limit 个
+    query = request.args.get('q', '').strip()
+    sort = request.args.get('sort', DEFAULT_USER_SORT)
+    if sort not in USER_SORTS:
+        abort(400, 'Invalid sort parameter')
+    keyset = USER_SORTS[sort]
+    limit, after, page = admin_page_args(keyset)
+    directory = current_app.extensions['user_directory']
     
-    conn.close()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        def load():
+            where, params = search_clause(query)
+            rows, next_cursor = fetch_page(cursor, f'SELECT {USER_COLUMNS} FROM users WHERE {where}', params,
+                                           keyset, limit, after)
+            return [dict(row) for row in rows], next_cursor
+        
+        users, next_cursor = directory.page((query, sort, limit, request.args.get('cursor')), load)
+        total = directory.total(cursor, query)
+        counts = directory.counts(cursor, [user['id'] for user in users])
+    finally:
+        conn.close()
     
-    return render_template('admin_user_journals.html', user=user, journals=journals)
+    return render_template('admin_users.html', users=users, counts=counts, total=total, query=query, sort=sort,
+                           pager=admin_pager(next_cursor, page, limit))
 
-@app.route('/admin/users/<user_id>/categories', strict_slashes=False)
-def admin_user_categories(user_id):
+@bp.route('/admin/users/<user_id>', strict_slashes=False)
+def admin_user_details(user_id):
+    directory = current_app.extensions['user_directory']
     conn = get_db_connection()
     cursor = conn.cursor()
-    
-    # 获取用户信息
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-    user = cursor.fetchone()
-    
-    if not user:
+    try:
+        # 获取用户信息和各项数据总数（来自统计汇总表，短时间缓存）
+        user = directory.user(cursor, user_id)
+        if not user:
+            return 'User not found', 404
+        counts = directory.counts(cursor, [user_id])[user_id]
+    finally:
         conn.close()
-        return 'User not found', 404
-    
-    # 获取用户分类列表
-    cursor.execute('SELECT * FROM categories WHERE user_id = ? ORDER BY name', (user_id,))
-    categories = cursor.fetchall()
-    
-    conn.close()
     
-    return render_template('admin_user_categories.html', user=user, categories=categories)
+    return render_template('admin_user_details.html', 
+                         user=user, 
+                         journal_count=counts['journals'],
+                         category_count=counts['categories'],
+                         habit_count=counts['habits'],
+                         todo_count=counts['todos'])
 
-@app.route('/admin/users/<user_id>/habits', strict_slashes=False)
-def admin_user_habits(user_id):
+@bp.route('/admin/users/<user_id>/stats', strict_slashes=False)
+def admin_user_stats(user_id):
+    # 返回与 /api/stats 相同的统计数据，支持相同的查询参数
+    try:
+        limits = parse_stats_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
     conn = get_db_connection()
     cursor = conn.cursor()
-    
-    # 获取用户信息
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+    cursor.execute('SELECT id FROM users WHERE id = ?', (user_id,))
     user = cursor.fetchone()
     
     if not user:
         conn.close()
-        return 'User not found', 404
-    
-    # 获取用户习惯列表
-    cursor.execute('SELECT * FROM habits WHERE user_id = ? ORDER BY name', (user_id,))
-    habits = cursor.fetchall()
+        return jsonify({'error': 'User not found'}), 404
     
+    stats = read_stats(cursor, user_id, limits)
     conn.close()
     
-    return render_template('admin_user_habits.html', user=user, habits=habits)
+    return jsonify(stats), 200
 
-@app.route('/admin/users/<user_id>/todos', strict_slashes=False)
-def admin_user_todos(user_id):
+def render_admin_list(user_id, resource, template):
+    """按页读取用户的某类数据并渲染管理页面"""
+    columns, keyset = ADMIN_LISTS[resource]
+    limit, after, page = admin_page_args(keyset)
+    
     conn = get_db_connection()
     cursor = conn.cursor()
-    
-    # 获取用户信息
-    cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-    user = cursor.fetchone()
-    
-    if not user:
+    try:
+        user = current_app.extensions['user_directory'].user(cursor, user_id)
+        if not user:
+            return 'User not found', 404
+        rows, next_cursor = fetch_page(cursor, f'SELECT {columns} FROM {resource} WHERE user_id = ?', (user_id,),
+                                       keyset, limit, after)
+    finally:
         conn.close()
-        return 'User not found', 404
-    
-    # 获取用户待办事项列表
-    cursor.execute('SELECT * FROM todos WHERE user_id = ? ORDER BY is_completed, due_date', (user_id,))
-    todos = cursor.fetchall()
-    
-    conn.close()
     
-    return render_template('admin_user_todos.html', user=user, todos=todos)
+    return render_template(template, user=user, pager=admin_pager(next_cursor, page, limit), **{resource: rows})
+
+@bp.route('/admin/users/<user_id>/journals', strict_slashes=False)
+def admin_user_journals(user_id):
+    return render_admin_list(user_id, 'journals', 'admin_user_journals.html')
+
+@bp.route('/admin/users/<user_id>/categories', strict_slashes=False)
+def admin_user_categories(user_id):
+    return render_admin_list(user_id, 'categories', 'admin_user_categories.html')
+
+@bp.route('/admin/users/<user_id>/habits', strict_slashes=False)
+def admin_user_habits(user_id):
+    return render_admin_list(user_id, 'habits', 'admin_user_habits.html')
+
+@bp.route('/admin/users/<user_id>/todos', strict_slashes=False)
+def admin_user_todos(user_id):
+    return render_admin_list(user_id, 'todos', 'admin_user_todos.html')
 
 # 文件上传API端点
-@app.route('/api/upload', methods=['POST'])
-def upload_file():
+@bp.route('/api/upload', methods=['POST'])
+@authenticated
+def upload_file(user_id):
     # 检查请求中是否包含文件
     if 'file' not in request.files:
         return jsonify({'error': 'No file part'}), 400
     
-    # 获取用户ID参数
-    user_id = request.form.get('user_id')
+    # 检查用户ID参数
     if not user_id:
         return jsonify({'error': 'Missing user_id parameter'}), 400
     
@@ -914,25 +1518,156 @@ def upload_file():
         filename = secure_filename(file.filename)
         unique_filename = f"{uuid.uuid4()}_{filename}"
         
-        # 为当前用户创建独立的上传目录
-        user_upload_folder = os.path.join(app.config['UPLOAD_FOLDER'], user_id)
-        os.makedirs(user_upload_folder, exist_ok=True)
-        
-        # 保存文件到用户的上传文件夹
-        file_path = os.path.join(user_upload_folder, unique_filename)
-        file.save(file_path)
+        # 边写入边计算哈希，相同内容只保存一份，user_id/unique_filename 映射到该内容
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        tmp_path, digest, size = spool_stream(upload_folder, file.stream)
+        conn = get_db_connection()
+        try:
+            store_file(conn, upload_folder, tmp_path, digest, size, user_id, unique_filename)
+        finally:
+            conn.close()
+        schedule_derivatives(blob_path(upload_folder, digest), digest, unique_filename)
         
-        # 返回文件的访问URL，包含用户目录
-        file_url = f"http://localhost:5000/uploads/{user_id}/{unique_filename}"
-        # 返回包含用户ID的完整文件名，以便客户端正确构建URL
-        full_filename = f"{user_id}/{unique_filename}"
-        return jsonify({'filename': full_filename, 'url': file_url, 'user_id': user_id}), 201
+        result = upload_result(user_id, unique_filename)
+        result.update({'size': size, 'sha256': digest})
+        return jsonify(result), 201
     else:
         return jsonify({'error': 'File type not allowed'}), 400
 
+# 图片上传完成后在后台生成各尺寸的派生图，不等待结果；队列已满时留到首次请求时生成
+def schedule_derivatives(source_path, digest, filename):
+    if not is_image(filename):
+        return
+    pool = current_app.extensions['thumbnails']
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    for size, max_side in THUMBNAIL_SIZES.items():
+        target = derivative_path(upload_folder, size, derivative_key(source_path, digest), filename)
+        if not os.path.exists(target):
+            pool.submit(source_path, target, max_side)
+
+# 上传完成后返回给客户端的信息
+def upload_result(user_id, unique_filename):
+    # 返回文件的访问URL，包含用户目录
+    file_url = f"http://localhost:5000/uploads/{user_id}/{unique_filename}"
+    # 返回包含用户ID的完整文件名，以便客户端正确构建URL
+    full_filename = f"{user_id}/{unique_filename}"
+    return {'filename': full_filename, 'url': file_url, 'user_id': user_id}
+
+def upload_error(e):
+    return jsonify({'error': str(e), **e.extra}), e.status
+
+# 分块续传上传：创建上传会话
+# 请求体：{user_id, filename, size, sha256(可选，整个文件的十六进制SHA-256)}
+@bp.route('/api/uploads', methods=['POST'])
+@authenticated
+def create_upload(user_id):
+    data = request.get_json(silent=True)
+    if not data or not user_id or not data.get('filename') or 'size' not in data:
+        return jsonify({'error': 'Missing required fields'}), 400
+    
+    # user_id 会作为目录名使用，不允许包含路径分隔符等字符
+    user_id = str(user_id)
+    if secure_filename(user_id) != user_id:
+        return jsonify({'error': 'Invalid user_id'}), 400
+    if not allowed_file(data['filename']):
+        return jsonify({'error': 'File type not allowed'}), 400
+    
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    conn = get_db_connection()
+    try:
+        prune_sessions_if_due(conn, upload_folder, current_app.config['UPLOAD_SESSION_TTL'])
+        session = create_session(conn, upload_folder, user_id, secure_filename(data['filename']),
+                                 data['size'], data.get('sha256'), current_app.config['MAX_UPLOAD_SIZE'])
+    except UploadError as e:
+        return upload_error(e)
+    finally:
+        conn.close()
+    
+    return jsonify({
+        'upload_id': session['id'],
+        'offset': 0,
+        'size': session['size'],
+        'chunk_size': min(current_app.config['UPLOAD_CHUNK_SIZE'], current_app.config['MAX_CONTENT_LENGTH']),
+    }), 201
+
+# 分块续传上传：查询已接收的字节数
+@bp.route('/api/uploads/<upload_id>', methods=['GET'])
+@authenticated
+def get_upload(upload_id, user_id):
+    conn = get_db_connection()
+    try:
+        session = get_session(conn, upload_id, current_app.config['UPLOAD_SESSION_TTL'], token_owner(user_id))
+    except UploadError as e:
+        return upload_error(e)
+    finally:
+        conn.close()
+    return jsonify({'upload_id': upload_id, 'offset': session['received'], 'size': session['size']}), 200
+
+# 分块续传上传：写入一个分块
+# 请求体为分块的原始字节，?offset= 为该分块在文件中的起始位置；
+# 可选请求头 X-Chunk-SHA256 用于校验该分块
+@bp.route('/api/uploads/<upload_id>', methods=['PUT'])
+@authenticated
+def put_upload_chunk(upload_id, user_id):
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Missing offset parameter'}), 400
+    
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    conn = get_db_connection()
+    try:
+        session = get_session(conn, upload_id, current_app.config['UPLOAD_SESSION_TTL'], token_owner(user_id))
+        received = write_chunk(conn, upload_folder, session, offset, request.stream, request.content_length,
+                               request.headers.get('X-Chunk-SHA256'))
+    except UploadError as e:
+        return upload_error(e)
+    finally:
+        conn.close()
+    return jsonify({'upload_id': upload_id, 'offset': received, 'size': session['size']}), 200
+
+# 分块续传上传：完成上传，校验大小和SHA-256后生成正式文件
+@bp.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+@authenticated
+def complete_upload(upload_id, user_id):
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    conn = get_db_connection()
+    try:
+        session = get_session(conn, upload_id, current_app.config['UPLOAD_SESSION_TTL'], token_owner(user_id))
+        unique_filename = f"{uuid.uuid4()}_{session['filename']}"
+        
+        def publish(path, digest):
+            store_file(conn, upload_folder, path, digest, session['size'], session['user_id'], unique_filename)
+        
+        digest = complete_session(conn, upload_folder, session, publish)
+    except UploadError as e:
+        return upload_error(e)
+    finally:
+        conn.close()
+    schedule_derivatives(blob_path(upload_folder, digest), digest, unique_filename)
+    
+    result = upload_result(session['user_id'], unique_filename)
+    result.update({'size': session['size'], 'sha256': digest})
+    return jsonify(result), 201
+
+# 分块续传上传：放弃上传并删除临时文件
+@bp.route('/api/uploads/<upload_id>', methods=['DELETE'])
+@authenticated
+def abort_upload(upload_id, user_id):
+    conn = get_db_connection()
+    try:
+        session = get_session(conn, upload_id, current_app.config['UPLOAD_SESSION_TTL'], token_owner(user_id))
+        abort_session(conn, current_app.config['UPLOAD_FOLDER'], session)
+    except UploadError as e:
+        if e.status != 410:
+            return upload_error(e)
+    finally:
+        conn.close()
+    return jsonify({'message': 'Upload aborted'}), 200
+
 # 文件删除API端点
-@app.route('/api/delete_file', methods=['DELETE'])
-def delete_file():
+@bp.route('/api/delete_file', methods=['DELETE'])
+@authenticated
+def delete_file(user_id):
     # 获取请求体数据
     data = request.get_json()
     
@@ -942,12 +1677,39 @@ def delete_file():
     
     file_path = data['file_path']
     
-    # 安全检查：确保文件路径不包含..，防止路径遍历攻击
-    if '..' in file_path:
+    # 只接受上传接口返回的 <用户id>/<文件名> 格式或旧版根目录下的 <文件名>，防止路径遍历；
+    # 以点开头的部分一律拒绝，去重存储的 .blobs、.derivatives 等内部目录不能被直接删除
+    parts = file_path.split('/') if isinstance(file_path, str) else []
+    if len(parts) not in (1, 2) or '\\' in file_path or any(not part or part.startswith('.') for part in parts):
         return jsonify({'error': 'Invalid file path'}), 400
     
-    # 构建完整的文件路径
-    full_file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_path)
+    # 旧版本直接保存在上传目录根下的文件（/uploads/<文件名>）无法确定所有者，只有旧客户端可以删除
+    if len(parts) == 1:
+        if user_id is not None:
+            return jsonify({'error': 'Forbidden'}), 403
+        return remove_legacy_file(os.path.join(current_app.config['UPLOAD_FOLDER'], parts[0]))
+    owner, filename = parts
+    
+    # 已知调用者（令牌或 user_id 参数）时只能删除自己目录下的文件
+    if user_id is not None and owner != user_id:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    # 去重存储中的文件只删除映射并减少引用计数，内容由后台垃圾回收在无人引用后删除
+    conn = get_db_connection()
+    try:
+        released = release_file(conn, owner, filename)
+    finally:
+        conn.close()
+    if released:
+        return jsonify({'message': 'File deleted successfully'}), 200
+    
+    # 旧版本直接保存在用户目录下的文件
+    return remove_legacy_file(os.path.join(current_app.config['UPLOAD_FOLDER'], owner, filename))
+
+# 删除不在去重存储中的旧版文件；路径指向目录时拒绝
+def remove_legacy_file(full_file_path):
+    if os.path.isdir(full_file_path):
+        return jsonify({'error': 'Invalid file path'}), 400
     
     # 检查文件是否存在
     if os.path.exists(full_file_path):
@@ -961,23 +1723,65 @@ def delete_file():
         # 文件不存在，返回成功响应（幂等操作）
         return jsonify({'message': 'File not found, but operation considered successful'}), 200
 
+# 发送上传的文件；?size=thumb / ?size=preview 时发送图片的派生图
+# 派生图不存在时按需生成并等待，无法生成（未安装Pillow、非图片、队列满、超时或出错）时返回原图
+def serve_upload(path, filename, digest=None):
+    size = request.args.get('size')
+    if not size:
+        return serve_media(path, filename, digest)
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({'error': 'Invalid size parameter'}), 400
+    
+    pool = current_app.extensions['thumbnails']
+    if not is_image(filename) or not pool.available:
+        return serve_media(path, filename, digest)
+    
+    target = derivative_path(current_app.config['UPLOAD_FOLDER'], size, derivative_key(path, digest), filename)
+    if not derivative_is_fresh(target, path):
+        # 排队和生成共用同一个等待时限
+        deadline = time.monotonic() + current_app.config['THUMBNAIL_WAIT_TIMEOUT']
+        future = pool.submit(path, target, THUMBNAIL_SIZES[size], wait=True,
+                             timeout=current_app.config['THUMBNAIL_WAIT_TIMEOUT'])
+        if future is None:
+            return serve_media(path, filename, digest)
+        try:
+            future.result(timeout=max(deadline - time.monotonic(), 0))
+        except Exception:
+            return serve_media(path, filename, digest)
+    return serve_media(target, filename, f'{digest}-{size}' if digest else None,
+                       mimetype='image/jpeg' if target.endswith('.jpg') else 'image/png')
+
+# 按相对路径发送上传目录中的旧版文件（不在去重存储中）
+def serve_legacy_upload(*parts):
+    path = safe_join(current_app.config['UPLOAD_FOLDER'], *parts)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return serve_upload(path, parts[-1])
+
 # 静态文件服务端点 - 支持用户特定目录
-@app.route('/uploads/<user_id>/<filename>')
+@bp.route('/uploads/<user_id>/<filename>')
 def uploaded_file(user_id, filename):
-    # 使用绝对路径确保正确性
-    user_upload_folder = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], user_id))
-    return send_from_directory(user_upload_folder, filename)
+    # 去重存储中的文件通过映射找到实际内容，内容哈希即为ETag
+    conn = get_db_connection()
+    try:
+        resolved = resolve_file(conn, current_app.config['UPLOAD_FOLDER'], user_id, filename)
+    finally:
+        conn.close()
+    if resolved is not None:
+        path, digest = resolved
+        return serve_upload(path, filename, digest)
+    
+    # 旧版本直接保存在用户目录下的文件
+    return serve_legacy_upload(user_id, filename)
 
 # 静态文件服务端点 - 支持直接访问根目录（用于兼容旧的文件路径）
-@app.route('/uploads/<filename>')
+@bp.route('/uploads/<filename>')
 def uploaded_file_root(filename):
-    # 使用绝对路径确保正确性
-    upload_folder_abs = os.path.abspath(app.config['UPLOAD_FOLDER'])
-    return send_from_directory(upload_folder_abs, filename)
-
-# 确保在应用启动时调用init_db()
-init_db()
+    return serve_legacy_upload(filename)
 
-# 主函数
+# 主函数：本地开发服务器
+# 生产环境请使用 gunicorn -c gunicorn.conf.py wsgi:app（见 docs/guides/服务端部署文档.md）
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    app = create_app()
+    init_db(app.config['DATABASE'])
+    app.run(debug=app.config.get('DEBUG', False), host='0.0.0.0', port=5000)
@@ -0,0 +1,195 @@
+import hmac
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# 密码哈希与登录限流
+#
+# 密码以 werkzeug 的 scrypt 格式保存（method$salt$hash）。scrypt 刻意消耗大量CPU和内存，
+# 直接在请求线程中计算会让登录洪峰占满所有工作线程，因此哈希计算交给固定数量的后台线程，
+# 排队的任务数有上限，超过上限的请求立即返回503，不会无限堆积。
+# hashlib.scrypt 计算期间会释放GIL，后台线程可以真正并行。
+#
+# 旧版本直接保存明文密码，这些用户下次登录成功时会透明地升级为哈希；
+# 调整 PASSWORD_HASH_METHOD 后，使用旧参数的哈希同样会在下次登录时重新计算。
+
+# 已知的哈希格式前缀，其他值视为旧版明文密码
+_HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+# 延迟统计保留最近的任务数
+_LATENCY_WINDOW = 500
+
+
+class PoolSaturated(Exception):
+    """哈希任务队列已满，或等待结果超时"""
+
+
+def is_hashed(stored):
+    return stored.startswith(_HASH_PREFIXES)
+
+
+def needs_rehash(stored, method):
+    """stored 是明文或使用了与 method 不同的参数时返回True"""
+    return not is_hashed(stored) or stored.split('$', 1)[0] != method
+
+
+def verify_password(stored, password):
+    """校验密码，stored 为数据库中保存的值（哈希或旧版明文）"""
+    if is_hashed(stored):
+        return check_password_hash(stored, password)
+    return hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+
+
+class PasswordHasher:
+    """
+    有界队列 + 固定数量工作线程的密码哈希池
+
+    hash() / verify() 在工作线程中计算并等待结果；队列已满或等待超过 timeout 秒时抛出 PoolSaturated
+    """
+
+    def __init__(self, method='scrypt:32768:8:1', workers=2, queue_size=32, timeout=10):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._latencies = deque(maxlen=_LATENCY_WINDOW)
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'timeouts': 0}
+        self._dummy_hash = None
+
+    def start(self):
+        if not self._threads:
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'password-hash-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def _submit(self, func, *args):
+        future = Future()
+        try:
+            self._queue.put_nowait((func, args, future, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise PoolSaturated()
+        with self._lock:
+            self._stats['submitted'] += 1
+        return future
+
+    def _wait(self, future):
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise PoolSaturated()
+
+    def hash(self, password):
+        return self._wait(self._submit(generate_password_hash, password, self.method))
+
+    def verify(self, stored, password):
+        return self._wait(self._submit(verify_password, stored, password))
+
+    def verify_missing_user(self, password):
+        """
+        用户不存在时也完成一次同等开销的校验，避免通过响应时间判断邮箱是否已注册
+        """
+        if self._dummy_hash is None:
+            self._dummy_hash = self.hash(secrets.token_hex(16))
+        self.verify(self._dummy_hash, password)
+        return False
+
+    def _run(self):
+        while True:
+            func, args, future, queued_at = self._queue.get()
+            started = time.monotonic()
+            try:
+                result = func(*args)
+            except Exception as e:
+                with self._lock:
+                    self._stats['failed'] += 1
+                future.set_exception(e)
+            else:
+                finished = time.monotonic()
+                with self._lock:
+                    self._stats['completed'] += 1
+                    self._latencies.append((started - queued_at, finished - started))
+                future.set_result(result)
+            finally:
+                self._queue.task_done()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            latencies = list(self._latencies)
+        snapshot.update({
+            'method': self.method,
+            'workers': len(self._threads),
+            'queue_depth': self._queue.qsize(),
+            'queue_size': self._queue.maxsize,
+        })
+        for index, name in ((0, 'wait'), (1, 'hash')):
+            values = sorted(item[index] for item in latencies)
+            if values:
+                snapshot[f'{name}_ms_avg'] = round(sum(values) / len(values) * 1000, 2)
+                snapshot[f'{name}_ms_p95'] = round(values[max(int(len(values) * 0.95) - 1, 0)] * 1000, 2)
+        return snapshot
+
+
+class TokenBucketLimiter:
+    """
+    按键（邮箱、IP）分别计数的令牌桶限流器
+
+    每个键的桶容量为 burst，每分钟补充 rate_per_minute 个令牌，每次请求消耗一个。
+    只保存在进程内存中，最多跟踪 max_keys 个键，超过时淘汰最久未访问的键
+    """
+
+    def __init__(self, rate_per_minute=10, burst=5, max_keys=100000, enabled=True):
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.max_keys = max_keys
+        self.enabled = enabled
+        self._buckets = OrderedDict()  # 键 -> (令牌数, 上次补充时间)
+        self._lock = threading.Lock()
+        self._stats = {'allowed': 0, 'limited': 0, 'evictions': 0}
+
+    def acquire(self, *keys):
+        """
+        为所有键各消耗一个令牌，返回 (是否允许, 需要等待的秒数)
+
+        任一键的令牌不足时都不消耗，返回最长的等待时间
+        """
+        if not self.enabled:
+            return True, 0
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key in keys:
+                tokens, updated_at = self._buckets.get(key, (self.burst, now))
+                levels.append(min(self.burst, tokens + (now - updated_at) * self.rate))
+            if any(tokens < 1 for tokens in levels):
+                self._stats['limited'] += 1
+                wait = max((1 - tokens) / self.rate for tokens in levels if tokens < 1) if self.rate else 60
+                return False, wait
+            for key, tokens in zip(keys, levels):
+                self._buckets[key] = (tokens - 1, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self._stats['evictions'] += 1
+            self._stats['allowed'] += 1
+            return True, 0
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['tracked_keys'] = len(self._buckets)
+        snapshot.update({'enabled': self.enabled, 'rate_per_minute': round(self.rate * 60, 2), 'burst': self.burst})
+        return snapshot
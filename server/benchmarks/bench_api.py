@@ -0,0 +1,814 @@
+"""
+REST API 压测与微基准
+
+1. 在临时数据库中写入 --rows 行（1千~100万）合成数据：--users 个用户，以及按比例分配的日记、分类、
+   习惯、打卡记录和待办事项（直接批量写入，触发器同步维护检索、标签、统计等派生表），
+   再通过上传接口写入 --uploads 个文件；
+2. micro：用 Flask 测试客户端逐个路由顺序请求 --iterations 次，测量应用内的处理耗时（不含网络和WSGI服务器）；
+3. load：在子进程中启动真实的HTTP服务（默认 werkzeug 多线程服务器，--server gunicorn 使用 gunicorn.conf.py），
+   --clients 个线程各持一个长连接，按权重混合请求各路由，持续 --duration 秒；
+4. 输出每个路由的 p50/p95/p99 延迟、吞吐量、错误数以及进程峰值内存（RSS）。
+
+--output 把结果保存为JSON（附带git提交、Python和SQLite版本等信息）；--compare 与之前保存的结果比较，
+任一路由的 p95 变慢超过 --threshold 时以状态码1退出，便于在提交之间发现性能回退。
+数据和请求序列都由 --seed 决定，相同参数的两次运行请求完全相同的数据。
+
+用法（在server目录下执行）：
+    python benchmarks/bench_api.py [--rows 10000] [--users 20] [--mode micro,load] [--clients 16] [--duration 10]
+                                   [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import datetime
+import http.client
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+try:
+    import resource  # 仅Unix
+except ImportError:
+    resource = None
+
+BENCH_PASSWORD = 'bench-password'
+
+# --rows 在各类数据之间的分配比例
+ROW_SHARES = {
+    'journals': 0.5,
+    'todos': 0.2,
+    'checkins': 0.2,
+    'habits': 0.05,
+    'categories': 0.05,
+}
+
+# 每个资源为生成请求保留的id数量（每个用户）
+KEEP_IDS = 200
+
+WORDS = ('morning walk coffee meeting project deadline weekend family dinner movie reading music garden rain '
+         'sunshine travel airport hotel museum beach mountain river bicycle running 早晨 散步 咖啡 会议 项目 '
+         '周末 家人 晚餐 电影 阅读 音乐 花园 下雨 阳光 旅行').split()
+TAGS = ('work', 'family', 'travel', 'health', 'reading', 'music', 'food', 'sport')
+FREQUENCIES = ('daily', 'weekly', 'monthly')
+
+# 服务端配置：关闭登录限流和后台回收线程，日志只输出错误；PASSWORD_HASH_METHOD 取 --hash-method
+SERVER_CONFIG = {
+    'LOGIN_RATE_LIMIT_ENABLED': False,
+    'BLOB_GC_ENABLED': False,
+    'LOG_LEVEL': 'ERROR',
+}
+
+
+def make_uuid(rng):
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words))
+
+
+# ---------------------------------------------------------------------------
+# 写入测试数据
+
+
+def seed_rows(database, rows, users, content_bytes, hash_method, rng):
+    """
+    直接批量写入合成数据，返回 (各表行数, 每个用户保留的id {user_id: {资源: [id]}})
+    """
+    from werkzeug.security import generate_password_hash
+
+    from app import init_db
+    from mutations import RESOURCES
+
+    init_db(database)
+    conn = sqlite3.connect(database)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+
+    counts = {table: max(int(rows * share), users) for table, share in ROW_SHARES.items()}
+    now = datetime.datetime(2025, 1, 1)
+    password = generate_password_hash(BENCH_PASSWORD, hash_method)  # 所有用户使用同一个密码哈希
+    user_ids = [f'bench-user-{index}' for index in range(users)]
+    ids = {user_id: {resource: [] for resource in ('journals', 'categories', 'habits', 'todos')}
+           for user_id in user_ids}
+
+    def keep(user_id, resource, record_id):
+        if len(ids[user_id][resource]) < KEEP_IDS:
+            ids[user_id][resource].append(record_id)
+
+    def insert(sql, generate, total, chunk=5000):
+        for start in range(0, total, chunk):
+            conn.execute('BEGIN')
+            conn.executemany(sql, [generate(index) for index in range(start, min(start + chunk, total))])
+            conn.commit()
+
+    created = now.isoformat()
+    insert('INSERT INTO users (id, username, email, password, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+           lambda i: (user_ids[i], f'bench{i}', f'bench{i}@example.com', password, created, created), users)
+
+    def category(i):
+        user_id = user_ids[i % users]
+        record_id = make_uuid(rng)
+        keep(user_id, 'categories', record_id)
+        return record_id, f'category {i}', rng.choice(('journal', 'habit', 'todo')), created, created, user_id
+    insert('INSERT INTO categories (id, name, type, created_at, updated_at, user_id) VALUES (?, ?, ?, ?, ?, ?)',
+           category, counts['categories'])
+
+    content = 'x' * content_bytes
+
+    def journal(i):
+        user_id = user_ids[i % users]
+        record_id = make_uuid(rng)
+        keep(user_id, 'journals', record_id)
+        day = (now - datetime.timedelta(days=rng.randrange(3 * 365))).isoformat()
+        data = {'title': sentence(rng, 4), 'content': f'{sentence(rng, 20)} {content}', 'user_id': user_id,
+                'tags': rng.sample(TAGS, rng.randint(0, 3)), 'date': day, 'category_id': ''}
+        return RESOURCES['journals']['insert_values'](data, record_id, created)
+    insert(RESOURCES['journals']['insert_sql'], journal, counts['journals'])
+
+    habits = []
+
+    def habit(i):
+        user_id = user_ids[i % users]
+        record_id = make_uuid(rng)
+        keep(user_id, 'habits', record_id)
+        habits.append((record_id, user_id))
+        data = {'name': f'habit {i}', 'frequency': rng.choice(FREQUENCIES), 'target': str(rng.randint(1, 5)),
+                'start_date': '2023-01-01', 'user_id': user_id}
+        return RESOURCES['habits']['insert_values'](data, record_id, created)
+    insert(RESOURCES['habits']['insert_sql'], habit, counts['habits'])
+
+    # 打卡记录：每个习惯从 now 往前连续若干天，(habit_id, date) 不重复
+    per_habit = max(counts['checkins'] // len(habits), 1)
+
+    def checkin(i):
+        habit_id, user_id = habits[i // per_habit % len(habits)]
+        day = (now - datetime.timedelta(days=i % per_habit)).date().isoformat()
+        return habit_id, day, user_id, 1, created
+    counts['checkins'] = per_habit * len(habits)
+    insert('INSERT OR IGNORE INTO habit_checkins (habit_id, date, user_id, count, created_at) VALUES (?, ?, ?, ?, ?)',
+           checkin, counts['checkins'])
+
+    def todo(i):
+        user_id = user_ids[i % users]
+        record_id = make_uuid(rng)
+        keep(user_id, 'todos', record_id)
+        due = (now + datetime.timedelta(days=rng.randrange(-30, 60))).date().isoformat()
+        data = {'title': sentence(rng, 5), 'is_completed': rng.random() < 0.4, 'due_date': due,
+                'priority': rng.choice(('low', 'medium', 'high')), 'user_id': user_id}
+        return RESOURCES['todos']['insert_values'](data, record_id, created)
+    insert(RESOURCES['todos']['insert_sql'], todo, counts['todos'])
+
+    counts['users'] = users
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    return counts, ids
+
+
+def multipart(filename, content, field='file'):
+    """构造只包含一个文件字段的 multipart/form-data 请求体，返回 (请求体, Content-Type)"""
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n').encode('utf-8') + content + \
+        f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class Context:
+    """
+    请求生成所需的共享状态：各用户的令牌、保留的id、已上传的文件，以及压测中新建、待删除的记录
+
+    压测时多个线程共用，新建记录的id放在线程安全的deque中
+    """
+
+    def __init__(self, ids, tokens):
+        self.ids = ids
+        self.user_ids = sorted(ids)
+        self.tokens = tokens  # user_id -> {'access_token', 'refresh_token'}
+        self.uploads = []     # (user_id, 文件名)
+        self.created = {resource: deque() for resource in ('journals', 'todos')}
+        self.refresh_tokens = {user_id: deque([token['refresh_token']]) for user_id, token in tokens.items()}
+        self._counter = iter(range(1 << 62))
+        self._lock = threading.Lock()
+
+    def next_number(self):
+        with self._lock:
+            return next(self._counter)
+
+    def auth(self, user_id):
+        return {'Authorization': 'Bearer ' + self.tokens[user_id]['access_token']}
+
+
+def login_all(client, user_ids):
+    tokens = {}
+    for user_id in user_ids:
+        index = user_id.rsplit('-', 1)[1]
+        response = client.post('/api/auth/login', json={'email': f'bench{index}@example.com',
+                                                        'password': BENCH_PASSWORD})
+        tokens[user_id] = response.get_json()
+    return tokens
+
+
+def seed_uploads(client, ctx, count, size, rng):
+    for index in range(count):
+        user_id = ctx.user_ids[index % len(ctx.user_ids)]
+        body, content_type = multipart(f'bench-{index}.txt', rng.randbytes(size))
+        response = client.post('/api/upload', data=body, content_type=content_type, headers=ctx.auth(user_id))
+        ctx.uploads.append((user_id, response.get_json()['filename'].split('/', 1)[1]))
+
+
+# ---------------------------------------------------------------------------
+# 路由与请求生成
+#
+# 每个请求生成函数返回 (方法, 路径, JSON请求体或(字节, Content-Type), 请求头, 完成回调) 或 None（本次跳过）；
+# 完成回调在请求成功后收到响应JSON，用于记录新建的id、轮换后的刷新令牌等
+
+
+def _user(ctx, rng):
+    return rng.choice(ctx.user_ids)
+
+
+def _pick(ctx, rng, user_id, resource):
+    return rng.choice(ctx.ids[user_id][resource])
+
+
+def r_register(ctx, rng):
+    number = ctx.next_number()
+    return 'POST', '/api/auth/register', {'username': f'bench-new-{number}', 'email': f'new{number}@example.com',
+                                          'password': BENCH_PASSWORD}, {}, None
+
+
+def r_login(ctx, rng):
+    index = _user(ctx, rng).rsplit('-', 1)[1]
+    return 'POST', '/api/auth/login', {'email': f'bench{index}@example.com', 'password': BENCH_PASSWORD}, {}, None
+
+
+def r_refresh(ctx, rng):
+    user_id = _user(ctx, rng)
+    try:
+        token = ctx.refresh_tokens[user_id].popleft()
+    except IndexError:
+        return None
+    return 'POST', '/api/auth/refresh', {'refresh_token': token}, {}, \
+        lambda data: ctx.refresh_tokens[user_id].append(data['refresh_token'])
+
+
+def r_journals_page(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', '/api/journals?limit=50', None, ctx.auth(user_id), None
+
+
+def r_journals_full(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', '/api/journals', None, ctx.auth(user_id), None
+
+
+def r_journals_tag(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', f'/api/journals?tag={rng.choice(TAGS)}&limit=50', None, ctx.auth(user_id), None
+
+
+def r_journal_get(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', f'/api/journals/{_pick(ctx, rng, user_id, "journals")}', None, ctx.auth(user_id), None
+
+
+def r_journal_create(ctx, rng):
+    user_id = _user(ctx, rng)
+    body = {'title': sentence(rng, 4), 'content': sentence(rng, 40), 'tags': rng.sample(TAGS, 2),
+            'categoryId': ''}
+    return 'POST', '/api/journals', body, ctx.auth(user_id), \
+        lambda data: ctx.created['journals'].append((user_id, data['id']))
+
+
+def r_journal_update(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'PUT', f'/api/journals/{_pick(ctx, rng, user_id, "journals")}', {'title': sentence(rng, 4)}, \
+        ctx.auth(user_id), None
+
+
+def r_journal_delete(ctx, rng):
+    try:
+        user_id, journal_id = ctx.created['journals'].popleft()
+    except IndexError:
+        return None
+    return 'DELETE', f'/api/journals/{journal_id}', None, ctx.auth(user_id), None
+
+
+def r_search(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', f'/api/journals/search?q={rng.choice(WORDS[:24])}&limit=20', None, ctx.auth(user_id), None
+
+
+def r_tags(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', '/api/tags', None, ctx.auth(user_id), None
+
+
+def r_categories(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', '/api/categories', None, ctx.auth(user_id), None
+
+
+def r_category_create(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'POST', '/api/categories', {'name': f'category {ctx.next_number()}', 'type': 'journal'}, \
+        ctx.auth(user_id), None
+
+
+def r_habits(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', '/api/habits?include=stats', None, ctx.auth(user_id), None
+
+
+def r_habit_get(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', f'/api/habits/{_pick(ctx, rng, user_id, "habits")}', None, ctx.auth(user_id), None
+
+
+def r_habit_checkins(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', f'/api/habits/{_pick(ctx, rng, user_id, "habits")}/checkins?from=2024-01-01', None, \
+        ctx.auth(user_id), None
+
+
+def r_checkin(ctx, rng):
+    user_id = _user(ctx, rng)
+    day = (datetime.date(2025, 1, 1) + datetime.timedelta(days=rng.randrange(365))).isoformat()
+    body = {'checkins': [{'habit_id': _pick(ctx, rng, user_id, 'habits'), 'date': day}]}
+    return 'POST', '/api/checkins', body, ctx.auth(user_id), None
+
+
+def r_todos(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', '/api/todos?limit=50', None, ctx.auth(user_id), None
+
+
+def r_todo_get(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', f'/api/todos/{_pick(ctx, rng, user_id, "todos")}', None, ctx.auth(user_id), None
+
+
+def r_todo_create(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'POST', '/api/todos', {'title': sentence(rng, 5), 'priority': 'high'}, ctx.auth(user_id), \
+        lambda data: ctx.created['todos'].append((user_id, data['id']))
+
+
+def r_todo_update(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'PUT', f'/api/todos/{_pick(ctx, rng, user_id, "todos")}', {'isCompleted': rng.random() < 0.5}, \
+        ctx.auth(user_id), None
+
+
+def r_todo_delete(ctx, rng):
+    try:
+        user_id, todo_id = ctx.created['todos'].popleft()
+    except IndexError:
+        return None
+    return 'DELETE', f'/api/todos/{todo_id}', None, ctx.auth(user_id), None
+
+
+def r_batch(ctx, rng):
+    user_id = _user(ctx, rng)
+    operations = [{'op': 'create', 'resource': 'todos', 'data': {'title': sentence(rng, 3)}} for _ in range(5)]
+    operations += [{'op': 'update', 'resource': 'journals', 'id': _pick(ctx, rng, user_id, 'journals'),
+                    'data': {'title': sentence(rng, 3)}}]
+    return 'POST', '/api/batch', {'operations': operations}, ctx.auth(user_id), None
+
+
+def r_sync(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', '/api/sync', None, ctx.auth(user_id), None
+
+
+def r_stats(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'GET', '/api/stats', None, ctx.auth(user_id), None
+
+
+def r_upload(ctx, rng):
+    user_id = _user(ctx, rng)
+    return 'POST', '/api/upload', multipart('bench.txt', rng.randbytes(8 * 1024)), ctx.auth(user_id), None
+
+
+def r_upload_get(ctx, rng):
+    if not ctx.uploads:
+        return None
+    user_id, filename = rng.choice(ctx.uploads)
+    return 'GET', f'/uploads/{user_id}/{filename}', None, {}, None
+
+
+# (名称, 请求生成函数, 压测中的权重)；权重为0的路由只在 micro 模式中测量。
+# 注册和登录的耗时主要是密码哈希，刷新令牌每次使用后即作废，压测的混合请求中不包含它们
+ROUTES = [
+    ('auth.register', r_register, 0),
+    ('auth.login', r_login, 0),
+    ('auth.refresh', r_refresh, 0),
+    ('journals.page', r_journals_page, 20),
+    ('journals.full', r_journals_full, 2),
+    ('journals.tag', r_journals_tag, 4),
+    ('journals.get', r_journal_get, 15),
+    ('journals.create', r_journal_create, 5),
+    ('journals.update', r_journal_update, 3),
+    ('journals.delete', r_journal_delete, 2),
+    ('journals.search', r_search, 4),
+    ('tags', r_tags, 2),
+    ('categories.list', r_categories, 4),
+    ('categories.create', r_category_create, 1),
+    ('habits.list', r_habits, 5),
+    ('habits.get', r_habit_get, 3),
+    ('habits.checkins', r_habit_checkins, 3),
+    ('checkins.create', r_checkin, 4),
+    ('todos.page', r_todos, 8),
+    ('todos.get', r_todo_get, 5),
+    ('todos.create', r_todo_create, 3),
+    ('todos.update', r_todo_update, 3),
+    ('todos.delete', r_todo_delete, 2),
+    ('batch', r_batch, 2),
+    ('sync', r_sync, 2),
+    ('stats', r_stats, 2),
+    ('upload', r_upload, 1),
+    ('uploads.get', r_upload_get, 5),
+]
+
+
+# ---------------------------------------------------------------------------
+# 统计
+
+
+def percentile(values, fraction):
+    """values 已排序，返回最近秩百分位数"""
+    if not values:
+        return None
+    return values[min(max(math.ceil(fraction * len(values)) - 1, 0), len(values) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    result = {'requests': len(latencies), 'errors': errors,
+              'rps': round(len(latencies) / elapsed, 1) if elapsed else 0.0}
+    if latencies:
+        result.update({
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'max_ms': round(latencies[-1] * 1000, 3),
+        })
+    return result
+
+
+def peak_rss_mb(who):
+    """当前进程（self）或已退出子进程（children）的峰值RSS，单位MB"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN)
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024  # macOS为字节，Linux为KB
+    return round(usage.ru_maxrss / divisor, 1)
+
+
+# ---------------------------------------------------------------------------
+# micro：Flask 测试客户端
+
+
+def run_micro(client, ctx, iterations, warmup, rng, only=None):
+    results = {}
+    for name, generate, _ in ROUTES:
+        if only and name not in only:
+            continue
+        latencies = []
+        errors = 0
+        elapsed = 0.0
+        for index in range(warmup + iterations):
+            spec = generate(ctx, rng)
+            if spec is None:
+                continue
+            method, path, body, headers, on_success = spec
+            kwargs = {'headers': headers}
+            if isinstance(body, tuple):
+                kwargs.update(data=body[0], content_type=body[1])
+            elif body is not None:
+                kwargs['json'] = body
+            started = time.perf_counter()
+            response = client.open(path, method=method, **kwargs)
+            response.get_data()
+            latency = time.perf_counter() - started
+            if response.status_code < 400 and on_success:
+                on_success(response.get_json())
+            if index < warmup:
+                continue
+            elapsed += latency
+            if response.status_code >= 400:
+                errors += 1
+            else:
+                latencies.append(latency)
+        results[name] = summarize(latencies, errors, elapsed)
+    return results
+
+
+# ---------------------------------------------------------------------------
+# load：子进程中的HTTP服务 + 多线程客户端
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def serve(port):
+    """--serve 时在子进程中运行：werkzeug 多线程服务器，收到SIGTERM后退出"""
+    from werkzeug.serving import make_server
+
+    from app import create_app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)  # 不输出每个请求的访问日志
+    server = make_server('127.0.0.1', port, create_app(), threaded=True)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+    server.serve_forever()
+
+
+def start_server(kind, port, config, threads):
+    env = dict(os.environ)
+    env.update({f'MOMENTKEEP_{key}': json.dumps(value) for key, value in config.items()})
+    if kind == 'gunicorn':
+        env.update(MOMENTKEEP_BIND=f'127.0.0.1:{port}', MOMENTKEEP_THREADS=str(threads),
+                   MOMENTKEEP_LOG_LEVEL='error')
+        command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(SERVER_DIR, 'gunicorn.conf.py'), 'wsgi:app']
+    else:
+        command = [sys.executable, os.path.abspath(__file__), '--serve', str(port)]
+    process = subprocess.Popen(command, cwd=SERVER_DIR, env=env)
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{kind} server exited during startup')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f'{kind} server did not start in time')
+
+
+def load_client(port, ctx, routes, weights, deadline, rng, samples):
+    """单个客户端线程：使用长连接按权重随机请求，结果写入 samples[路由名]"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    while time.time() < deadline:
+        name, generate, _ = rng.choices(routes, weights)[0]
+        spec = generate(ctx, rng)
+        if spec is None:
+            continue
+        method, path, body, headers, on_success = spec
+        headers = dict(headers)
+        if isinstance(body, tuple):
+            payload, headers['Content-Type'] = body
+        elif body is not None:
+            payload = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        else:
+            payload = None
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            samples[name][1] += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+            continue
+        latency = time.perf_counter() - started
+        if response.status >= 400:
+            samples[name][1] += 1
+            continue
+        samples[name][0].append(latency)
+        if on_success:
+            on_success(json.loads(data))
+    conn.close()
+
+
+def run_load(kind, ctx, config, clients, duration, threads, seed):
+    routes = [route for route in ROUTES if route[2] > 0]
+    weights = [route[2] for route in routes]
+    port = free_port()
+    process = start_server(kind, port, config, threads)
+    per_client = []
+    try:
+        # 预热：让服务端建立连接池、填充缓存
+        warmup = {name: [[], 0] for name, _, _ in routes}
+        load_client(port, ctx, routes, weights, time.time() + 1, random.Random(seed), warmup)
+
+        deadline = time.time() + duration
+        workers = []
+        for index in range(clients):
+            samples = {name: [[], 0] for name, _, _ in routes}
+            per_client.append(samples)
+            thread = threading.Thread(target=load_client, args=(port, ctx, routes, weights, deadline,
+                                                               random.Random(seed + index + 1), samples))
+            thread.start()
+            workers.append(thread)
+        started = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+
+    results = {}
+    everything = []
+    total_errors = 0
+    for name, _, _ in routes:
+        latencies = [value for samples in per_client for value in samples[name][0]]
+        errors = sum(samples[name][1] for samples in per_client)
+        results[name] = summarize(latencies, errors, elapsed)
+        everything += latencies
+        total_errors += errors
+    return {
+        'server': kind,
+        'clients': clients,
+        'duration': round(elapsed, 2),
+        'routes': results,
+        'total': summarize(everything, total_errors, elapsed),
+        'server_peak_rss_mb': peak_rss_mb('children'),
+    }
+
+
+# ---------------------------------------------------------------------------
+# 结果保存与比较
+
+
+def environment():
+    def git(*args):
+        try:
+            return subprocess.run(['git', *args], cwd=SERVER_DIR, capture_output=True, text=True,
+                                  timeout=10).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+    return {
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git('rev-parse', 'HEAD'),
+        'git_dirty': bool(git('status', '--porcelain', '--', '.')),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def print_table(title, routes):
+    print(f'\n{title}')
+    print(f'{"route":<20} {"requests":>8} {"errors":>6} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    for name, stats in routes.items():
+        print(f'{name:<20} {stats["requests"]:>8} {stats["errors"]:>6} {stats["rps"]:>9} '
+              f'{stats.get("p50_ms", "-"):>8} {stats.get("p95_ms", "-"):>8} {stats.get("p99_ms", "-"):>8}')
+
+
+def compare(baseline, current, threshold, noise_ms=0.5):
+    """
+    比较两次结果中同名路由的 p95，返回变慢超过 threshold（比例）的路由列表
+
+    差值小于 noise_ms 毫秒的变化视为噪声
+    """
+    regressions = []
+    print(f'\ncompared with {baseline["environment"].get("git_commit") or "baseline"}')
+    print(f'{"mode":<6} {"route":<20} {"old p95":>9} {"new p95":>9} {"change":>8}')
+    for mode in ('micro', 'load'):
+        old_routes = (baseline.get(mode) or {}).get('routes', {})
+        new_routes = (current.get(mode) or {}).get('routes', {})
+        for name in new_routes:
+            old = old_routes.get(name, {}).get('p95_ms')
+            new = new_routes[name].get('p95_ms')
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            flag = ''
+            if change > threshold and new - old > noise_ms:
+                regressions.append((mode, name, old, new))
+                flag = '  REGRESSION'
+            print(f'{mode:<6} {name:<20} {old:>9.2f} {new:>9.2f} {change:>+8.1%}{flag}')
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed synthetic data and benchmark every REST API route')
+    parser.add_argument('--rows', type=int, default=10000, help='total synthetic rows (1k to 1M)')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--uploads', type=int, default=50, help='files uploaded through /api/upload')
+    parser.add_argument('--upload-bytes', type=int, default=16 * 1024)
+    parser.add_argument('--content-bytes', type=int, default=512, help='padding added to each journal body')
+    parser.add_argument('--hash-method', default='scrypt:32768:8:1', help='password hash used for seeded users')
+    parser.add_argument('--mode', default='micro,load', help='comma separated: micro, load')
+    parser.add_argument('--routes', default='',
+                        help='comma separated route names for micro mode (default all); '
+                             '*.delete needs the matching *.create')
+    parser.add_argument('--iterations', type=int, default=200, help='requests per route in micro mode')
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='werkzeug')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent client threads in load mode')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', help='baseline JSON written by an earlier --output')
+    parser.add_argument('--threshold', type=float, default=0.1, help='allowed p95 slowdown before failing')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary database directory')
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    modes = set(args.mode.split(','))
+    if 'load' in modes and args.server == 'gunicorn':
+        try:
+            import gunicorn  # noqa: F401
+        except ImportError:
+            sys.exit('gunicorn is not installed, run: pip install gunicorn')
+
+    from app import create_app
+
+    workdir = tempfile.mkdtemp(prefix='momentkeep-bench-api-')
+    database = os.path.join(workdir, 'bench.db')
+    upload_folder = os.path.join(workdir, 'uploads')
+    rng = random.Random(args.seed)
+    results = {'environment': environment(), 'args': {key: value for key, value in vars(args).items()
+                                                     if key not in ('serve', 'output', 'compare')}}
+    try:
+        started = time.perf_counter()
+        counts, ids = seed_rows(database, args.rows, args.users, args.content_bytes, args.hash_method, rng)
+        seed_seconds = time.perf_counter() - started
+
+        config = dict(SERVER_CONFIG, DATABASE=database, UPLOAD_FOLDER=upload_folder,
+                      PASSWORD_HASH_METHOD=args.hash_method)
+        app = create_app(config)
+        client = app.test_client()
+        ctx = Context(ids, login_all(client, sorted(ids)))
+        seed_uploads(client, ctx, args.uploads, args.upload_bytes, rng)
+        results['seed'] = {
+            'rows': counts,
+            'uploads': args.uploads,
+            'seconds': round(seed_seconds, 2),
+            'rows_per_sec': round(sum(counts.values()) / seed_seconds, 1),
+            'database_mb': round(os.path.getsize(database) / 1024 / 1024, 1),
+            'peak_rss_mb': peak_rss_mb('self'),
+        }
+        print(f'seeded {sum(counts.values())} rows ({counts}) in {seed_seconds:.1f}s, '
+              f'database {results["seed"]["database_mb"]} MB')
+
+        if 'micro' in modes:
+            only = set(args.routes.split(',')) if args.routes else None
+            routes = run_micro(client, ctx, args.iterations, args.warmup, random.Random(args.seed), only)
+            results['micro'] = {'routes': routes, 'peak_rss_mb': peak_rss_mb('self')}
+            print_table(f'micro (Flask test client, {args.iterations} sequential requests per route)', routes)
+
+        if 'load' in modes:
+            load = run_load(args.server, ctx, config, args.clients, args.duration, args.threads, args.seed)
+            results['load'] = load
+            print_table(f'load ({load["server"]}, {load["clients"]} client threads, {load["duration"]}s)',
+                        load['routes'])
+            total = load['total']
+            print(f'{"total":<20} {total["requests"]:>8} {total["errors"]:>6} {total["rps"]:>9} '
+                  f'{total.get("p50_ms", "-"):>8} {total.get("p95_ms", "-"):>8} {total.get("p99_ms", "-"):>8}')
+            print(f'server peak RSS: {load["server_peak_rss_mb"]} MB')
+    finally:
+        if args.keep:
+            print(f'database kept in {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f'\nresults written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            print(f'\n{len(regressions)} route(s) slower than the baseline by more than {args.threshold:.0%}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
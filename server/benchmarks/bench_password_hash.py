@@ -0,0 +1,84 @@
+"""
+密码哈希基准
+
+测量不同 scrypt 参数下单次哈希的耗时，以及哈希线程池在不同线程数下的吞吐量，
+用于选择 PASSWORD_HASH_METHOD 和 PASSWORD_HASH_WORKERS。
+
+用法（在server目录下执行）：
+    python benchmarks/bench_password_hash.py [--methods scrypt:16384:8:1,scrypt:32768:8:1] [--workers 1,2,4]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from auth import PasswordHasher, PoolSaturated  # noqa: E402
+
+
+def single_hash_ms(method, repeat):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        generate_password_hash('correct horse battery staple', method)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000
+
+
+def pool_throughput(method, workers, clients, duration):
+    """clients 个线程持续提交校验任务，返回 (每秒完成数, 被拒绝数, 统计)"""
+    hasher = PasswordHasher(method=method, workers=workers, queue_size=workers * 2, timeout=30).start()
+    stored = hasher.hash('correct horse battery staple')
+    deadline = time.monotonic() + duration
+    done = [0]
+    rejected = [0]
+    lock = threading.Lock()
+
+    def client():
+        while time.monotonic() < deadline:
+            try:
+                hasher.verify(stored, 'correct horse battery staple')
+                with lock:
+                    done[0] += 1
+            except PoolSaturated:
+                with lock:
+                    rejected[0] += 1
+                time.sleep(0.01)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return done[0] / duration, rejected[0], hasher.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure password hash cost and pool throughput')
+    parser.add_argument('--methods', default='scrypt:16384:8:1,scrypt:32768:8:1,scrypt:65536:8:1')
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    methods = args.methods.split(',')
+    print(f'{"method":<20} {"hash ms":>9}')
+    for method in methods:
+        print(f'{method:<20} {single_hash_ms(method, args.repeat):>9.1f}')
+
+    print(f'\n{"method":<20} {"workers":>7} {"verify/s":>9} {"rejected":>9} {"wait p95":>9} {"hash p95":>9}')
+    for method in methods:
+        for workers in (int(value) for value in args.workers.split(',')):
+            rate, rejected, stats = pool_throughput(method, workers, args.clients, args.duration)
+            print(f'{method:<20} {workers:>7} {rate:>9.1f} {rejected:>9} '
+                  f'{stats.get("wait_ms_p95", 0):>9.1f} {stats.get("hash_ms_p95", 0):>9.1f}')
+
+
+if __name__ == '__main__':
+    main()
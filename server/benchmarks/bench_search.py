@@ -0,0 +1,124 @@
+"""
+全文检索基准
+
+在临时数据库中写入指定数量的日记（默认100万篇，分属 --users 个用户），
+对若干检索词分别用 journals_fts（trigram索引）和在用户日记上做 LIKE 扫描两种方式查询，
+比较每次查询的耗时。写入时全文索引由触发器同步维护，同时统计写入吞吐。
+
+用法（在server目录下执行）：
+    python benchmarks/bench_search.py [--rows 1000000] [--users 10] [--repeat 5]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import run_migrations  # noqa: E402
+from search import docid_range, match_expression, LIKE_SEARCH_SQL, SEARCH_SQL, _LIKE_TERM  # noqa: E402
+
+COMMON_WORDS = ('morning walk coffee meeting project deadline weekend family dinner movie reading music '
+                'garden rain sunshine travel airport hotel museum beach mountain river bicycle running '
+                '早晨 散步 咖啡 会议 项目 周末 家人 晚餐 电影 阅读 音乐 花园 下雨 阳光 旅行 机场 酒店 博物馆 海边 登山').split()
+# 词频按Zipf分布：常见词排在前面，后面接上大量随机生成的低频词，使命中率接近真实日记
+VOCABULARY_SIZE = 20000
+TAGS = ('work', 'life', 'travel', '旅行', '读书', 'health')
+
+# (检索词, 说明)
+QUERIES = (
+    ('museum', '常见英文词'),
+    ('博物馆', '常见中文词'),
+    ('zebra', '不存在的词'),
+    ('coffee meeting', '两个词同时出现'),
+)
+
+
+def build_vocabulary(rng):
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    words = list(COMMON_WORDS)
+    while len(words) < VOCABULARY_SIZE:
+        words.append(''.join(rng.choice(letters) for _ in range(rng.randint(4, 9))))
+    weights = [1 / rank for rank in range(1, len(words) + 1)]
+    return words, weights
+
+
+def seed(conn, rows, users, batch=20000):
+    rng = random.Random(42)
+    words, weights = build_vocabulary(rng)
+    user_ids = [f'bench-user-{i}' for i in range(users)]
+    inserted = 0
+    started = time.perf_counter()
+    while inserted < rows:
+        count = min(batch, rows - inserted)
+        values = []
+        for _ in range(count):
+            content = ' '.join(rng.choices(words, weights, k=rng.randint(20, 80)))
+            day = f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T08:00:00'
+            values.append((str(uuid.uuid4()), '', ' '.join(rng.choices(words, weights, k=4)), content,
+                           json.dumps(rng.sample(TAGS, rng.randint(0, 2)), ensure_ascii=False),
+                           day, day, day, rng.choice(user_ids)))
+        conn.executemany('INSERT INTO journals (id, category_id, title, content, tags, date, created_at, '
+                         'updated_at, user_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', values)
+        conn.commit()
+        inserted += count
+        print(f'  seeded {inserted}/{rows}', end='\r', flush=True)
+    elapsed = time.perf_counter() - started
+    print(f'seeded {rows} journals in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s, FTS triggers included)')
+    return user_ids[0]
+
+
+def timed(conn, sql, params, repeat):
+    best = None
+    count = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        count = len(conn.execute(sql, params).fetchall())
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare FTS5 search against LIKE scans')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--limit', type=int, default=50)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='momentkeep-search-')
+    database = os.path.join(workdir, 'bench.db')
+    conn = sqlite3.connect(database)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = NORMAL')
+    run_migrations(conn)
+    try:
+        user_id = seed(conn, args.rows, args.users)
+        size = os.path.getsize(database) / 1024 / 1024
+        print(f'database size {size:.0f} MB, ~{args.rows // args.users} journals per user\n')
+
+        print(f'{"query":<16} {"fts ms":>9} {"like ms":>9} {"speedup":>8}  {"hits":>5}  note')
+        for query, note in QUERIES:
+            terms = query.split()
+            fts_ms, fts_hits = timed(conn, SEARCH_SQL,
+                                     (match_expression(terms), *docid_range(conn.cursor(), user_id), args.limit, 0),
+                                     args.repeat)
+            like_sql = LIKE_SEARCH_SQL.format(conditions=' AND '.join(_LIKE_TERM for _ in terms))
+            like_params = [user_id] + [f'%{term}%' for term in terms for _ in range(3)] + [args.limit, 0]
+            like_ms, like_hits = timed(conn, like_sql, like_params, args.repeat)
+            print(f'{query:<16} {fts_ms:>9.2f} {like_ms:>9.2f} {like_ms / fts_ms:>7.1f}x  {fts_hits:>5}  {note}')
+    finally:
+        conn.close()
+        for name in os.listdir(workdir):
+            os.remove(os.path.join(workdir, name))
+        os.rmdir(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+行序列化微基准
+
+对比改造前（按列名逐个读取 sqlite3.Row、json.loads 标签、标准库json编码）
+与改造后（预编译的 RowMapper + 当前JSON提供者）每行的序列化耗时。
+
+用法（在server目录下执行）：
+    python benchmarks/bench_serialization.py [行数]
+"""
+import json
+import os
+import sqlite3
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask  # noqa: E402
+
+from serializers import JOURNAL_MAPPER, install_json_provider, orjson  # noqa: E402
+
+
+def seed(conn, rows):
+    conn.execute('''
+        CREATE TABLE journals (
+            id TEXT PRIMARY KEY, category_id TEXT NOT NULL, title TEXT NOT NULL, content TEXT NOT NULL,
+            tags TEXT NOT NULL, date TEXT NOT NULL, created_at TEXT NOT NULL, updated_at TEXT NOT NULL,
+            user_id TEXT NOT NULL
+        )
+    ''')
+    now = '2024-01-01T00:00:00'
+    content = 'x' * 2048  # 模拟客户端加密后的日记内容
+    conn.executemany(
+        'INSERT INTO journals VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [(str(uuid.uuid4()), 'c', f'title {i}', content, json.dumps(['tag'] if i % 3 else []), now, now, now, 'u')
+         for i in range(rows)]
+    )
+
+
+def legacy_to_dict(journal):
+    return {
+        'id': journal['id'],
+        'category_id': journal['category_id'],
+        'title': journal['title'],
+        'content': journal['content'],
+        'tags': json.loads(journal['tags']),
+        'date': journal['date'],
+        'created_at': journal['created_at'],
+        'updated_at': journal['updated_at'],
+        'user_id': journal['user_id']
+    }
+
+
+def bench(label, fn, rows):
+    best = None
+    for _ in range(5):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{label:<40} {best * 1e6 / rows:8.2f} us/row')
+    return best
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    seed(conn, rows)
+    data = conn.execute('SELECT * FROM journals').fetchall()
+    mapped = conn.execute(f'SELECT {JOURNAL_MAPPER.columns} FROM journals').fetchall()
+
+    app = Flask(__name__)
+    stdlib = install_json_provider(app, 'stdlib')
+
+    def legacy():
+        json.dumps([legacy_to_dict(row) for row in data], separators=(',', ':'), sort_keys=True)
+
+    def mapper_stdlib():
+        stdlib.dumps_bytes([JOURNAL_MAPPER(row) for row in mapped])
+
+    print(f'{rows} journal rows, orjson {"installed" if orjson else "not installed"}')
+    before = bench('before: Row by name + stdlib json', legacy, rows)
+    bench('after:  RowMapper + stdlib json', mapper_stdlib, rows)
+    if orjson is not None:
+        fast = install_json_provider(app, 'orjson')
+        after = bench('after:  RowMapper + orjson', lambda: fast.dumps_bytes([JOURNAL_MAPPER(row) for row in mapped]),
+                      rows)
+        print(f'speedup: {before / after:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+"""
+多进程部署压测
+
+依次以不同的工作进程数启动 gunicorn（gunicorn.conf.py + wsgi:app），用多个客户端进程
+持续请求列表和详情接口，统计每种配置下的吞吐量（请求/秒）和延迟。
+每轮使用同一份预先写入的测试数据库，结束时向gunicorn发送SIGTERM并等待其优雅退出。
+
+用法（在server目录下执行，需要先 pip install gunicorn）：
+    python benchmarks/bench_workers.py [--workers 1,2,4,8] [--threads 4] [--clients 16] [--duration 10]
+"""
+import argparse
+import http.client
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+
+USERS = 20
+JOURNALS_PER_USER = 50
+TODOS_PER_USER = 20
+
+
+def seed(database):
+    from app import create_app, init_db
+
+    init_db(database)
+    app = create_app({'DATABASE': database, 'UPLOAD_FOLDER': os.path.join(os.path.dirname(database), 'uploads')})
+    client = app.test_client()
+    journal_ids = []
+    for user in range(USERS):
+        user_id = f'bench-user-{user}'
+        operations = [{'op': 'create', 'resource': 'journals',
+                       'data': {'title': f'journal {i}', 'content': 'x' * 1024, 'tags': ['bench'],
+                                'date': f'2024-01-{i % 28 + 1:02d}T00:00:00'}}
+                      for i in range(JOURNALS_PER_USER)]
+        operations += [{'op': 'create', 'resource': 'todos', 'data': {'title': f'todo {i}'}}
+                       for i in range(TODOS_PER_USER)]
+        response = client.post('/api/batch', json={'user_id': user_id, 'operations': operations})
+        journal_ids += [result['id'] for result in response.get_json()['results'][:JOURNALS_PER_USER]]
+    return journal_ids
+
+
+def request_paths(journal_ids):
+    paths = []
+    for user in range(USERS):
+        paths.append(f'/api/journals?user_id=bench-user-{user}')
+        paths.append(f'/api/journals?user_id=bench-user-{user}&limit=20')
+        paths.append(f'/api/todos?user_id=bench-user-{user}')
+    paths += [f'/api/journals/{journal_id}' for journal_id in journal_ids[::10]]
+    return paths
+
+
+def client_worker(port, paths, deadline, offset):
+    """单个客户端进程：使用长连接循环请求，返回 (延迟列表, 错误数)"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    latencies = []
+    errors = 0
+    index = offset
+    while time.time() < deadline:
+        path = paths[index % len(paths)]
+        index += 1
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    return latencies, errors
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(port, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited during startup')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('gunicorn did not start in time')
+
+
+def run_round(workers, threads, clients, duration, database, workdir, paths):
+    port = free_port()
+    env = dict(os.environ,
+               MOMENTKEEP_BIND=f'127.0.0.1:{port}',
+               MOMENTKEEP_WORKERS=str(workers),
+               MOMENTKEEP_THREADS=str(threads),
+               MOMENTKEEP_DATABASE=json.dumps(database),
+               MOMENTKEEP_UPLOAD_FOLDER=json.dumps(os.path.join(workdir, 'uploads')),
+               MOMENTKEEP_LOG_LEVEL='warning')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(SERVER_DIR, 'gunicorn.conf.py'), 'wsgi:app'],
+        cwd=SERVER_DIR, env=env
+    )
+    try:
+        wait_until_ready(port, process)
+        # 预热：让每个工作进程建立连接池
+        client_worker(port, paths, time.time() + 1, 0)
+
+        deadline = time.time() + duration
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.starmap(client_worker,
+                                   [(port, paths, deadline, i * 7) for i in range(clients)])
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait(timeout=60)
+
+    latencies = sorted(latency for items, _ in results for latency in items)
+    errors = sum(count for _, count in results)
+    if not latencies:
+        return {'workers': workers, 'requests': 0, 'errors': errors}
+    return {
+        'workers': workers,
+        'threads': threads,
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': round(len(latencies) / duration, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 2),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test gunicorn with increasing worker counts')
+    parser.add_argument('--workers', default='1,2,4,8', help='comma separated worker counts')
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=16, help='concurrent client processes')
+    parser.add_argument('--duration', type=float, default=10, help='seconds per round')
+    args = parser.parse_args()
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        sys.exit('gunicorn is not installed, run: pip install gunicorn')
+
+    workdir = tempfile.mkdtemp(prefix='momentkeep-bench-')
+    try:
+        database = os.path.join(workdir, 'bench.db')
+        paths = request_paths(seed(database))
+        print(f'{"workers":>7} {"threads":>7} {"requests":>9} {"errors":>6} {"req/s":>9} {"p50 ms":>8} {"p95 ms":>8}')
+        for workers in [int(value) for value in args.workers.split(',')]:
+            result = run_round(workers, args.threads, args.clients, args.duration, database, workdir, paths)
+            print(f'{result["workers"]:>7} {args.threads:>7} {result["requests"]:>9} {result["errors"]:>6} '
+                  f'{result.get("rps", 0):>9} {result.get("p50_ms", "-"):>8} {result.get("p95_ms", "-"):>8}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
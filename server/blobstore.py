@@ -0,0 +1,239 @@
+import datetime
+import glob
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+# 按内容寻址的去重文件存储
+#
+# 上传的文件按SHA-256存放在 UPLOAD_FOLDER/.blobs/<前两位>/<完整哈希> 下，相同内容只存一份：
+# - media_blobs: 每个内容一行，refcount 为引用它的文件数
+# - media_files: (user_id, filename) -> sha256，对外的 /uploads/<user_id>/<filename> 通过它找到实际文件
+#
+# 放置新内容、增减引用计数和垃圾回收都在 BEGIN IMMEDIATE 事务中进行，
+# 回收线程删除文件时持有写锁，不会与同时上传相同内容的请求冲突。
+
+BLOB_DIR = '.blobs'
+# 派生图目录（见 thumbnails.py），回收内容时一并删除其派生图
+DERIVATIVE_DIR = '.derivatives'
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# 引用计数归零后至少保留的时间（秒），期间重新上传相同内容可以直接复用
+BLOB_GC_GRACE = 60 * 60
+# 后台回收的执行间隔（秒）
+BLOB_GC_INTERVAL = 60 * 60
+
+
+def blob_path(upload_folder, digest):
+    return os.path.join(upload_folder, BLOB_DIR, digest[:2], digest)
+
+
+def _tmp_dir(upload_folder):
+    return os.path.join(upload_folder, BLOB_DIR, 'tmp')
+
+
+def _now():
+    return datetime.datetime.now().isoformat()
+
+
+def spool_stream(upload_folder, stream):
+    """
+    把上传流按块写入临时文件并同时计算SHA-256，返回 (临时文件路径, 哈希, 大小)
+
+    临时文件与blob目录在同一文件系统，之后可以直接 rename
+    """
+    tmp_dir = _tmp_dir(upload_folder)
+    os.makedirs(tmp_dir, exist_ok=True)
+    path = os.path.join(tmp_dir, str(uuid.uuid4()))
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, 'wb') as f:
+            while True:
+                block = stream.read(STREAM_BLOCK_SIZE)
+                if not block:
+                    break
+                f.write(block)
+                hasher.update(block)
+                size += len(block)
+    except BaseException:
+        _remove(path)
+        raise
+    return path, hasher.hexdigest(), size
+
+
+def store_file(conn, upload_folder, tmp_path, digest, size, user_id, filename):
+    """
+    登记一个已写好并计算过哈希的临时文件，映射为 user_id/filename
+
+    内容已存在时只增加引用计数并删除临时文件，否则把临时文件移动到blob目录；
+    返回内容是否已存在（即本次上传是否被去重）
+    """
+    cursor = conn.cursor()
+    deduplicated = False
+    placed = False
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('UPDATE media_blobs SET refcount = refcount + 1, released_at = NULL WHERE sha256 = ?',
+                       (digest,))
+        deduplicated = cursor.rowcount == 1
+        path = blob_path(upload_folder, digest)
+        if deduplicated and not os.path.exists(path):
+            # 数据库中有记录但文件丢失，用这次上传的内容补上
+            deduplicated = False
+        if not deduplicated:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+            placed = True
+            cursor.execute('''
+                INSERT INTO media_blobs (sha256, size, refcount, created_at, released_at)
+                VALUES (?, ?, 1, ?, NULL)
+                ON CONFLICT (sha256) DO NOTHING
+            ''', (digest, size, _now()))
+        cursor.execute('''
+            INSERT INTO media_files (user_id, filename, sha256, size, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, filename, digest, size, _now()))
+        conn.commit()
+    except BaseException:
+        # 回滚后没有行指向这次放入的文件，垃圾回收找不到它；在回滚（释放写锁）前删除，
+        # 以免误删同时上传相同内容的请求刚放入的文件
+        try:
+            if placed:
+                _remove(path)
+        finally:
+            conn.rollback()
+        raise
+    finally:
+        # 去重或失败时临时文件仍在，移动成功后该路径已不存在
+        _remove(tmp_path)
+    return deduplicated
+
+
+def resolve_file(conn, upload_folder, user_id, filename):
+    """
+    返回 user_id/filename 对应的 (blob路径, SHA-256)，没有映射（旧版直接存放的文件）时返回None
+    """
+    row = conn.execute('SELECT sha256 FROM media_files WHERE user_id = ? AND filename = ?',
+                       (user_id, filename)).fetchone()
+    return (blob_path(upload_folder, row[0]), row[0]) if row else None
+
+
+def release_file(conn, user_id, filename):
+    """
+    删除 user_id/filename 的映射并减少引用计数，返回是否存在该映射
+
+    blob文件本身由垃圾回收在宽限期后删除
+    """
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('SELECT sha256 FROM media_files WHERE user_id = ? AND filename = ?', (user_id, filename))
+        row = cursor.fetchone()
+        if row is None:
+            conn.rollback()
+            return False
+        cursor.execute('DELETE FROM media_files WHERE user_id = ? AND filename = ?', (user_id, filename))
+        cursor.execute('''
+            UPDATE media_blobs
+            SET refcount = refcount - 1,
+                released_at = CASE WHEN refcount = 1 THEN ? ELSE released_at END
+            WHERE sha256 = ?
+        ''', (_now(), row[0]))
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return True
+
+
+def collect_garbage(conn, upload_folder, grace=BLOB_GC_GRACE):
+    """删除引用计数为0且超过宽限期的blob以及遗留的临时文件，返回删除的blob数量"""
+    cutoff = (datetime.datetime.now() - datetime.timedelta(seconds=grace)).isoformat()
+    candidates = [row[0] for row in conn.execute(
+        'SELECT sha256 FROM media_blobs WHERE refcount = 0 AND released_at < ?', (cutoff,)
+    ).fetchall()]
+
+    removed = 0
+    cursor = conn.cursor()
+    for digest in candidates:
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            # 持有写锁后再次确认，期间可能有新的上传引用了该内容
+            cursor.execute('DELETE FROM media_blobs WHERE sha256 = ? AND refcount = 0', (digest,))
+            if cursor.rowcount == 1:
+                _remove(blob_path(upload_folder, digest))
+                for path in glob.glob(os.path.join(upload_folder, DERIVATIVE_DIR, '*', digest[:2], digest + '.*')):
+                    _remove(path)
+                removed += 1
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    # 上传过程中进程退出会留下临时文件
+    tmp_dir = _tmp_dir(upload_folder)
+    if os.path.isdir(tmp_dir):
+        expire_before = time.time() - grace
+        for name in os.listdir(tmp_dir):
+            path = os.path.join(tmp_dir, name)
+            try:
+                if os.path.getmtime(path) < expire_before:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+    return removed
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class BlobCollector:
+    """
+    后台垃圾回收线程
+
+    每个工作进程各启动一个，回收操作在事务中进行，多个进程同时执行也是安全的
+    """
+
+    def __init__(self, get_connection, upload_folder, interval=BLOB_GC_INTERVAL, grace=BLOB_GC_GRACE):
+        self.get_connection = get_connection
+        self.upload_folder = upload_folder
+        self.interval = interval
+        self.grace = grace
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.removed = 0
+        self.last_error = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='blob-gc', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        conn = self.get_connection()
+        try:
+            removed = collect_garbage(conn, self.upload_folder, self.grace)
+        finally:
+            conn.close()
+        self.runs += 1
+        self.removed += removed
+        return removed
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                self.last_error = repr(e)
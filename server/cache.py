@@ -0,0 +1,284 @@
+import threading
+import time
+from collections import OrderedDict
+
+# redis 为可选依赖，仅在多进程部署需要共享缓存时使用（pip install redis）
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+# 列表查询缓存
+#
+# 缓存 GET /api/journals、/api/categories、/api/habits、/api/todos 的响应体和ETag，
+# 键为 (user_id, 资源, 查询参数)；GET /api/tags 归在日记资源下。写接口提交后调用 invalidate(user_id, 资源)
+# 删除该用户该资源的所有缓存项。
+#
+# 为避免“读请求在写入前查询、在失效后才写入缓存”导致旧数据被缓存，
+# 后端维护一个全局失效计数（epoch）：读请求在查询数据库前记录当前epoch，
+# 写入缓存时若epoch已变化则放弃写入。
+#
+# 进程内后端（shared=False）收不到其他工作进程的失效，命中后仍要用ETag中的数据版本
+# （sync.table_version，两次索引查找）与数据库核对，版本变化的缓存项不会被返回（见 app.serve_list）。
+
+
+class MemoryCacheBackend:
+    """
+    进程内的LRU + TTL缓存后端
+
+    每个gunicorn工作进程各自持有一份，其他进程的写入不会使本进程的缓存失效，
+    因此命中的缓存项需要先与数据库中的版本核对；使用 RedisCacheBackend 时可以省去这次核对
+    """
+
+    name = 'memory'
+    shared = False
+
+    def __init__(self, max_entries=2048, ttl=30):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (过期时间, 值, 分组)
+        self._groups = {}              # 分组 -> key集合
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self._evictions = 0
+        self._expirations = 0
+
+    def epoch(self):
+        return self._epoch
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires_at, value, group = item
+            if expires_at < time.monotonic():
+                self._remove(key, group)
+                self._expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set_if_epoch(self, key, value, group, epoch):
+        """epoch未变化时写入缓存，返回是否写入"""
+        with self._lock:
+            if epoch != self._epoch:
+                return False
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._discard_from_group(key, old[2])
+            self._entries[key] = (time.monotonic() + self.ttl, value, group)
+            self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                old_key, (_, _, old_group) = self._entries.popitem(last=False)
+                self._discard_from_group(old_key, old_group)
+                self._evictions += 1
+            return True
+
+    def invalidate_group(self, group):
+        with self._lock:
+            self._epoch += 1
+            for key in self._groups.pop(group, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._groups.clear()
+
+    def _remove(self, key, group):
+        self._entries.pop(key, None)
+        self._discard_from_group(key, group)
+
+    def _discard_from_group(self, key, group):
+        keys = self._groups.get(group)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._groups[group]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': self.name,
+                'size': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+            }
+
+
+class RedisCacheBackend:
+    """
+    基于Redis的共享缓存后端，多个工作进程共用同一份缓存和失效计数
+
+    每个分组用一个Set记录其下的缓存键，失效时一并删除；
+    写入时通过 WATCH epoch 保证与失效操作之间的原子性
+    """
+
+    name = 'redis'
+    shared = True
+
+    def __init__(self, url, ttl=30, prefix='momentkeep:list_cache:'):
+        if redis is None:
+            raise RuntimeError('LIST_CACHE_BACKEND is redis but the redis package is not installed')
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self._epoch_key = prefix + 'epoch'
+
+    def _key(self, key):
+        return self.prefix + 'entry:' + '\x1f'.join(key)
+
+    def _group_key(self, group):
+        return self.prefix + 'group:' + '\x1f'.join(group)
+
+    def epoch(self):
+        return int(self.client.get(self._epoch_key) or 0)
+
+    def get(self, key):
+        raw = self.client.get(self._key(key))
+        if raw is None:
+            return None
+        etag, _, body = raw.partition(b'\n')
+        return etag.decode('utf-8'), body
+
+    def set_if_epoch(self, key, value, group, epoch):
+        etag, body = value
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self._epoch_key)
+                if int(pipe.get(self._epoch_key) or 0) != epoch:
+                    return False
+                pipe.multi()
+                pipe.set(self._key(key), etag.encode('utf-8') + b'\n' + body, ex=self.ttl)
+                pipe.sadd(self._group_key(group), self._key(key))
+                pipe.expire(self._group_key(group), self.ttl)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                return False
+
+    def invalidate_group(self, group):
+        group_key = self._group_key(group)
+        keys = self.client.smembers(group_key)
+        with self.client.pipeline() as pipe:
+            pipe.incr(self._epoch_key)
+            if keys:
+                pipe.delete(*keys)
+            pipe.delete(group_key)
+            pipe.execute()
+
+    def clear(self):
+        keys = list(self.client.scan_iter(self.prefix + '*'))
+        with self.client.pipeline() as pipe:
+            pipe.incr(self._epoch_key)
+            for key in keys:
+                if key != self._epoch_key.encode('utf-8'):
+                    pipe.delete(key)
+            pipe.execute()
+
+    def stats(self):
+        return {'backend': self.name, 'ttl': self.ttl}
+
+
+class ListCache:
+    """
+    列表接口的读穿透缓存
+
+    缓存值为 (etag, 响应体字节)；命中率等指标在这里统计，与后端无关
+    """
+
+    def __init__(self, backend, max_entry_bytes=512 * 1024, enabled=True):
+        self.backend = backend
+        self.max_entry_bytes = max_entry_bytes
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stale_hits': 0, 'stores': 0, 'skipped_stores': 0,
+                       'invalidations': 0}
+
+    def _count(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+    def lookup(self, user_id, resource, variant):
+        """返回 (缓存值或None, 当前epoch)，未命中时应在查询数据库前调用以记录epoch"""
+        if not self.enabled:
+            return None, None
+        epoch = self.backend.epoch()
+        value = self.backend.get((user_id, resource, variant))
+        self._count('hits' if value is not None else 'misses')
+        return value, epoch
+
+    @property
+    def shared(self):
+        """缓存是否由所有工作进程共享（各进程的写入都会使其失效）"""
+        return self.backend.shared
+
+    def is_current(self, value, etag):
+        """缓存值的ETag与数据库当前的ETag一致时返回True，否则记为一次过期命中"""
+        if value[0] == etag:
+            return True
+        self._count('stale_hits')
+        return False
+
+    def store(self, user_id, resource, variant, etag, body, epoch):
+        if not self.enabled or epoch is None:
+            return
+        if len(body) > self.max_entry_bytes:
+            self._count('skipped_stores')
+            return
+        stored = self.backend.set_if_epoch((user_id, resource, variant), (etag, body), (user_id, resource), epoch)
+        self._count('stores' if stored else 'skipped_stores')
+
+    def invalidate(self, user_id, *resources):
+        if not self.enabled:
+            return
+        for resource in resources:
+            self.backend.invalidate_group((user_id, resource))
+            self._count('invalidations')
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_rate'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+        snapshot['enabled'] = self.enabled
+        snapshot.update(self.backend.stats())
+        return snapshot
+
+
+def create_list_cache(config):
+    """根据应用配置创建列表缓存"""
+    ttl = config.get('LIST_CACHE_TTL', 30)
+    if config.get('LIST_CACHE_BACKEND', 'memory') == 'redis':
+        if not config.get('LIST_CACHE_REDIS_URL'):
+            raise RuntimeError('LIST_CACHE_BACKEND is redis but LIST_CACHE_REDIS_URL is not set')
+        backend = RedisCacheBackend(config['LIST_CACHE_REDIS_URL'], ttl=ttl)
+    else:
+        backend = MemoryCacheBackend(max_entries=config.get('LIST_CACHE_MAX_ENTRIES', 2048), ttl=ttl)
+    return ListCache(backend,
+                     max_entry_bytes=config.get('LIST_CACHE_MAX_ENTRY_BYTES', 512 * 1024),
+                     enabled=config.get('LIST_CACHE_ENABLED', True))
+
+
+_list_cache = None
+
+
+def configure_list_cache(config):
+    """根据应用配置创建（或替换）全局列表缓存"""
+    global _list_cache
+    _list_cache = create_list_cache(config)
+    return _list_cache
+
+
+def get_list_cache():
+    if _list_cache is None:
+        raise RuntimeError('List cache is not configured, call configure_list_cache() first')
+    return _list_cache
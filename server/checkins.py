@@ -0,0 +1,288 @@
+import datetime
+
+# 习惯打卡与连续打卡统计
+#
+# habit_checkins 中每个习惯每天最多一条记录（count 为当天打卡次数）。
+# 统计按习惯的周期（frequency）进行：daily 以天、weekly 以周（周一开始）、monthly 以月为一个周期，
+# 周期内有打卡的天数达到目标即视为完成该周期：
+# - daily 的目标固定为1天
+# - weekly / monthly 的目标取 target（客户端的 targetDays），不是正整数时按1天计算
+#
+# 连续打卡次数和历史最长连续次数需要遍历完整的打卡历史，结果缓存在 habit_rollups 中；
+# 打卡记录或习惯的周期设置变化时由触发器删除对应缓存（见 migrations.py 第11个迁移），
+# 下次读取时重新计算。完成率只统计最近一段时间，直接用范围查询读取窗口内的打卡记录。
+
+# 单次批量打卡请求允许的最大记录数
+MAX_CHECKINS_PER_REQUEST = 500
+
+DEFAULT_STATS_WINDOW = 30  # 天
+MAX_STATS_WINDOW = 366
+
+# SQLite单条语句允许的参数个数有限，IN (...) 查询按该大小分块
+_IN_CHUNK_SIZE = 500
+
+_PERIOD_DAYS = {'weekly': 7, 'monthly': 28}
+
+
+def parse_date(value):
+    """解析 YYYY-MM-DD 格式的日期，格式不正确时抛出 ValueError"""
+    if not isinstance(value, str) or len(value) != 10:
+        raise ValueError('Invalid date')
+    return datetime.date.fromisoformat(value)
+
+
+def period_of(frequency, day):
+    """返回日期所在周期的第一天"""
+    if frequency == 'weekly':
+        return day - datetime.timedelta(days=day.weekday())
+    if frequency == 'monthly':
+        return day.replace(day=1)
+    return day
+
+
+def next_period(frequency, start):
+    """返回下一个周期的第一天，start 应为某个周期的第一天"""
+    if frequency == 'weekly':
+        return start + datetime.timedelta(days=7)
+    if frequency == 'monthly':
+        return (start + datetime.timedelta(days=32)).replace(day=1)
+    return start + datetime.timedelta(days=1)
+
+
+def period_target(frequency, target):
+    """每个周期需要打卡的天数"""
+    if frequency not in _PERIOD_DAYS:
+        return 1
+    try:
+        days = int(target)
+    except (TypeError, ValueError):
+        return 1
+    return min(max(days, 1), _PERIOD_DAYS[frequency])
+
+
+def completed_periods(frequency, target, dates):
+    """返回已完成的周期（第一天）的有序列表，dates 为打卡日期"""
+    days_per_period = {}
+    for day in dates:
+        period = period_of(frequency, day)
+        days_per_period[period] = days_per_period.get(period, 0) + 1
+    needed = period_target(frequency, target)
+    return sorted(period for period, days in days_per_period.items() if days >= needed)
+
+
+def compute_rollup(frequency, target, dates):
+    """
+    根据完整的打卡历史计算汇总
+
+    返回 (总打卡天数, 最后打卡日期, 最长连续周期数, 最近一段连续的最后一个周期, 最近一段连续的周期数)
+    """
+    longest = 0
+    run_end = None
+    run_length = 0
+    for period in completed_periods(frequency, target, dates):
+        if run_end is not None and next_period(frequency, run_end) == period:
+            run_length += 1
+        else:
+            run_length = 1
+        run_end = period
+        longest = max(longest, run_length)
+    last_checkin = max(dates).isoformat() if dates else None
+    return len(dates), last_checkin, longest, run_end.isoformat() if run_end else None, run_length
+
+
+def load_rollups(conn, habits):
+    """
+    读取习惯的连续打卡汇总，返回 {habit_id: rollup行}
+
+    habits 为 (id, frequency, target) 的列表；缺少缓存的习惯在一个写事务中重新计算并写回，
+    事务保证计算期间不会有新的打卡记录写入，写回的结果不会比打卡记录旧
+    """
+    rollups = {}
+    ids = [habit_id for habit_id, _, _ in habits]
+    cursor = conn.cursor()
+    for start in range(0, len(ids), _IN_CHUNK_SIZE):
+        chunk = ids[start:start + _IN_CHUNK_SIZE]
+        placeholders = ', '.join('?' for _ in chunk)
+        cursor.execute(f'SELECT habit_id, total_checkins, last_checkin, longest_streak, last_run_end, '
+                       f'last_run_length FROM habit_rollups WHERE habit_id IN ({placeholders})', chunk)
+        rollups.update((row[0], tuple(row[1:])) for row in cursor.fetchall())
+
+    missing = [habit for habit in habits if habit[0] not in rollups]
+    if not missing:
+        return rollups
+
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        for habit_id, frequency, target in missing:
+            cursor.execute('SELECT date FROM habit_checkins WHERE habit_id = ? ORDER BY date', (habit_id,))
+            dates = [datetime.date.fromisoformat(row[0]) for row in cursor.fetchall()]
+            rollup = compute_rollup(frequency, target, dates)
+            cursor.execute('INSERT OR REPLACE INTO habit_rollups (habit_id, total_checkins, last_checkin, '
+                           'longest_streak, last_run_end, last_run_length) VALUES (?, ?, ?, ?, ?, ?)',
+                           (habit_id, *rollup))
+            rollups[habit_id] = rollup
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return rollups
+
+
+def window_checkins(cursor, user_id, first_day, last_day):
+    """返回用户在 [first_day, last_day] 内的打卡日期 {habit_id: [date]}"""
+    cursor.execute('SELECT habit_id, date FROM habit_checkins WHERE user_id = ? AND date BETWEEN ? AND ?',
+                   (user_id, first_day.isoformat(), last_day.isoformat()))
+    result = {}
+    for habit_id, day in cursor.fetchall():
+        result.setdefault(habit_id, []).append(datetime.date.fromisoformat(day))
+    return result
+
+
+def habit_stats(frequency, target, start_date, rollup, recent_dates, today, window):
+    """
+    计算单个习惯的统计
+
+    - current_streak: 截至今天的连续完成周期数；当前周期尚未完成时从上一个周期往前计算
+    - longest_streak: 历史最长连续完成周期数
+    - completion_rate: 最近 window 天（不早于习惯开始日期）内完成的周期占比；
+      当前周期尚未完成时不计入分母
+    """
+    total, last_checkin, longest, run_end, run_length = rollup
+    current_period = period_of(frequency, today)
+    current = 0
+    if run_end is not None:
+        run_end = datetime.date.fromisoformat(run_end)
+        if run_end == current_period or next_period(frequency, run_end) == current_period:
+            current = run_length
+
+    first_day = today - datetime.timedelta(days=window - 1)
+    try:
+        first_day = max(first_day, parse_date(start_date[:10]))
+    except (TypeError, ValueError):
+        pass
+    completed = set(completed_periods(frequency, target, recent_dates))
+    periods = 0
+    met = 0
+    period = period_of(frequency, first_day)
+    while period <= current_period:
+        if period in completed:
+            met += 1
+            periods += 1
+        elif period != current_period:
+            periods += 1
+        period = next_period(frequency, period)
+
+    return {
+        'current_streak': current,
+        'longest_streak': longest,
+        'completion_rate': round(met / periods, 4) if periods else 0.0,
+        'window_days': window,
+        'total_checkins': total,
+        'last_checkin': last_checkin,
+    }
+
+
+def stats_for_habits(conn, user_id, habits, today, window):
+    """
+    为用户的一组习惯计算统计，返回 {habit_id: 统计}
+
+    habits 为 (id, frequency, target, start_date) 的列表
+    """
+    rollups = load_rollups(conn, [(habit_id, frequency, target) for habit_id, frequency, target, _ in habits])
+    # 按月统计时窗口的第一个周期可能从窗口开始之前就已经开始，多读一个月的记录
+    first_day = today - datetime.timedelta(days=window - 1 + 31)
+    recent = window_checkins(conn.cursor(), user_id, first_day, today)
+    return {
+        habit_id: habit_stats(frequency, target, start_date, rollups[habit_id], recent.get(habit_id, []),
+                              today, window)
+        for habit_id, frequency, target, start_date in habits
+    }
+
+
+def parse_stats_args(args):
+    """解析 today 和 window 参数，返回 (today, window)，参数不合法时抛出 ValueError"""
+    today = args.get('today')
+    if today:
+        try:
+            today = parse_date(today)
+        except ValueError:
+            raise ValueError('Invalid today parameter')
+    else:
+        today = datetime.date.today()
+
+    window = args.get('window', DEFAULT_STATS_WINDOW)
+    try:
+        window = int(window)
+    except ValueError:
+        raise ValueError('Invalid window parameter')
+    if window < 1:
+        raise ValueError('Invalid window parameter')
+    return today, min(window, MAX_STATS_WINDOW)
+
+
+def _habit_owners(cursor, ids):
+    """批量查询习惯是否存在，返回 {id: user_id}"""
+    found = {}
+    ids = list(dict.fromkeys(ids))
+    for start in range(0, len(ids), _IN_CHUNK_SIZE):
+        chunk = ids[start:start + _IN_CHUNK_SIZE]
+        placeholders = ', '.join('?' for _ in chunk)
+        cursor.execute(f'SELECT id, user_id FROM habits WHERE id IN ({placeholders})', chunk)
+        found.update((row[0], row[1]) for row in cursor.fetchall())
+    return found
+
+
+def apply_checkins(conn, items, now, remove=False, owner=None):
+    """
+    在一个事务中批量写入（remove=True 时删除）打卡记录
+
+    items 为 {habit_id, date, count(可选，默认1)} 的列表；同一习惯同一天重复打卡时以最后一次的 count 为准。
+    提供 owner 时只能操作该用户的习惯，其他用户的习惯按不存在处理。
+    返回 (每条记录的结果列表, 成功执行的数量)，结果中 status 为 200/201/400/404
+    """
+    results = []
+    valid = []
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict) or not item.get('habit_id'):
+                raise ValueError('Invalid checkin')
+            day = parse_date(item.get('date')).isoformat()
+            count = item.get('count', 1)
+            if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+                raise ValueError('Invalid count')
+        except ValueError as e:
+            results.append({'index': index, 'status': 400, 'error': str(e)})
+            continue
+        result = {'index': index, 'status': 200 if remove else 201, 'habit_id': item['habit_id'], 'date': day}
+        results.append(result)
+        valid.append((result, count))
+
+    applied = 0
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        owners = _habit_owners(cursor, [result['habit_id'] for result, _ in valid])
+        params = []
+        for result, count in valid:
+            user_id = owners.get(result['habit_id'])
+            if user_id is None or (owner is not None and user_id != owner):
+                result['status'] = 404
+                result['error'] = 'Habit not found'
+            elif remove:
+                params.append((result['habit_id'], result['date']))
+            else:
+                params.append((result['habit_id'], result['date'], user_id, count, now))
+        if remove:
+            cursor.executemany('DELETE FROM habit_checkins WHERE habit_id = ? AND date = ?', params)
+        else:
+            cursor.executemany('''
+                INSERT INTO habit_checkins (habit_id, date, user_id, count, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (habit_id, date) DO UPDATE SET count = excluded.count
+            ''', params)
+        applied = len(params)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return results, applied
@@ -0,0 +1,279 @@
+import sqlite3
+import threading
+import time
+
+# 连接池配置
+POOL_MAX_IDLE_PER_THREAD = 2      # 每个线程最多缓存的空闲连接数
+POOL_MAX_LIFETIME = 30 * 60       # 连接最长存活时间（秒），超过后回收重建
+POOL_MAX_USES = 10000             # 单个连接最多被借出的次数，超过后回收重建
+POOL_PING_AFTER = 60              # 空闲超过该时间（秒）的连接在借出前先做一次探活
+
+# 每个新连接执行一次的PRAGMA配置
+# - WAL模式下读者不会被写者阻塞，写者也不会被读者阻塞
+# - WAL模式下synchronous=NORMAL仍能保证数据库一致性，只是断电时可能丢失最后几个事务
+CONNECTION_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('busy_timeout', 5000),        # 毫秒，遇到写锁时等待而不是立即报SQLITE_BUSY
+    ('cache_size', -16000),        # 负数表示KiB，约16MB页缓存
+    ('mmap_size', 128 * 1024 * 1024),
+    ('temp_store', 'MEMORY'),
+)
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """
+    记录语句耗时和行数的游标，recorder 为 metrics.SqlMetrics
+
+    execute 的耗时和写入行数记为一次调用；SELECT 的大部分工作发生在取数时，
+    fetch* 的耗时和读取的行数累加到最后执行的语句上
+    """
+
+    recorder = None
+    _sql = None
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._sql = sql
+            self.recorder.record(sql, time.perf_counter() - started, self.rowcount)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._sql = None
+            self.recorder.record(sql, time.perf_counter() - started, self.rowcount)
+
+    def _fetched(self, started, rows):
+        if self._sql is not None:
+            self.recorder.record(self._sql, time.perf_counter() - started, rows, calls=0)
+        return rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, 0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+
+class PooledConnection(sqlite3.Connection):
+    """
+    连接池中的数据库连接
+
+    调用close()时不会真正关闭连接，而是归还给所属的连接池，
+    因此路由中原有的 conn.close() 写法无需修改
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.created_at = time.monotonic()
+        self.last_used_at = self.created_at
+        self.use_count = 0
+        self.checked_out = False
+
+    def cursor(self, factory=None):
+        """连接池配置了 sql_metrics 时返回记录耗时的游标"""
+        recorder = self.pool.sql_metrics if self.pool is not None else None
+        if factory is not None or recorder is None:
+            return super().cursor(factory or sqlite3.Cursor)
+        cursor = super().cursor(InstrumentedCursor)
+        cursor.recorder = recorder
+        return cursor
+
+    # sqlite3.Connection 的 execute 系列方法不会调用被覆盖的 cursor()，这里显式经过它
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        recorder = self.pool.sql_metrics if self.pool is not None else None
+        if recorder is None:
+            return super().commit()
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            recorder.record('COMMIT', time.perf_counter() - started, 0)
+
+    def close(self):
+        if self.pool is not None and self.checked_out:
+            self.pool.release(self)
+        else:
+            self.discard()
+
+    def discard(self):
+        """真正关闭底层连接"""
+        self.pool = None
+        self.checked_out = False
+        try:
+            sqlite3.Connection.close(self)
+        except sqlite3.Error:
+            pass
+
+
+class ConnectionPool:
+    """
+    按线程复用的SQLite连接池
+
+    每个工作线程维护自己的空闲连接列表，借出和归还都不需要加锁；
+    连接在创建时统一设置PRAGMA，超过存活时间或使用次数的连接会被回收，
+    归还时处于异常状态的连接会被直接丢弃；配置了 sql_metrics 时记录每条语句的耗时和行数
+    """
+
+    def __init__(self, database, max_idle_per_thread=POOL_MAX_IDLE_PER_THREAD,
+                 max_lifetime=POOL_MAX_LIFETIME, max_uses=POOL_MAX_USES,
+                 ping_after=POOL_PING_AFTER, pragmas=CONNECTION_PRAGMAS, sql_metrics=None):
+        self.database = database
+        self.max_idle_per_thread = max_idle_per_thread
+        self.max_lifetime = max_lifetime
+        self.max_uses = max_uses
+        self.ping_after = ping_after
+        self.pragmas = pragmas
+        self.sql_metrics = sql_metrics  # metrics.SqlMetrics，为None时不记录语句耗时
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'created': 0,
+            'recycled': 0,
+            'broken': 0,
+            'released': 0,
+            'in_use': 0,
+        }
+
+    def _idle_list(self):
+        idle = getattr(self._local, 'idle', None)
+        if idle is None:
+            idle = self._local.idle = []
+        return idle
+
+    def _count(self, key, delta=1):
+        with self._stats_lock:
+            self._stats[key] += delta
+
+    def _connect(self):
+        conn = sqlite3.connect(self.database, factory=PooledConnection)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas:
+            conn.execute(f'PRAGMA {name} = {value}')
+        conn.pool = self
+        self._count('created')
+        return conn
+
+    def _is_stale(self, conn, now):
+        return (now - conn.created_at > self.max_lifetime
+                or conn.use_count >= self.max_uses)
+
+    def _is_alive(self, conn, now):
+        if now - conn.last_used_at < self.ping_after:
+            return True
+        try:
+            conn.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self):
+        """借出一个连接，优先复用当前线程的空闲连接"""
+        idle = self._idle_list()
+        now = time.monotonic()
+        conn = None
+        while idle:
+            candidate = idle.pop()
+            if self._is_stale(candidate, now):
+                self._count('recycled')
+                candidate.discard()
+            elif not self._is_alive(candidate, now):
+                self._count('broken')
+                candidate.discard()
+            else:
+                conn = candidate
+                break
+
+        if conn is None:
+            self._count('misses')
+            conn = self._connect()
+        else:
+            self._count('hits')
+
+        conn.pool = self
+        conn.checked_out = True
+        conn.use_count += 1
+        conn.last_used_at = now
+        self._count('in_use')
+        return conn
+
+    def release(self, conn):
+        """归还连接，未提交的事务会被回滚"""
+        conn.checked_out = False
+        conn.last_used_at = time.monotonic()
+        self._count('in_use', -1)
+        self._count('released')
+
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._count('broken')
+            conn.discard()
+            return
+
+        idle = self._idle_list()
+        if len(idle) >= self.max_idle_per_thread or self._is_stale(conn, conn.last_used_at):
+            self._count('recycled')
+            conn.discard()
+            return
+        idle.append(conn)
+
+    def close_thread_connections(self):
+        """关闭当前线程缓存的所有空闲连接（用于线程退出或测试清理）"""
+        idle = self._idle_list()
+        while idle:
+            idle.pop().discard()
+
+    def stats(self):
+        """返回连接池命中/未命中等计数的快照"""
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        total = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_rate'] = round(snapshot['hits'] / total, 4) if total else 0.0
+        snapshot['database'] = self.database
+        return snapshot
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def configure_pool(database, **options):
+    """为指定数据库文件创建（或替换）全局连接池"""
+    global _pool
+    with _pool_lock:
+        _pool = ConnectionPool(database, **options)
+    return _pool
+
+
+def get_pool():
+    if _pool is None:
+        raise RuntimeError('Connection pool is not configured, call configure_pool() first')
+    return _pool
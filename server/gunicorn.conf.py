@@ -0,0 +1,46 @@
+"""
+gunicorn 部署配置
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+进程数、线程数等均可通过环境变量调整，详见 docs/guides/服务端部署文档.md
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('MOMENTKEEP_BIND', '0.0.0.0:5000')
+
+# 工作进程数：SQLite同一时间只允许一个写事务，进程过多只会增加写锁竞争，默认上限为8
+workers = int(os.environ.get('MOMENTKEEP_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+
+# 每个进程的线程数：请求大部分时间在等待SQLite和网络IO，使用gthread让同一进程并发处理多个请求；
+# 连接池按线程复用连接，每个线程各自持有连接
+worker_class = 'gthread'
+threads = int(os.environ.get('MOMENTKEEP_THREADS', 4))
+
+# 优雅停止：收到SIGTERM后不再接受新连接，等待进行中的请求（包括流式列表响应）完成，
+# 超过 graceful_timeout 仍未完成的工作进程才会被强制结束
+graceful_timeout = int(os.environ.get('MOMENTKEEP_GRACEFUL_TIMEOUT', 30))
+timeout = int(os.environ.get('MOMENTKEEP_TIMEOUT', 60))
+keepalive = 5
+
+# 处理一定数量的请求后重启工作进程，避免长时间运行的内存增长；加随机抖动防止所有进程同时重启
+max_requests = int(os.environ.get('MOMENTKEEP_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+
+accesslog = os.environ.get('MOMENTKEEP_ACCESS_LOG')  # 默认不记录访问日志
+errorlog = '-'
+loglevel = os.environ.get('MOMENTKEEP_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    # 在主进程中执行一次表结构升级，工作进程启动时数据库已是最新版本
+    from app import DEFAULT_CONFIG, init_db
+    from flask import Config
+
+    config = Config(os.getcwd())
+    config.update(DEFAULT_CONFIG)
+    config.from_prefixed_env('MOMENTKEEP')
+    init_db(config['DATABASE'])
+    server.log.info('Database schema is up to date: %s', config['DATABASE'])
+
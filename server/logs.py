@@ -0,0 +1,80 @@
+import datetime
+import json
+import logging
+import random
+import sys
+
+# 结构化日志
+#
+# 服务端的日志都记录在 momentkeep 命名空间下（logging.getLogger('momentkeep.xxx')），
+# 每条日志是一个事件名加若干字段，默认输出为单行JSON，便于日志系统检索：
+#     {"ts": "...", "level": "INFO", "logger": "momentkeep.app", "event": "request", "route": "...", ...}
+# 高频的 DEBUG/INFO 日志按 LOG_SAMPLE_RATE 采样输出，WARNING 及以上总是输出。
+
+LOGGER_NAME = 'momentkeep'
+
+
+def get_logger(name):
+    return logging.getLogger(f'{LOGGER_NAME}.{name}')
+
+
+def log_event(logger, level, event, **fields):
+    """记录一个事件，级别未启用时不构造日志记录"""
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={'fields': fields})
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'event': record.getMessage(),
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """开发时使用的 key=value 文本格式"""
+
+    def format(self, record):
+        fields = ' '.join(f'{key}={value}' for key, value in getattr(record, 'fields', {}).items())
+        line = f'{self.formatTime(record)} {record.levelname} {record.name} {record.getMessage()} {fields}'.rstrip()
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    """WARNING 以下的日志按 rate 的概率保留"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self.rate >= 1 or random.random() < self.rate
+
+
+def configure_logging(level='INFO', fmt='json', sample_rate=1.0, stream=None):
+    """
+    配置 momentkeep 命名空间的日志输出，重复调用时替换之前的配置
+
+    fmt 为 'json' 或 'text'；日志不向根logger传播，不会与gunicorn/werkzeug的访问日志混在一起
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    for handler in [handler for handler in logger.handlers if getattr(handler, 'momentkeep', False)]:
+        logger.removeHandler(handler)
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.momentkeep = True
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+    handler.addFilter(SamplingFilter(sample_rate))
+    logger.addHandler(handler)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    return logger
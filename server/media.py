@@ -0,0 +1,76 @@
+import mimetypes
+import os
+import re
+
+from flask import current_app, request, send_file
+
+# 上传文件的HTTP服务
+#
+# - 去重存储中的文件以内容哈希作为强ETag，旧版文件沿用Werkzeug基于mtime/大小的ETag
+# - 文件名以uuid开头的文件内容永不改变（重新上传会得到新的文件名），返回一年有效期的 immutable 缓存头，
+#   客户端无需再次验证；其他文件每次使用前都需要用ETag验证
+# - 支持 Range / If-Range，音视频可以直接拖动进度
+# - 配置 MEDIA_SENDFILE 后由前置代理直接发送文件内容，Python进程只负责查找和返回响应头：
+#     'x-sendfile'        Apache mod_xsendfile / lighttpd，响应头中是文件的绝对路径
+#     'x-accel-redirect'  nginx，响应头中是 MEDIA_ACCEL_PREFIX + 相对于 UPLOAD_FOLDER 的路径，
+#                         需要在nginx中把该前缀配置为指向 UPLOAD_FOLDER 的 internal location
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# upload_file 生成的文件名：<uuid4>_<原文件名>
+_UUID_NAME = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}_')
+
+
+def is_immutable_name(filename):
+    return _UUID_NAME.match(filename) is not None
+
+
+def serve_media(path, filename, digest=None, mimetype=None):
+    """
+    返回文件 path 的响应，filename 用于推断Content-Type和决定缓存策略
+
+    digest 为内容的SHA-256（去重存储中的文件），用作强ETag；
+    mimetype 为空时按 filename 推断
+    """
+    mode = current_app.config.get('MEDIA_SENDFILE')
+    mimetype = mimetype or mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    immutable = is_immutable_name(filename)
+    max_age = IMMUTABLE_MAX_AGE if immutable else None
+    etag = digest or True
+
+    if mode == 'x-accel-redirect':
+        response = _accel_redirect(path, mimetype, etag, max_age)
+    else:
+        # 'x-sendfile' 模式由 create_app() 打开Flask的 USE_X_SENDFILE，send_file 只返回响应头
+        response = send_file(path, mimetype=mimetype, conditional=True, etag=etag, max_age=max_age)
+
+    if immutable:
+        response.cache_control.immutable = True
+    return response
+
+
+def _accel_redirect(path, mimetype, etag, max_age):
+    # 条件请求在这里处理，命中时直接返回304，不必再经过nginx读取文件；
+    # Range请求由nginx根据实际文件处理
+    stat = os.stat(path)
+    response = current_app.response_class(mimetype=mimetype)
+    response.last_modified = stat.st_mtime
+    if isinstance(etag, str):
+        response.set_etag(etag)
+    else:
+        response.set_etag(f'{stat.st_mtime}-{stat.st_size}')
+    if max_age is not None:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+
+    response = response.make_conditional(request.environ)
+    if response.status_code == 304:
+        return response
+
+    relative = os.path.relpath(path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+    response.headers['X-Accel-Redirect'] = current_app.config['MEDIA_ACCEL_PREFIX'].rstrip('/') + '/' + relative
+    # 内容长度由nginx填写
+    response.headers.pop('Content-Length', None)
+    return response
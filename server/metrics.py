@@ -0,0 +1,245 @@
+import bisect
+import functools
+import hashlib
+import re
+import threading
+import time
+
+# 请求与SQL指标
+#
+# 请求结束时按 (路由模板, 方法) 记录耗时、请求体和响应体大小的直方图，按状态码计数；
+# 连接池借出的连接（见 db.py）在每条语句执行和取数时记录耗时和行数，按语句形状汇总。
+# GET /metrics 以 Prometheus 文本格式输出，/admin/sql_stats 返回最慢的语句形状。
+#
+# 记录只是在锁内更新几个计数，不做任何I/O；指标保存在各工作进程内存中，
+# 多进程部署时每次抓取只能看到其中一个进程的数据（见部署文档）。
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # 秒
+SIZE_BUCKETS = (128, 1024, 8 * 1024, 64 * 1024, 512 * 1024, 4 * 1024 * 1024, 32 * 1024 * 1024)  # 字节
+
+# 超过该数量的语句形状归入 OTHER_SHAPE，防止拼接了变长内容的语句让指标无限增长
+MAX_SQL_SHAPES = 500
+OTHER_SHAPE = '<other>'
+
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+\b')
+_WHITESPACE = re.compile(r'\s+')
+
+
+@functools.lru_cache(maxsize=2048)
+def sql_shape(sql):
+    """
+    返回 (语句形状, 形状id)
+
+    压缩空白，把字面量替换为 ?，把 IN (?, ?, ...) 等变长占位符列表合并为 (?, ...)，
+    同一查询不同参数个数的调用归为同一形状
+    """
+    shape = _WHITESPACE.sub(' ', sql).strip()
+    shape = _STRING_LITERAL.sub('?', shape)
+    shape = _NUMBER_LITERAL.sub('?', shape)
+    shape = _IN_LIST.sub('(?, ...)', shape)
+    return shape, hashlib.sha1(shape.encode('utf-8')).hexdigest()[:12]
+
+
+class Histogram:
+    """固定分桶的直方图，不加锁，由持有者负责同步"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def copy(self):
+        copy = Histogram(self.buckets)
+        copy.counts = list(self.counts)
+        copy.sum = self.sum
+        copy.count = self.count
+        return copy
+
+    def samples(self):
+        """返回 (le, 累计数) 列表，最后一项为 +Inf"""
+        cumulative = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            cumulative += count
+            result.append(('+Inf' if bound == float('inf') else repr(bound), cumulative))
+        return result
+
+
+class RequestMetrics:
+    """按 (路由, 方法) 统计的请求耗时、大小和状态码"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._routes = {}    # (路由, 方法) -> [耗时, 请求大小, 响应大小]
+        self._statuses = {}  # (路由, 方法, 状态码) -> 次数
+
+    def observe(self, route, method, status, seconds, request_bytes, response_bytes):
+        key = (route, method)
+        with self._lock:
+            histograms = self._routes.get(key)
+            if histograms is None:
+                histograms = self._routes[key] = [Histogram(DURATION_BUCKETS), Histogram(SIZE_BUCKETS),
+                                                  Histogram(SIZE_BUCKETS)]
+            histograms[0].observe(seconds)
+            histograms[1].observe(request_bytes)
+            if response_bytes is not None:  # 流式响应的大小在这里还不知道
+                histograms[2].observe(response_bytes)
+            status_key = (route, method, status)
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            routes = {key: [h.copy() for h in histograms] for key, histograms in self._routes.items()}
+            return routes, dict(self._statuses)
+
+
+class SqlMetrics:
+    """
+    按语句形状汇总的SQL耗时和行数
+
+    execute 记录一次调用，取数（fetch*）的耗时和行数累加到游标最后执行的语句上；
+    当前线程处理的请求内的语句数和总耗时另外累计，用于请求日志
+    """
+
+    def __init__(self, max_shapes=MAX_SQL_SHAPES):
+        self.max_shapes = max_shapes
+        self._lock = threading.Lock()
+        self._shapes = {}  # 形状 -> [形状id, 调用次数, 总耗时, 最长耗时, 行数]
+        self._durations = Histogram(DURATION_BUCKETS)
+        self._local = threading.local()
+
+    def record(self, sql, seconds, rows, calls=1):
+        shape, shape_id = sql_shape(sql)
+        with self._lock:
+            entry = self._shapes.get(shape)
+            if entry is None:
+                if len(self._shapes) >= self.max_shapes:
+                    shape, shape_id = OTHER_SHAPE, OTHER_SHAPE
+                    entry = self._shapes.get(shape)
+                if entry is None:
+                    entry = self._shapes[shape] = [shape_id, 0, 0.0, 0.0, 0]
+            entry[1] += calls
+            entry[2] += seconds
+            entry[3] = max(entry[3], seconds)
+            entry[4] += max(rows, 0)
+            if calls:
+                self._durations.observe(seconds)
+        local = self._local
+        local.count = getattr(local, 'count', 0) + calls
+        local.seconds = getattr(local, 'seconds', 0.0) + seconds
+
+    def begin_request(self):
+        self._local.count = 0
+        self._local.seconds = 0.0
+
+    def request_totals(self):
+        """返回当前线程自 begin_request() 以来的 (语句数, 总耗时)"""
+        return getattr(self._local, 'count', 0), getattr(self._local, 'seconds', 0.0)
+
+    def snapshot(self):
+        with self._lock:
+            return self._durations.copy(), {shape: list(entry) for shape, entry in self._shapes.items()}
+
+    def slowest(self, limit=20, order='total'):
+        """返回按总耗时（total）、单次最长耗时（max）或平均耗时（avg）排序的语句形状"""
+        _, shapes = self.snapshot()
+        items = [{
+            'id': shape_id,
+            'sql': shape,
+            'calls': calls,
+            'total_ms': round(seconds * 1000, 3),
+            'avg_ms': round(seconds / calls * 1000, 3) if calls else 0.0,
+            'max_ms': round(longest * 1000, 3),
+            'rows': rows,
+        } for shape, (shape_id, calls, seconds, longest, rows) in shapes.items()]
+        items.sort(key=lambda item: item[f'{order}_ms'], reverse=True)
+        return items[:limit]
+
+
+class Metrics:
+    """一个工作进程的全部指标"""
+
+    def __init__(self, max_sql_shapes=MAX_SQL_SHAPES):
+        self.requests = RequestMetrics()
+        self.sql = SqlMetrics(max_sql_shapes)
+        self.started_at = time.time()
+
+    def render(self, extra=()):
+        """
+        以 Prometheus 文本格式输出全部指标
+
+        extra 为 (名称, 类型, 说明, 值) 的列表，用于附带连接池、缓存等组件自己维护的计数和状态；
+        类型为 histogram 时值为 Histogram
+        """
+        lines = []
+        routes, statuses = self.requests.snapshot()
+
+        _header(lines, 'momentkeep_http_requests_total', 'counter', 'HTTP requests by route, method and status')
+        for (route, method, status), count in sorted(statuses.items()):
+            lines.append(f'momentkeep_http_requests_total{_labels(route=route, method=method, status=status)} '
+                         f'{count}')
+
+        for index, name, help_text in ((0, 'momentkeep_http_request_duration_seconds', 'HTTP request latency'),
+                                       (1, 'momentkeep_http_request_size_bytes', 'HTTP request body size'),
+                                       (2, 'momentkeep_http_response_size_bytes', 'HTTP response body size')):
+            _header(lines, name, 'histogram', help_text)
+            for (route, method), histograms in sorted(routes.items()):
+                _histogram(lines, name, histograms[index], route=route, method=method)
+
+        durations, shapes = self.sql.snapshot()
+        _header(lines, 'momentkeep_sql_statement_duration_seconds', 'histogram', 'SQLite statement execution time')
+        _histogram(lines, 'momentkeep_sql_statement_duration_seconds', durations)
+
+        # 语句全文见 /admin/sql_stats，这里只用形状id作为标签
+        for suffix, index, kind, help_text in (('calls_total', 1, 'counter', 'SQL statement executions by shape'),
+                                               ('seconds_total', 2, 'counter', 'SQL time by shape'),
+                                               ('rows_total', 4, 'counter', 'Rows read or written by shape')):
+            name = f'momentkeep_sql_{suffix}'
+            _header(lines, name, kind, help_text)
+            for entry in sorted(shapes.values()):
+                lines.append(f'{name}{_labels(query=entry[0])} {_number(entry[index])}')
+
+        _header(lines, 'momentkeep_process_start_time_seconds', 'gauge', 'Worker process start time')
+        lines.append(f'momentkeep_process_start_time_seconds {self.started_at:.3f}')
+        for name, kind, help_text, value in extra:
+            _header(lines, name, kind, help_text)
+            if kind == 'histogram':
+                _histogram(lines, name, value)
+            else:
+                lines.append(f'{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def _header(lines, name, kind, help_text):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {kind}')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _histogram(lines, name, histogram, **labels):
+    for bound, count in histogram.samples():
+        lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {count}')
+    suffix = _labels(**labels) if labels else ''
+    lines.append(f'{name}_sum{suffix} {_number(histogram.sum)}')
+    lines.append(f'{name}_count{suffix} {histogram.count}')
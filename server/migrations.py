@@ -0,0 +1,850 @@
+import re
+import sqlite3
+import sys
+
+# 数据库结构迁移
+#
+# 每个迁移由 (版本号, 说明, SQL语句列表) 组成，版本号必须严格递增。
+# 当前数据库的结构版本记录在 PRAGMA user_version 中，
+# run_migrations() 只会执行版本号大于该值的迁移，每个迁移在独立事务中完成。
+# 新增表、索引或字段时只需在 MIGRATIONS 末尾追加新的迁移，不要修改已发布的迁移。
+
+# 参与增量同步的用户数据表
+SYNC_TABLES = ('journals', 'categories', 'habits', 'todos')
+
+
+def _sync_tracking_statements(table):
+    """
+    为数据表添加同步序号列和维护触发器
+
+    每次插入或更新都会从全局计数器 sync_state.seq 取得一个新的序号写入 sync_seq，
+    删除时在 sync_tombstones 中记录墓碑，客户端据此只拉取序号大于上次同步位置的变更
+    """
+    next_seq = 'UPDATE sync_state SET seq = seq + 1 WHERE id = 1'
+    current_seq = '(SELECT seq FROM sync_state WHERE id = 1)'
+    return [
+        f'ALTER TABLE {table} ADD COLUMN sync_seq INTEGER NOT NULL DEFAULT 0',
+        f'CREATE INDEX IF NOT EXISTS idx_{table}_user_sync ON {table} (user_id, sync_seq)',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_insert AFTER INSERT ON {table}
+        BEGIN
+            {next_seq};
+            UPDATE {table} SET sync_seq = {current_seq} WHERE rowid = NEW.rowid;
+        END
+        ''',
+        # 触发器自身对sync_seq的更新不应再次触发，因此只在sync_seq未变化时执行
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_update AFTER UPDATE ON {table}
+        WHEN NEW.sync_seq IS OLD.sync_seq
+        BEGIN
+            {next_seq};
+            UPDATE {table} SET sync_seq = {current_seq} WHERE rowid = NEW.rowid;
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_sync_delete AFTER DELETE ON {table}
+        BEGIN
+            {next_seq};
+            INSERT OR REPLACE INTO sync_tombstones (resource, id, user_id, sync_seq, deleted_at)
+            VALUES ('{table}', OLD.id, OLD.user_id, {current_seq},
+                    strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime'));
+        END
+        ''',
+    ]
+
+
+def searchable_content_sql(column):
+    """
+    日记内容中可以建立全文索引的部分
+
+    客户端加密后的内容是纯Base64字符串（见 lib/core/utils/encryption_helper.dart），对其建索引没有意义：
+    只含Base64字符、长度为4的倍数且不短于16个字符的内容视为密文，返回空字符串
+    """
+    return (f"CASE WHEN {column} GLOB '*[^A-Za-z0-9+/=]*' OR length({column}) % 4 != 0 "
+            f"OR length({column}) < 16 THEN {column} ELSE '' END")
+
+
+# 每个用户的全文索引docid占用一段连续区间：用户序号 * 2^32 起的 2^32 个值
+SEARCH_DOCID_SPAN = 1 << 32
+
+
+def search_docid_sql(user_id):
+    """为 user_id（SQL表达式）的新日记分配全文索引docid：该用户区间内当前最大值加一"""
+    base = f'((SELECT ordinal FROM journal_search_users WHERE user_id = {user_id}) * {SEARCH_DOCID_SPAN})'
+    return (f'(COALESCE((SELECT MAX(docid) FROM journal_search_docs '
+            f'WHERE docid BETWEEN {base} AND {base} + {SEARCH_DOCID_SPAN - 1}), {base}) + 1)')
+
+
+def _search_index_statements():
+    """
+    日记全文索引 journals_fts 及其维护触发器
+
+    journals 的主键是文本id，其rowid在VACUUM后可能变化，因此由 journal_search_docs
+    为每篇日记分配稳定的docid作为 journals_fts 的rowid。docid按用户分区间分配
+    （见 search_docid_sql），检索时用 rowid BETWEEN 限定到当前用户，
+    FTS5只遍历该用户的文档，而不是先匹配所有用户的日记再过滤。
+    使用trigram分词，中文等不以空格分词的文本也能按任意子串（不少于3个字符）检索
+    """
+    docid = '(SELECT docid FROM journal_search_docs WHERE journal_id = {}.id)'
+    insert_document = f"""
+            INSERT OR IGNORE INTO journal_search_users (user_id) VALUES (NEW.user_id);
+            INSERT INTO journal_search_docs (docid, journal_id) VALUES ({search_docid_sql('NEW.user_id')}, NEW.id);
+            INSERT INTO journals_fts (rowid, title, tags, content)
+            VALUES (last_insert_rowid(), NEW.title, NEW.tags, {searchable_content_sql('NEW.content')});
+    """
+    delete_document = f"""
+            DELETE FROM journals_fts WHERE rowid = {docid.format('OLD')};
+            DELETE FROM journal_search_docs WHERE journal_id = OLD.id;
+    """
+    return [
+        """
+        CREATE TABLE IF NOT EXISTS journal_search_users (
+            ordinal INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL UNIQUE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS journal_search_docs (
+            docid INTEGER PRIMARY KEY,
+            journal_id TEXT NOT NULL UNIQUE
+        )
+        """,
+        "CREATE VIRTUAL TABLE IF NOT EXISTS journals_fts USING fts5(title, tags, content, tokenize = 'trigram')",
+        # 排序权重：标题 > 标签 > 正文
+        "INSERT INTO journals_fts (journals_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_journals_search_insert AFTER INSERT ON journals
+        BEGIN
+            {insert_document}
+        END
+        """,
+        # 尚未回填到索引中的日记（journal_search_docs 中没有记录）更新时不做处理，由回填命令补上
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_journals_search_update AFTER UPDATE OF title, tags, content ON journals
+        WHEN NEW.user_id IS OLD.user_id
+        BEGIN
+            UPDATE journals_fts
+            SET title = NEW.title, tags = NEW.tags, content = {searchable_content_sql('NEW.content')}
+            WHERE rowid = {docid.format('NEW')};
+        END
+        """,
+        # 日记换了所属用户时docid需要移到新用户的区间
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_journals_search_move AFTER UPDATE OF user_id ON journals
+        WHEN NEW.user_id IS NOT OLD.user_id
+             AND EXISTS (SELECT 1 FROM journal_search_docs WHERE journal_id = OLD.id)
+        BEGIN
+            {delete_document}
+            {insert_document}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_journals_search_delete AFTER DELETE ON journals
+        BEGIN
+            {delete_document}
+        END
+        """,
+    ]
+
+
+def _tag_index_statements():
+    """
+    日记标签索引 journal_tags 及其维护触发器
+
+    journals.tags 仍以JSON数组保存（接口和同步按原样返回），触发器在写入时把数组展开为
+    每个标签一行，按标签过滤和统计时只需查索引，不必逐行解析JSON。
+    tags 不是合法JSON或其中的元素不是字符串时忽略，重复的标签只记录一次
+    """
+    tags = "json_each(CASE WHEN json_valid(NEW.tags) THEN NEW.tags ELSE '[]' END)"
+    insert_tags = f"""
+            INSERT OR IGNORE INTO journal_tags (journal_id, tag, user_id)
+            SELECT NEW.id, value, NEW.user_id FROM {tags} WHERE type = 'text';
+    """
+    return [
+        """
+        CREATE TABLE IF NOT EXISTS journal_tags (
+            journal_id TEXT NOT NULL,
+            tag TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            PRIMARY KEY (journal_id, tag)
+        ) WITHOUT ROWID
+        """,
+        'CREATE INDEX IF NOT EXISTS idx_journal_tags_user_tag ON journal_tags (user_id, tag, journal_id)',
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_journals_tags_insert AFTER INSERT ON journals
+        BEGIN
+            {insert_tags}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_journals_tags_update AFTER UPDATE OF tags, user_id ON journals
+        BEGIN
+            DELETE FROM journal_tags WHERE journal_id = OLD.id;
+            {insert_tags}
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_journals_tags_delete AFTER DELETE ON journals
+        BEGIN
+            DELETE FROM journal_tags WHERE journal_id = OLD.id;
+        END
+        """,
+        # 已有日记的标签在迁移中一次性展开：只读取tags列，比全文索引的回填轻得多
+        """
+        INSERT OR IGNORE INTO journal_tags (journal_id, tag, user_id)
+        SELECT j.id, t.value, j.user_id
+        FROM journals j, json_each(CASE WHEN json_valid(j.tags) THEN j.tags ELSE '[]' END) t
+        WHERE t.type = 'text'
+        """,
+    ]
+
+
+# 用户统计：user_stats 中每个用户一行计数，user_stat_buckets 中按 (资源, 维度, 分组) 计数。
+# 分组维度为 (维度名, 资源中的列, 由该列计算分组值的SQL模板)；日期列只取前10个字符，
+# 无法解析为日期的值不计入分组
+STAT_COUNTERS = ('journals', 'categories', 'habits', 'todos')
+STAT_BUCKETS = {
+    'journals': (
+        ('day', 'date', "date(substr({}, 1, 10))"),
+        ('week', 'date', "date(substr({}, 1, 10), '-6 days', 'weekday 1')"),  # 所在周的周一
+        ('month', 'date', "strftime('%Y-%m', substr({}, 1, 10))"),
+    ),
+    'habits': (
+        ('frequency', 'frequency', '{}'),
+        ('start_month', 'start_date', "strftime('%Y-%m', substr({}, 1, 10))"),
+    ),
+}
+
+
+def _stats_delta_statements(table, row, sign):
+    """把 row（NEW/OLD）计入（sign=1）或移出（sign=-1）该用户的统计"""
+    assignments = f'{table} = {table} + excluded.{table}'
+    columns, values = [table], [str(sign)]
+    if table == 'todos':
+        assignments += ', todos_completed = todos_completed + excluded.todos_completed'
+        columns.append('todos_completed')
+        values.append(f'(CASE WHEN {row}.is_completed THEN {sign} ELSE 0 END)')
+    statements = [
+        f"""INSERT INTO user_stats (user_id, {', '.join(columns)}) VALUES ({row}.user_id, {', '.join(values)})
+            ON CONFLICT (user_id) DO UPDATE SET {assignments};"""
+    ]
+    for dimension, column, bucket in STAT_BUCKETS.get(table, ()):
+        statements.append(f"""
+            INSERT INTO user_stat_buckets (user_id, resource, dimension, bucket, count)
+            SELECT {row}.user_id, '{table}', '{dimension}', b, {sign}
+            FROM (SELECT {bucket.format(f'{row}.{column}')} AS b) WHERE b IS NOT NULL
+            ON CONFLICT (user_id, resource, dimension, bucket) DO UPDATE SET count = count + excluded.count;""")
+    if sign < 0 and table in STAT_BUCKETS:
+        statements.append(f"""
+            DELETE FROM user_stat_buckets WHERE user_id = {row}.user_id AND resource = '{table}' AND count <= 0;""")
+    return '\n'.join(statements)
+
+
+def _stats_statements():
+    """
+    按用户汇总的统计表及其维护触发器
+
+    每次写入都在同一事务中增减对应计数，读取统计时只需按主键查找，
+    不必再扫描用户的全部数据。已有数据在迁移中一次性汇总
+    """
+    statements = [
+        """
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id TEXT PRIMARY KEY,
+            journals INTEGER NOT NULL DEFAULT 0,
+            categories INTEGER NOT NULL DEFAULT 0,
+            habits INTEGER NOT NULL DEFAULT 0,
+            todos INTEGER NOT NULL DEFAULT 0,
+            todos_completed INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS user_stat_buckets (
+            user_id TEXT NOT NULL,
+            resource TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (user_id, resource, dimension, bucket)
+        ) WITHOUT ROWID
+        """,
+    ]
+    for table in STAT_COUNTERS:
+        # 只有影响统计的列变化时才需要先移出旧值再计入新值
+        watched = ['user_id'] + [column for _, column, _ in STAT_BUCKETS.get(table, ())]
+        if table == 'todos':
+            watched.append('is_completed')
+        watched = list(dict.fromkeys(watched))
+        changed = ' OR '.join(f'NEW.{column} IS NOT OLD.{column}' for column in watched)
+        statements += [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_insert AFTER INSERT ON {table}
+            BEGIN
+                {_stats_delta_statements(table, 'NEW', 1)}
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_update AFTER UPDATE OF {', '.join(watched)} ON {table}
+            WHEN {changed}
+            BEGIN
+                {_stats_delta_statements(table, 'OLD', -1)}
+                {_stats_delta_statements(table, 'NEW', 1)}
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_delete AFTER DELETE ON {table}
+            BEGIN
+                {_stats_delta_statements(table, 'OLD', -1)}
+            END
+            """,
+        ]
+
+    # 汇总已有数据
+    for table in STAT_COUNTERS:
+        columns, values, extra = table, 'COUNT(*)', ''
+        if table == 'todos':
+            columns += ', todos_completed'
+            values += ', SUM(is_completed != 0)'
+            extra = ', todos_completed = excluded.todos_completed'
+        statements.append(f"""
+            INSERT INTO user_stats (user_id, {columns})
+            SELECT user_id, {values} FROM {table} WHERE 1 GROUP BY user_id
+            ON CONFLICT (user_id) DO UPDATE SET {table} = excluded.{table}{extra}
+        """)
+        for dimension, column, bucket in STAT_BUCKETS.get(table, ()):
+            expression = bucket.format(column)
+            statements.append(f"""
+                INSERT INTO user_stat_buckets (user_id, resource, dimension, bucket, count)
+                SELECT user_id, '{table}', '{dimension}', {expression}, COUNT(*) FROM {table}
+                WHERE {expression} IS NOT NULL
+                GROUP BY user_id, {expression}
+            """)
+    return statements
+
+
+# 打卡次数按天/月的分组计数，同样保存在 user_stat_buckets 中（resource 为 habit_checkins），
+# 每条打卡记录按当天的打卡次数（count列）计入
+CHECKIN_STAT_BUCKETS = (
+    ('day', "date(substr({}, 1, 10))"),
+    ('month', "strftime('%Y-%m', substr({}, 1, 10))"),
+)
+
+
+def _checkin_bucket_delta_statements(row, sign):
+    """把打卡记录 row（NEW/OLD）计入（sign=1）或移出（sign=-1）该用户的分组计数"""
+    statements = []
+    for dimension, bucket in CHECKIN_STAT_BUCKETS:
+        statements.append(f"""
+            INSERT INTO user_stat_buckets (user_id, resource, dimension, bucket, count)
+            SELECT {row}.user_id, 'habit_checkins', '{dimension}', b, {sign} * {row}.count
+            FROM (SELECT {bucket.format(f'{row}.date')} AS b) WHERE b IS NOT NULL
+            ON CONFLICT (user_id, resource, dimension, bucket) DO UPDATE SET count = count + excluded.count;""")
+    if sign < 0:
+        statements.append(f"""
+            DELETE FROM user_stat_buckets
+            WHERE user_id = {row}.user_id AND resource = 'habit_checkins' AND count <= 0;""")
+    return '\n'.join(statements)
+
+
+def _checkin_stats_statements():
+    """
+    按天/月统计打卡次数的触发器
+
+    删除习惯时打卡记录由 trg_habits_checkins_delete 删除，同样会触发这里的扣减；
+    已有打卡记录在迁移中一次性汇总
+    """
+    statements = [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habit_checkins_stats_insert AFTER INSERT ON habit_checkins
+        BEGIN
+            {_checkin_bucket_delta_statements('NEW', 1)}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habit_checkins_stats_update
+        AFTER UPDATE OF user_id, date, count ON habit_checkins
+        WHEN NEW.user_id IS NOT OLD.user_id OR NEW.date IS NOT OLD.date OR NEW.count IS NOT OLD.count
+        BEGIN
+            {_checkin_bucket_delta_statements('OLD', -1)}
+            {_checkin_bucket_delta_statements('NEW', 1)}
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS trg_habit_checkins_stats_delete AFTER DELETE ON habit_checkins
+        BEGIN
+            {_checkin_bucket_delta_statements('OLD', -1)}
+        END
+        """,
+    ]
+    for dimension, bucket in CHECKIN_STAT_BUCKETS:
+        expression = bucket.format('date')
+        statements.append(f"""
+            INSERT INTO user_stat_buckets (user_id, resource, dimension, bucket, count)
+            SELECT user_id, 'habit_checkins', '{dimension}', {expression}, SUM(count) FROM habit_checkins
+            WHERE {expression} IS NOT NULL
+            GROUP BY user_id, {expression}
+        """)
+    return statements
+
+
+MIGRATIONS = [
+    (1, '创建基础表结构', [
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            last_login_at TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS journals (
+            id TEXT PRIMARY KEY,
+            category_id TEXT NOT NULL,
+            title TEXT NOT NULL,
+            content TEXT NOT NULL,
+            tags TEXT NOT NULL,
+            date TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS categories (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            type TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS habits (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT,
+            frequency TEXT NOT NULL,
+            target TEXT NOT NULL,
+            start_date TEXT NOT NULL,
+            end_date TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS todos (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL,
+            description TEXT,
+            is_completed INTEGER NOT NULL DEFAULT 0,
+            due_date TEXT,
+            priority TEXT NOT NULL DEFAULT 'medium',
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+        ''',
+    ]),
+    (2, '为按用户查询的列表和统计添加复合索引', [
+        # 索引列顺序与各列表查询的过滤条件和排序保持一致，避免全表扫描和临时排序
+        'CREATE INDEX IF NOT EXISTS idx_journals_user_date ON journals (user_id, date DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_categories_user_name ON categories (user_id, name)',
+        'CREATE INDEX IF NOT EXISTS idx_categories_user_type ON categories (user_id, type)',
+        'CREATE INDEX IF NOT EXISTS idx_habits_user_name ON habits (user_id, name)',
+        'CREATE INDEX IF NOT EXISTS idx_todos_user_completed_due ON todos (user_id, is_completed, due_date)',
+        'CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at DESC)',
+        'ANALYZE',
+    ]),
+    (3, '在列表索引末尾加入id，支持按排序键分页', [
+        # 分页按 (排序列..., id) 排序，id放入索引后翻页不需要额外排序
+        'DROP INDEX IF EXISTS idx_journals_user_date',
+        'DROP INDEX IF EXISTS idx_categories_user_name',
+        'DROP INDEX IF EXISTS idx_categories_user_type',
+        'DROP INDEX IF EXISTS idx_habits_user_name',
+        'DROP INDEX IF EXISTS idx_todos_user_completed_due',
+        'CREATE INDEX IF NOT EXISTS idx_journals_user_date_id ON journals (user_id, date DESC, id DESC)',
+        'CREATE INDEX IF NOT EXISTS idx_categories_user_name_id ON categories (user_id, name, id)',
+        'CREATE INDEX IF NOT EXISTS idx_categories_user_type_name_id ON categories (user_id, type, name, id)',
+        'CREATE INDEX IF NOT EXISTS idx_habits_user_name_id ON habits (user_id, name, id)',
+        'CREATE INDEX IF NOT EXISTS idx_todos_user_completed_due_id ON todos (user_id, is_completed, due_date, id)',
+        'ANALYZE',
+    ]),
+    (4, '增量同步：同步序号、变更触发器和删除墓碑', [
+        '''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            seq INTEGER NOT NULL,
+            pruned_seq INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        'INSERT OR IGNORE INTO sync_state (id, seq, pruned_seq) VALUES (1, 0, 0)',
+        '''
+        CREATE TABLE IF NOT EXISTS sync_tombstones (
+            resource TEXT NOT NULL,
+            id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            sync_seq INTEGER NOT NULL,
+            deleted_at TEXT NOT NULL,
+            PRIMARY KEY (resource, id)
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_sync_tombstones_user_seq ON sync_tombstones (user_id, sync_seq)',
+        'CREATE INDEX IF NOT EXISTS idx_sync_tombstones_deleted_at ON sync_tombstones (deleted_at)',
+    ] + [statement for table in SYNC_TABLES for statement in _sync_tracking_statements(table)]),
+    (5, '条件请求：按用户和资源查询数据版本的索引', [
+        # MAX(sync_seq) WHERE user_id = ? AND resource = ? 只需一次索引查找
+        'CREATE INDEX IF NOT EXISTS idx_sync_tombstones_user_resource_seq '
+        'ON sync_tombstones (user_id, resource, sync_seq)',
+        # 日记内容可能很大，覆盖索引使按id读取版本号时不必访问数据行
+        'CREATE INDEX IF NOT EXISTS idx_journals_id_sync ON journals (id, sync_seq)',
+    ]),
+    (6, '分块续传上传会话', [
+        '''
+        CREATE TABLE IF NOT EXISTS upload_sessions (
+            id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            received INTEGER NOT NULL DEFAULT 0,
+            sha256 TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_upload_sessions_updated_at ON upload_sessions (updated_at)',
+    ]),
+    (7, '按内容寻址的去重文件存储', [
+        '''
+        CREATE TABLE IF NOT EXISTS media_blobs (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            refcount INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            released_at TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS media_files (
+            user_id TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (user_id, filename)
+        )
+        ''',
+        # 垃圾回收只关心引用计数为0的内容，部分索引只包含这些行
+        'CREATE INDEX IF NOT EXISTS idx_media_blobs_released ON media_blobs (released_at) WHERE refcount = 0',
+        'CREATE INDEX IF NOT EXISTS idx_media_files_sha256 ON media_files (sha256)',
+    ]),
+    # 只创建索引结构和触发器，已有日记由 python search.py backfill 分批回填，避免长时间持有写锁
+    (8, '日记全文检索（FTS5）', _search_index_statements()),
+    (9, '日记标签索引', _tag_index_statements()),
+    (10, '用户统计汇总表', _stats_statements()),
+    (11, '习惯打卡记录', [
+        '''
+        CREATE TABLE IF NOT EXISTS habit_checkins (
+            habit_id TEXT NOT NULL,
+            date TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 1,
+            created_at TEXT NOT NULL,
+            PRIMARY KEY (habit_id, date)
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_habit_checkins_user_date ON habit_checkins (user_id, date)',
+        # 每个习惯的连续打卡汇总（见 checkins.py），打卡记录或习惯的周期设置变化时删除，下次读取时重新计算
+        '''
+        CREATE TABLE IF NOT EXISTS habit_rollups (
+            habit_id TEXT PRIMARY KEY,
+            total_checkins INTEGER NOT NULL,
+            last_checkin TEXT,
+            longest_streak INTEGER NOT NULL,
+            last_run_end TEXT,
+            last_run_length INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_habit_checkins_insert AFTER INSERT ON habit_checkins
+        BEGIN
+            DELETE FROM habit_rollups WHERE habit_id = NEW.habit_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_habit_checkins_update AFTER UPDATE ON habit_checkins
+        BEGIN
+            DELETE FROM habit_rollups WHERE habit_id IN (OLD.habit_id, NEW.habit_id);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_habit_checkins_delete AFTER DELETE ON habit_checkins
+        BEGIN
+            DELETE FROM habit_rollups WHERE habit_id = OLD.habit_id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_habits_rollup_update AFTER UPDATE OF frequency, target ON habits
+        BEGIN
+            DELETE FROM habit_rollups WHERE habit_id = NEW.id;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS trg_habits_checkins_delete AFTER DELETE ON habits
+        BEGIN
+            DELETE FROM habit_checkins WHERE habit_id = OLD.id;
+            DELETE FROM habit_rollups WHERE habit_id = OLD.id;
+        END
+        ''',
+    ]),
+    # 刷新令牌只保存轮换所需的状态（见 tokens.py），访问令牌的校验不查询数据库
+    (12, '刷新令牌', [
+        '''
+        CREATE TABLE IF NOT EXISTS refresh_tokens (
+            jti TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            family TEXT NOT NULL,
+            expires_at INTEGER NOT NULL,
+            used INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_refresh_tokens_family ON refresh_tokens (family)',
+        'CREATE INDEX IF NOT EXISTS idx_refresh_tokens_expires ON refresh_tokens (expires_at)',
+    ]),
+    # 管理界面按注册时间分页显示用户，排序键需要包含id（按用户名、邮箱排序使用唯一约束的索引）
+    (13, '管理界面用户列表分页索引', [
+        'CREATE INDEX IF NOT EXISTS idx_users_created_at_id ON users (created_at DESC, id DESC)',
+        'DROP INDEX IF EXISTS idx_users_created_at',
+    ]),
+    # 单条记录的ETag要先确认记录属于当前用户再比较版本，覆盖索引中加入user_id
+    (14, '按id读取日记所属用户和版本的覆盖索引', [
+        'CREATE INDEX IF NOT EXISTS idx_journals_id_user_sync ON journals (id, user_id, sync_seq)',
+        'DROP INDEX IF EXISTS idx_journals_id_sync',
+    ]),
+    # 已吊销的访问令牌，各工作进程按自增id增量读取（见 tokens.RevocationCache）；
+    # AUTOINCREMENT 保证删除过期记录后id也不会被重用，否则其他进程可能漏读新记录
+    (15, '访问令牌吊销记录', [
+        '''
+        CREATE TABLE IF NOT EXISTS revoked_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            jti TEXT NOT NULL UNIQUE,
+            expires_at INTEGER NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_revoked_tokens_expires ON revoked_tokens (expires_at)',
+    ]),
+    (16, '按天/月统计打卡次数', _checkin_stats_statements()),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def run_migrations(conn):
+    """
+    将数据库结构升级到最新版本
+
+    使用 BEGIN IMMEDIATE 获取写锁后再读取版本号，
+    多个进程同时启动时只有一个会真正执行迁移，其余进程会看到已升级的版本号
+
+    返回本次执行的迁移版本号列表
+    """
+    applied = []
+    for version, description, statements in MIGRATIONS:
+        if get_schema_version(conn) >= version:
+            continue
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 拿到写锁后再次确认，防止其他进程已完成该迁移
+            if get_schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+# 查询计划检查
+#
+# 列出API和管理界面使用的查询，check_query_plans() 会对每条查询执行
+# EXPLAIN QUERY PLAN，只要出现全表扫描或临时B树排序就视为缺少合适的索引。
+# 在app.py中新增或修改查询时，请同步更新这里的列表。
+QUERY_PLAN_CHECKS = [
+    ('register_exists', 'SELECT id FROM users WHERE username = ? OR email = ?', ('u', 'e')),
+    ('login', 'SELECT * FROM users WHERE email = ?', ('e',)),
+    ('get_journals', 'SELECT * FROM journals WHERE user_id = ? ORDER BY date DESC', ('u',)),
+    ('get_journal', 'SELECT * FROM journals WHERE id = ?', ('j',)),
+    ('get_categories', 'SELECT * FROM categories WHERE user_id = ?', ('u',)),
+    ('get_categories_by_type', 'SELECT * FROM categories WHERE user_id = ? AND type = ?', ('u', 't')),
+    ('get_habits', 'SELECT * FROM habits WHERE user_id = ? ORDER BY name', ('u',)),
+    ('get_habit', 'SELECT * FROM habits WHERE id = ?', ('h',)),
+    ('get_todos', 'SELECT * FROM todos WHERE user_id = ? ORDER BY is_completed, due_date', ('u',)),
+    ('get_todo', 'SELECT * FROM todos WHERE id = ?', ('t',)),
+    ('admin_users_page',
+     'SELECT id, username FROM users WHERE 1 AND (created_at, id) < (?, ?) ORDER BY created_at DESC, id DESC LIMIT ?',
+     ('d', 'u', 51)),
+    ('admin_users_by_username',
+     'SELECT id, username FROM users WHERE 1 AND (username) > (?) ORDER BY username ASC LIMIT ?', ('n', 51)),
+    ('admin_users_by_email',
+     'SELECT id, email FROM users WHERE 1 AND (email) > (?) ORDER BY email ASC LIMIT ?', ('e', 51)),
+    ('admin_user', 'SELECT id, username FROM users WHERE id = ?', ('u',)),
+    ('admin_user_counts', 'SELECT user_id, journals FROM user_stats WHERE user_id IN (?, ?)', ('u', 'v')),
+    ('admin_user_categories', 'SELECT * FROM categories WHERE user_id = ? ORDER BY name', ('u',)),
+    ('get_journals_page',
+     'SELECT * FROM journals WHERE user_id = ? AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?',
+     ('u', 'd', 'j', 51)),
+    ('get_categories_page',
+     'SELECT * FROM categories WHERE user_id = ? AND (name, id) > (?, ?) ORDER BY name ASC, id ASC LIMIT ?',
+     ('u', 'n', 'c', 51)),
+    ('get_categories_by_type_page',
+     'SELECT * FROM categories WHERE user_id = ? AND type = ? AND (name, id) > (?, ?) '
+     'ORDER BY name ASC, id ASC LIMIT ?',
+     ('u', 't', 'n', 'c', 51)),
+    ('get_habits_page',
+     'SELECT * FROM habits WHERE user_id = ? AND (name, id) > (?, ?) ORDER BY name ASC, id ASC LIMIT ?',
+     ('u', 'n', 'h', 51)),
+    ('get_todos_page',
+     'SELECT * FROM todos WHERE user_id = ? AND ((is_completed > ?) OR (is_completed IS ? AND due_date > ?) '
+     'OR (is_completed IS ? AND due_date IS ? AND id > ?)) '
+     'ORDER BY is_completed ASC, due_date ASC, id ASC LIMIT ?',
+     ('u', 0, 0, 'd', 0, 'd', 't', 51)),
+    ('sync_state', 'SELECT seq, pruned_seq FROM sync_state WHERE id = 1', ()),
+    ('sync_tombstones',
+     'SELECT resource, id FROM sync_tombstones WHERE user_id = ? AND sync_seq > ? AND sync_seq <= ?',
+     ('u', 0, 10)),
+    ('sync_prune_tombstones', 'SELECT MAX(sync_seq) FROM sync_tombstones WHERE deleted_at < ?', ('d',)),
+] + [
+    (f'sync_{table}', f'SELECT * FROM {table} WHERE user_id = ? AND sync_seq > ? AND sync_seq <= ?', ('u', 0, 10))
+    for table in SYNC_TABLES
+] + [
+    (f'version_{table}', f'SELECT MAX(sync_seq) FROM {table} WHERE user_id = ?', ('u',))
+    for table in SYNC_TABLES
+] + [
+    (f'row_version_{table}', f'SELECT sync_seq, user_id FROM {table} WHERE id = ?', ('i',))
+    for table in SYNC_TABLES if table != 'journals'
+] + [
+    ('row_version_journals',
+     'SELECT sync_seq, user_id FROM journals INDEXED BY idx_journals_id_user_sync WHERE id = ?', ('i',)),
+    ('version_tombstones',
+     'SELECT MAX(sync_seq) FROM sync_tombstones WHERE user_id = ? AND resource = ?', ('u', 'journals')),
+    ('upload_session', 'SELECT * FROM upload_sessions WHERE id = ?', ('s',)),
+    ('upload_session_advance',
+     'UPDATE upload_sessions SET received = ?, updated_at = ? WHERE id = ? AND received = ?', (1, 'd', 's', 0)),
+    ('upload_sessions_expired', 'SELECT id, user_id FROM upload_sessions WHERE updated_at < ?', ('d',)),
+    ('media_file', 'SELECT sha256 FROM media_files WHERE user_id = ? AND filename = ?', ('u', 'f')),
+    ('media_blob_acquire',
+     'UPDATE media_blobs SET refcount = refcount + 1, released_at = NULL WHERE sha256 = ?', ('h',)),
+    ('media_blobs_garbage', 'SELECT sha256 FROM media_blobs WHERE refcount = 0 AND released_at < ?', ('d',)),
+    ('journal_search_doc', 'SELECT docid FROM journal_search_docs WHERE journal_id = ?', ('j',)),
+    ('journal_search_user', 'SELECT ordinal FROM journal_search_users WHERE user_id = ?', ('u',)),
+    ('journal_search_next_docid',
+     'SELECT MAX(docid) FROM journal_search_docs WHERE docid BETWEEN ? AND ?', (1 << 32, (2 << 32) - 1)),
+    # 检索只检查FTS5部分，取出的一页docid再按主键关联 journal_search_docs 和 journals
+    ('search_journals',
+     'SELECT rowid, rank FROM journals_fts WHERE journals_fts MATCH ? AND rowid BETWEEN ? AND ? '
+     'ORDER BY rank LIMIT ? OFFSET ?',
+     ('"abc"', 1 << 32, (2 << 32) - 1, 51, 0)),
+    ('search_journals_like',
+     "SELECT j.id FROM journals j WHERE j.user_id = ? AND (j.title LIKE ? OR j.tags LIKE ?) "
+     "ORDER BY j.date DESC, j.id DESC LIMIT ? OFFSET ?", ('u', '%a%', '%a%', 51, 0)),
+    ('get_journals_by_tag',
+     'SELECT * FROM journals WHERE user_id = ? '
+     'AND id IN (SELECT journal_id FROM journal_tags WHERE user_id = ? AND tag = ?) ORDER BY date DESC',
+     ('u', 'u', 't')),
+    ('get_journals_by_tag_page',
+     'SELECT * FROM journals WHERE user_id = ? '
+     'AND id IN (SELECT journal_id FROM journal_tags WHERE user_id = ? AND tag = ?) '
+     'AND (date, id) < (?, ?) ORDER BY date DESC, id DESC LIMIT ?',
+     ('u', 'u', 't', 'd', 'j', 51)),
+    ('user_stats', 'SELECT * FROM user_stats WHERE user_id = ?', ('u',)),
+    ('user_stat_buckets',
+     'SELECT bucket, count FROM user_stat_buckets WHERE user_id = ? AND resource = ? AND dimension = ? '
+     'ORDER BY bucket DESC LIMIT ?', ('u', 'journals', 'day', 30)),
+    ('habit_checkins_range',
+     'SELECT date, count FROM habit_checkins WHERE habit_id = ? AND date BETWEEN ? AND ? ORDER BY date',
+     ('h', '2024-01-01', '2024-12-31')),
+    ('habit_checkins_window',
+     'SELECT habit_id, date FROM habit_checkins WHERE user_id = ? AND date BETWEEN ? AND ?',
+     ('u', '2024-01-01', '2024-12-31')),
+    ('habit_rollups', 'SELECT * FROM habit_rollups WHERE habit_id = ?', ('h',)),
+    ('habit_checkin_owner', 'SELECT id, user_id FROM habits WHERE id IN (?, ?)', ('h', 'i')),
+    ('refresh_token_use', 'UPDATE refresh_tokens SET used = 1 WHERE jti = ? AND used = 0', ('j',)),
+    ('refresh_token_family', 'DELETE FROM refresh_tokens WHERE family = ?', ('f',)),
+    ('refresh_tokens_expired', 'DELETE FROM refresh_tokens WHERE expires_at <= ?', (0,)),
+    ('revoked_tokens_since', 'SELECT id, jti, expires_at FROM revoked_tokens WHERE id > ? ORDER BY id', (0,)),
+    ('revoked_tokens_expired', 'DELETE FROM revoked_tokens WHERE expires_at <= ?', (0,)),
+    ('tag_counts', 'SELECT tag, COUNT(*) FROM journal_tags WHERE user_id = ? GROUP BY tag ORDER BY tag', ('u',)),
+] + [
+    # 单条更新/删除（见 mutations.update_record）：所有者和If-Match版本条件都应在主键查找后过滤
+    (f'update_record_{table}',
+     f'UPDATE {table} SET updated_at = ? WHERE id = ? AND user_id = ? AND sync_seq = ? RETURNING user_id',
+     ('d', 'i', 'u', 1))
+    for table in ('journals', 'habits', 'todos')
+] + [
+    (f'delete_record_{table}', f'DELETE FROM {table} WHERE id = ? AND user_id = ? AND sync_seq = ? RETURNING user_id',
+     ('i', 'u', 1))
+    for table in ('journals', 'habits', 'todos')
+]
+
+# 不带 USING INDEX / USING ... KEY 的 SCAN 表示全表扫描
+_FULL_SCAN = re.compile(r'^SCAN (TABLE )?\w+$')
+_TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR')
+
+
+def explain_query_plan(conn, sql, params=()):
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()]
+
+
+def check_query_plans(conn, checks=None):
+    """
+    检查查询计划，返回 (查询名称, 计划明细) 的问题列表，列表为空表示全部通过
+    """
+    problems = []
+    for name, sql, params in (checks if checks is not None else QUERY_PLAN_CHECKS):
+        for detail in explain_query_plan(conn, sql, params):
+            if _FULL_SCAN.match(detail) or _TEMP_SORT.search(detail):
+                problems.append((name, detail))
+    return problems
+
+
+# 命令行用法：
+#   python migrations.py [数据库文件]                 执行迁移
+#   python migrations.py --check-plans [数据库文件]   执行迁移并检查查询计划，发现全表扫描时返回非零退出码
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    check_plans = '--check-plans' in args
+    args = [arg for arg in args if arg != '--check-plans']
+    database = args[0] if args else 'moment_keep.db'
+
+    conn = sqlite3.connect(database)
+    applied = run_migrations(conn)
+    print(f'Schema version: {get_schema_version(conn)} (applied: {applied or "none"})')
+
+    if check_plans:
+        problems = check_query_plans(conn)
+        for name, detail in problems:
+            print(f'[FAIL] {name}: {detail}')
+        if problems:
+            conn.close()
+            sys.exit(1)
+        print(f'All {len(QUERY_PLAN_CHECKS)} queries use indexes')
+    conn.close()
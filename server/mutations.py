@@ -0,0 +1,345 @@
+import json
+import re
+import uuid
+
+# 写操作的字段规则
+#
+# 单条写接口（create_*/update_*/delete_*）和批量写接口共用这里的校验和取值规则，
+# 保证同一条数据无论从哪个接口写入，结果都完全一致。
+
+# 单次批量请求允许的最大操作数
+MAX_BATCH_OPERATIONS = 500
+
+# SQLite单条语句允许的参数个数有限，IN (...) 查询按该大小分块
+_IN_CHUNK_SIZE = 500
+
+
+class PreconditionFailed(Exception):
+    """记录的当前版本与请求要求的版本（If-Match）不一致"""
+
+
+def to_snake_case_keys(data):
+    """将驼峰命名的字段转换为下划线命名，兼容客户端请求"""
+    formatted_data = {}
+    for key, value in data.items():
+        formatted_key = re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', key).lower()
+        formatted_data[formatted_key] = value
+
+    # 如果客户端没有提供user_id，检查是否有userId字段
+    if 'user_id' not in formatted_data and 'userid' in formatted_data:
+        formatted_data['user_id'] = formatted_data['userid']
+    return formatted_data
+
+
+def _journal_values(data, record_id, now):
+    return (
+        record_id,
+        data.get('category_id', ''),
+        data['title'],
+        data['content'],  # 已经是字符串格式，不需要再次json.dumps
+        json.dumps(data.get('tags', [])),
+        data.get('date', now),
+        data.get('created_at', now),
+        data.get('updated_at', now),
+        data['user_id'],
+    )
+
+
+def _habit_values(data, record_id, now):
+    return (
+        record_id,
+        data['name'],
+        data.get('description', ''),
+        data['frequency'],
+        data['target'],
+        data['start_date'],
+        data.get('end_date'),
+        now,
+        now,
+        data['user_id'],
+    )
+
+
+def _todo_values(data, record_id, now):
+    return (
+        record_id,
+        data['title'],
+        data.get('description', ''),
+        1 if data.get('is_completed', False) else 0,
+        data.get('due_date'),
+        data.get('priority', 'medium'),
+        now,
+        now,
+        data['user_id'],
+    )
+
+
+def _same(value):
+    return value
+
+
+# 每种资源的写入规则：
+# - required: 创建时必填的字段
+# - insert_sql / insert_values: 插入语句及按列顺序取值的函数
+# - update_fields: 允许更新的字段及写入前的转换函数
+# - normalize: 创建前对请求数据的预处理
+RESOURCES = {
+    'journals': {
+        'name': 'Journal',
+        'required': ('title', 'content', 'user_id'),  # 允许category_id为空字符串
+        'insert_sql': '''
+            INSERT INTO journals (id, category_id, title, content, tags, date, created_at, updated_at, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        'insert_values': _journal_values,
+        'update_fields': {
+            'category_id': _same,
+            'title': _same,
+            'content': _same,  # 直接保存加密后的内容，不要进行JSON序列化
+            'tags': json.dumps,
+            'date': _same,
+        },
+        'normalize': to_snake_case_keys,
+    },
+    'habits': {
+        'name': 'Habit',
+        'required': ('name', 'frequency', 'target', 'start_date', 'user_id'),
+        'insert_sql': '''
+            INSERT INTO habits (id, name, description, frequency, target, start_date, end_date, created_at, updated_at, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        'insert_values': _habit_values,
+        'update_fields': {
+            'name': _same,
+            'description': _same,
+            'frequency': _same,
+            'target': _same,
+            'start_date': _same,
+            'end_date': _same,
+        },
+        'normalize': _same,
+    },
+    'todos': {
+        'name': 'Todo',
+        'required': ('title', 'user_id'),
+        'insert_sql': '''
+            INSERT INTO todos (id, title, description, is_completed, due_date, priority, created_at, updated_at, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''',
+        'insert_values': _todo_values,
+        'update_fields': {
+            'title': _same,
+            'description': _same,
+            'is_completed': lambda value: 1 if value else 0,
+            'due_date': _same,
+            'priority': _same,
+        },
+        'normalize': _same,
+    },
+}
+
+
+def prepare_insert(resource, data, now):
+    """
+    校验创建请求并生成插入参数，返回 (新记录id, 参数元组)
+
+    data 应已经过 RESOURCES[resource]['normalize'] 预处理，缺少必填字段时抛出 ValueError
+    """
+    spec = RESOURCES[resource]
+    if not data or any(field not in data for field in spec['required']):
+        raise ValueError('Missing required fields')
+    record_id = str(uuid.uuid4())
+    return record_id, spec['insert_values'](data, record_id, now)
+
+
+def prepare_update(resource, data, now):
+    """
+    生成更新语句的赋值部分，返回 (列名元组, 参数列表)
+
+    只有规则中允许的字段会被更新，updated_at 总是会被刷新
+    """
+    if not data:
+        raise ValueError('No data provided')
+    columns = []
+    values = []
+    for field, convert in RESOURCES[resource]['update_fields'].items():
+        if field in data:
+            columns.append(field)
+            values.append(convert(data[field]))
+    columns.append('updated_at')
+    values.append(now)
+    return tuple(columns), values
+
+
+def update_sql(resource, columns, where='id = ?'):
+    assignments = ', '.join(f'{column} = ?' for column in columns)
+    return f'UPDATE {resource} SET {assignments} WHERE {where}'
+
+
+# 单条写接口的写操作，在 app.run_write() 提供的游标上执行，不负责提交。
+# 更新和删除都是一条带 RETURNING 的语句：记录是否存在、是否属于 owner、版本是否一致都写在
+# WHERE 条件里，没有返回行即未命中，成功时不需要先读取记录
+
+def insert_record(cursor, resource, values):
+    cursor.execute(RESOURCES[resource]['insert_sql'], values)
+
+
+def _record_clause(record_id, owner, version):
+    where = 'id = ?'
+    params = [record_id]
+    if owner is not None:
+        where += ' AND user_id = ?'
+        params.append(owner)
+    if version is not None:
+        where += ' AND sync_seq = ?'
+        params.append(version)
+    return where, params
+
+
+def _missed(cursor, resource, record_id, owner, version):
+    """
+    写语句没有命中记录时判断原因：记录不存在（或不属于owner）返回None，版本不一致时抛出 PreconditionFailed
+
+    只有带版本条件的写入未命中时才需要再查询一次
+    """
+    if version is not None:
+        cursor.execute(f'SELECT user_id FROM {resource} WHERE id = ?', (record_id,))
+        row = cursor.fetchone()
+        if row is not None and (owner is None or row[0] == owner):
+            raise PreconditionFailed()
+    return None
+
+
+def update_record(cursor, resource, record_id, columns, values, owner=None, version=None):
+    """
+    更新一条记录，返回记录所属的user_id
+
+    记录不存在、或提供 owner 时记录不属于该用户，返回None且不更新；
+    提供 version 时只在记录的同步序号（即单条记录ETag中的版本）等于 version 时更新，
+    否则抛出 PreconditionFailed，避免覆盖其他客户端在此期间的修改
+    """
+    where, params = _record_clause(record_id, owner, version)
+    cursor.execute(update_sql(resource, columns, where) + ' RETURNING user_id', (*values, *params))
+    rows = cursor.fetchall()
+    return rows[0][0] if rows else _missed(cursor, resource, record_id, owner, version)
+
+
+def delete_record(cursor, resource, record_id, owner=None, version=None):
+    """删除一条记录，返回值和版本条件与 update_record 相同"""
+    where, params = _record_clause(record_id, owner, version)
+    cursor.execute(f'DELETE FROM {resource} WHERE {where} RETURNING user_id', params)
+    rows = cursor.fetchall()
+    return rows[0][0] if rows else _missed(cursor, resource, record_id, owner, version)
+
+
+def _existing_owners(cursor, resource, ids):
+    """批量查询记录是否存在，返回 {id: user_id}"""
+    found = {}
+    ids = list(dict.fromkeys(ids))
+    for start in range(0, len(ids), _IN_CHUNK_SIZE):
+        chunk = ids[start:start + _IN_CHUNK_SIZE]
+        placeholders = ', '.join('?' for _ in chunk)
+        cursor.execute(f'SELECT id, user_id FROM {resource} WHERE id IN ({placeholders})', chunk)
+        found.update((row[0], row[1]) for row in cursor.fetchall())
+    return found
+
+
+def _validate_operation(index, operation, default_user_id, now, owner=None):
+    """
+    校验单个批量操作，返回 (执行分组键, 执行参数, 结果) ；校验失败时执行分组键为None
+    """
+    if not isinstance(operation, dict):
+        return None, None, {'index': index, 'status': 400, 'error': 'Invalid operation'}
+
+    op = operation.get('op')
+    resource = operation.get('resource')
+    if resource not in RESOURCES or op not in ('create', 'update', 'delete'):
+        return None, None, {'index': index, 'status': 400, 'error': 'Invalid operation'}
+
+    spec = RESOURCES[resource]
+    data = operation.get('data') or {}
+    if not isinstance(data, dict):
+        return None, None, {'index': index, 'status': 400, 'error': 'Invalid operation'}
+
+    try:
+        if op == 'create':
+            data = spec['normalize'](data)
+            if owner is not None:
+                data['user_id'] = owner
+            elif default_user_id and 'user_id' not in data:
+                data['user_id'] = default_user_id
+            record_id, values = prepare_insert(resource, data, now)
+            return (resource, op, None), values, {'index': index, 'status': 201, 'id': record_id}
+
+        record_id = operation.get('id')
+        if not record_id:
+            raise ValueError('Missing id')
+        if op == 'update':
+            columns, values = prepare_update(resource, data, now)
+            values.append(record_id)
+            return (resource, op, columns), values, {'index': index, 'status': 200, 'id': record_id}
+        return (resource, op, None), (record_id,), {'index': index, 'status': 200, 'id': record_id}
+    except ValueError as e:
+        return None, None, {'index': index, 'status': 400, 'error': str(e)}
+
+
+def apply_batch(conn, operations, default_user_id, now, owner=None):
+    """
+    在一个事务中执行一批创建/更新/删除操作
+
+    返回 (每个操作的结果列表, 成功执行的操作数, 受影响的 (user_id, 资源) 集合)，
+    最后一项用于让调用方使相应的列表缓存失效
+
+    校验失败的操作不会执行，只在结果中返回错误；其余操作按原顺序把相邻的同类操作
+    （同一资源、同一操作、同一组更新字段）合并为一次 executemany，整个批次只提交一次。
+    更新和删除的目标是否存在在同一事务中批量检查，不存在的返回404。
+    提供 owner 时创建的记录一律属于该用户，更新和删除其他用户的记录按不存在处理
+    """
+    results = []
+    runs = []
+    for index, operation in enumerate(operations):
+        key, params, result = _validate_operation(index, operation, default_user_id, now, owner)
+        results.append(result)
+        if key is None:
+            continue
+        if runs and runs[-1][0] == key:
+            runs[-1][1].append((params, result))
+        else:
+            runs.append((key, [(params, result)]))
+
+    applied = 0
+    touched = set()
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        for (resource, op, columns), items in runs:
+            spec = RESOURCES[resource]
+            if op == 'create':
+                cursor.executemany(spec['insert_sql'], [params for params, _ in items])
+                applied += len(items)
+                # 插入参数的最后一列均为user_id
+                touched.update((params[-1], resource) for params, _ in items)
+                continue
+
+            owners = _existing_owners(cursor, resource, [result['id'] for _, result in items])
+            params_list = []
+            for params, result in items:
+                if result['id'] in owners and (owner is None or owners[result['id']] == owner):
+                    params_list.append(params)
+                    touched.add((owners[result['id']], resource))
+                else:
+                    result['status'] = 404
+                    result['error'] = f"{spec['name']} not found"
+            if not params_list:
+                continue
+
+            if op == 'update':
+                cursor.executemany(update_sql(resource, columns), params_list)
+            else:
+                cursor.executemany(f'DELETE FROM {resource} WHERE id = ?', params_list)
+            applied += len(params_list)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return results, applied, touched
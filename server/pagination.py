@@ -0,0 +1,129 @@
+import base64
+import json
+
+# 分页配置
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def encode_cursor(values):
+    """将最后一行的排序键编码为不透明的游标字符串"""
+    raw = json.dumps(list(values), separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token, size):
+    """解析游标字符串，格式不正确时抛出 ValueError"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def parse_page_args(args, keyset):
+    """
+    从查询参数中解析分页请求
+
+    客户端没有传 limit 和 cursor 时返回 None，表示沿用不分页的旧行为；
+    否则返回 (limit, 游标中的排序键或None)。参数不合法时抛出 ValueError
+    """
+    limit = args.get('limit')
+    cursor = args.get('cursor')
+    if limit is None and cursor is None:
+        return None
+
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('Invalid limit parameter')
+        if limit < 1:
+            raise ValueError('Invalid limit parameter')
+        limit = min(limit, MAX_PAGE_SIZE)
+
+    after = decode_cursor(cursor, len(keyset.columns)) if cursor else None
+    return limit, after
+
+
+class Keyset:
+    """
+    基于排序键的分页（keyset pagination）
+
+    columns 为 (列名, 是否降序, 是否可为NULL) 的列表，最后一列必须唯一（通常是id）。
+    翻页条件直接作用在排序键上，数据库可以沿索引从上一页结束的位置继续读取，
+    不需要像 OFFSET 那样跳过前面所有行
+    """
+
+    def __init__(self, *columns):
+        self.columns = columns
+
+    @property
+    def order_by(self):
+        return ', '.join(f"{name} {'DESC' if desc else 'ASC'}" for name, desc, _ in self.columns)
+
+    def key_of(self, row):
+        return [row[name] for name, _, _ in self.columns]
+
+    def after_clause(self, values):
+        """返回排在游标之后的行的WHERE条件及参数"""
+        directions = {desc for _, desc, _ in self.columns}
+        if len(directions) == 1 and not any(nullable for _, _, nullable in self.columns):
+            # 所有列同方向且非空时使用行值比较，便于SQLite直接做索引范围扫描
+            names = ', '.join(name for name, _, _ in self.columns)
+            placeholders = ', '.join('?' for _ in self.columns)
+            op = '<' if directions.pop() else '>'
+            return f'({names}) {op} ({placeholders})', list(values)
+
+        # 混合方向或可为NULL的列：逐列展开 (a > ?) OR (a IS ? AND b > ?) ...
+        # SQLite中NULL在升序时排在最前，在降序时排在最后
+        terms = []
+        params = []
+        for i, (name, desc, nullable) in enumerate(self.columns):
+            prefix = [f'{prev} IS ?' for prev, _, _ in self.columns[:i]]
+            prefix_params = list(values[:i])
+            value = values[i]
+            if value is None:
+                if desc:
+                    continue  # 降序时NULL已经是最后，不存在更靠后的非NULL值
+                strict, strict_params = f'{name} IS NOT NULL', []
+            elif desc:
+                strict = f'({name} < ? OR {name} IS NULL)' if nullable else f'{name} < ?'
+                strict_params = [value]
+            else:
+                strict, strict_params = f'{name} > ?', [value]
+            terms.append('(' + ' AND '.join(prefix + [strict]) + ')')
+            params.extend(prefix_params + strict_params)
+
+        if not terms:
+            return '0', []
+        return '(' + ' OR '.join(terms) + ')', params
+
+
+def fetch_page(cursor, sql, params, keyset, limit, after):
+    """
+    执行一页查询，sql 为不含 ORDER BY 的 SELECT ... WHERE ... 语句
+
+    只从数据库读取 limit + 1 行，多出的一行仅用于判断是否还有下一页。
+    返回 (当前页的行, 下一页游标或None)
+    """
+    params = list(params)
+    if after is not None:
+        clause, clause_params = keyset.after_clause(after)
+        sql += ' AND ' + clause
+        params.extend(clause_params)
+    sql += f' ORDER BY {keyset.order_by} LIMIT ?'
+    params.append(limit + 1)
+
+    cursor.execute(sql, params)
+    rows = cursor.fetchmany(limit + 1)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(keyset.key_of(rows[-1]))
+    return rows, next_cursor
@@ -0,0 +1,205 @@
+import re
+import sqlite3
+import sys
+
+from migrations import SEARCH_DOCID_SPAN, search_docid_sql, searchable_content_sql
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, encode_cursor, decode_cursor
+from serializers import JOURNAL_MAPPER
+
+# 日记全文检索
+#
+# 索引结构和触发器见 migrations.py 中的第8个迁移。查询词按空白拆分，各词之间为AND关系：
+# - 所有词都不少于3个字符时走 journals_fts 的trigram索引，只在该用户的docid区间内匹配，
+#   按bm25排序（标题 > 标签 > 正文，权重在迁移中配置为索引的默认rank）并返回摘要
+# - 有词少于3个字符时trigram索引无法使用，退回到在该用户的日记中做LIKE匹配，按日期倒序返回
+# 结果按偏移量分页，next_cursor 是下一页偏移量的不透明编码。
+
+# trigram分词要求每个检索词至少3个字符
+MIN_TERM_LENGTH = 3
+MAX_TERMS = 8
+
+SNIPPET_OPEN = '<mark>'
+SNIPPET_CLOSE = '</mark>'
+SNIPPET_ELLIPSIS = '…'
+SNIPPET_TOKENS = 24
+
+BACKFILL_BATCH_SIZE = 2000
+
+_NEXT_DOCID = search_docid_sql('?')
+
+_JOURNAL_COLUMNS = ', '.join(f'j.{key}' for key in JOURNAL_MAPPER.keys)
+
+# 先在FTS5中取出当前页的docid和摘要，再关联日记，只有当前页的日记需要读取
+SEARCH_SQL = f'''
+    SELECT {_JOURNAL_COLUMNS}, h.snippet
+    FROM (
+        SELECT rowid AS docid, rank,
+               snippet(journals_fts, -1, '{SNIPPET_OPEN}', '{SNIPPET_CLOSE}', '{SNIPPET_ELLIPSIS}', {SNIPPET_TOKENS})
+               AS snippet
+        FROM journals_fts
+        WHERE journals_fts MATCH ? AND rowid BETWEEN ? AND ?
+        ORDER BY rank
+        LIMIT ? OFFSET ?
+    ) h
+    JOIN journal_search_docs d ON d.docid = h.docid
+    JOIN journals j ON j.id = d.journal_id
+    ORDER BY h.rank, h.docid
+'''
+
+_LIKE_TERM = (f"(j.title LIKE ? ESCAPE '\\' OR j.tags LIKE ? ESCAPE '\\' "
+              f"OR {searchable_content_sql('j.content')} LIKE ? ESCAPE '\\')")
+
+LIKE_SEARCH_SQL = f'''
+    SELECT {_JOURNAL_COLUMNS}, NULL
+    FROM journals j
+    WHERE j.user_id = ? AND {{conditions}}
+    ORDER BY j.date DESC, j.id DESC
+    LIMIT ? OFFSET ?
+'''
+
+
+def parse_search_args(args):
+    """解析检索参数，返回 (检索词列表, limit, offset)，参数不合法时抛出 ValueError"""
+    terms = [term.replace('"', '') for term in (args.get('q') or '').split()]
+    terms = [term for term in terms if term][:MAX_TERMS]
+    if not terms:
+        raise ValueError('Missing q parameter')
+
+    limit = args.get('limit', DEFAULT_PAGE_SIZE)
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError('Invalid limit parameter')
+    if limit < 1:
+        raise ValueError('Invalid limit parameter')
+    limit = min(limit, MAX_PAGE_SIZE)
+
+    offset = 0
+    if args.get('cursor'):
+        offset = decode_cursor(args['cursor'], 1)[0]
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError('Invalid cursor')
+    return terms, limit, offset
+
+
+def match_expression(terms):
+    """把检索词转换为FTS5查询：每个词作为带引号的短语，避免用户输入被解析为FTS5语法"""
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def _escape_like(term):
+    return re.sub(r'([\\%_])', r'\\\1', term)
+
+
+def docid_range(cursor, user_id):
+    """返回用户在全文索引中的docid区间 (lo, hi)，用户还没有任何已索引的日记时返回None"""
+    cursor.execute('SELECT ordinal FROM journal_search_users WHERE user_id = ?', (user_id,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    lo = row[0] * SEARCH_DOCID_SPAN
+    return lo, lo + SEARCH_DOCID_SPAN - 1
+
+
+def search_journals(cursor, user_id, terms, limit, offset):
+    """
+    检索用户的日记，返回 ([(日记行, 摘要或None)], next_cursor)
+
+    多取一行用于判断是否还有下一页
+    """
+    if all(len(term) >= MIN_TERM_LENGTH for term in terms):
+        docids = docid_range(cursor, user_id)
+        if docids is None:
+            return [], None
+        cursor.execute(SEARCH_SQL, (match_expression(terms), *docids, limit + 1, offset))
+    else:
+        conditions = ' AND '.join(_LIKE_TERM for _ in terms)
+        params = [user_id]
+        for term in terms:
+            pattern = f'%{_escape_like(term)}%'
+            params += [pattern, pattern, pattern]
+        cursor.execute(LIKE_SEARCH_SQL.format(conditions=conditions), params + [limit + 1, offset])
+
+    rows = cursor.fetchall()
+    next_cursor = encode_cursor([offset + limit]) if len(rows) > limit else None
+    width = len(JOURNAL_MAPPER.keys)
+    return [(row[:width], row[width]) for row in rows[:limit]], next_cursor
+
+
+def backfill(conn, batch_size=BACKFILL_BATCH_SIZE, progress=None):
+    """
+    把尚未建立索引的日记写入全文索引，返回写入的数量
+
+    按主键顺序分批处理，每批一个事务，回填期间其他请求仍可正常写入；
+    docid的分配方式与插入触发器相同
+    """
+    total = 0
+    last_id = ''
+    cursor = conn.cursor()
+    while True:
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.execute(f'''
+                SELECT j.id, j.user_id, j.title, j.tags, {searchable_content_sql('j.content')}
+                FROM journals j
+                WHERE j.id > ?
+                  AND NOT EXISTS (SELECT 1 FROM journal_search_docs d WHERE d.journal_id = j.id)
+                ORDER BY j.id
+                LIMIT ?
+            ''', (last_id, batch_size))
+            rows = cursor.fetchall()
+            for journal_id, user_id, title, tags, content in rows:
+                cursor.execute('INSERT OR IGNORE INTO journal_search_users (user_id) VALUES (?)', (user_id,))
+                cursor.execute(f'INSERT INTO journal_search_docs (docid, journal_id) VALUES ({_NEXT_DOCID}, ?)',
+                               (user_id, user_id, user_id, journal_id))
+                cursor.execute('INSERT INTO journals_fts (rowid, title, tags, content) VALUES (?, ?, ?, ?)',
+                               (cursor.lastrowid, title, tags, content))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        if not rows:
+            return total
+        total += len(rows)
+        last_id = rows[-1][0]
+        if progress:
+            progress(total)
+
+
+def rebuild(conn, batch_size=BACKFILL_BATCH_SIZE, progress=None):
+    """清空并重建全文索引"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM journals_fts')
+        conn.execute('DELETE FROM journal_search_docs')
+        conn.execute('DELETE FROM journal_search_users')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    total = backfill(conn, batch_size, progress)
+    conn.execute("INSERT INTO journals_fts (journals_fts) VALUES ('optimize')")
+    conn.commit()
+    return total
+
+
+# 命令行用法：
+#   python search.py backfill [数据库文件]   为升级前已有的日记建立全文索引
+#   python search.py rebuild [数据库文件]    清空并重建全文索引
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ('backfill', 'rebuild'):
+        sys.exit('usage: python search.py backfill|rebuild [database]')
+    command = sys.argv[1]
+    database = sys.argv[2] if len(sys.argv) > 2 else 'moment_keep.db'
+
+    from migrations import run_migrations
+
+    conn = sqlite3.connect(database)
+    run_migrations(conn)
+
+    def report(count):
+        print(f'  {count} journals indexed', end='\r', flush=True)
+
+    count = (backfill if command == 'backfill' else rebuild)(conn, progress=report)
+    conn.close()
+    print(f'{command}: {count} journals indexed in {database}')
@@ -0,0 +1,179 @@
+import json
+from functools import lru_cache
+
+from flask.json.provider import DefaultJSONProvider
+
+# orjson 为可选依赖（pip install orjson），安装后JSON编解码会快很多；
+# 未安装时自动回退到标准库 json，接口输出内容不变
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# JSON 编解码
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+    json_loads = orjson.loads
+else:
+    json_loads = json.loads
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """使用标准库json的JSON提供者，额外提供紧凑输出的 dumps_bytes 供流式响应使用"""
+
+    name = 'stdlib'
+
+    def dumps_bytes(self, obj):
+        return json.dumps(obj, separators=(',', ':'), sort_keys=self.sort_keys,
+                          ensure_ascii=self.ensure_ascii, default=self.default).encode('utf-8')
+
+
+class OrjsonProvider(StdlibJSONProvider):
+    """
+    基于orjson的JSON提供者
+
+    只处理紧凑输出的常见路径；需要缩进等定制参数时回退到标准库实现
+    """
+
+    name = 'orjson'
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.keys() - {'separators'}:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS, default=self.default).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def dumps_bytes(self, obj):
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS, default=self.default)
+
+    def response(self, *args, **kwargs):
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj) + b'\n', mimetype=self.mimetype)
+
+
+JSON_PROVIDERS = {
+    'stdlib': StdlibJSONProvider,
+    'orjson': OrjsonProvider,
+}
+
+
+def install_json_provider(app, backend=None):
+    """
+    为应用安装JSON提供者
+
+    backend 可为 'orjson' / 'stdlib'，为空时读取 app.config['JSON_BACKEND']，
+    仍未指定时在安装了orjson的情况下优先使用orjson
+    """
+    backend = backend or app.config.get('JSON_BACKEND') or ('orjson' if orjson is not None else 'stdlib')
+    if backend == 'orjson' and orjson is None:
+        raise RuntimeError('JSON_BACKEND is orjson but orjson is not installed')
+    app.json = JSON_PROVIDERS[backend](app)
+    return app.json
+
+
+# 数据库行序列化
+#
+# 每张表一个预先编译好的映射器：查询的列顺序在模块加载时就已确定（见 RowMapper.columns），
+# 转换时直接按位置把整行zip成字典，只对少数需要转换类型的列单独处理，
+# 不再逐列按名称读取 sqlite3.Row
+
+class RowMapper:
+    """
+    将按 columns 顺序查询出的行转换为字典
+
+    fields 为 (字段名, 转换函数或None) 的列表，字段名同时也是数据库列名；
+    查询时应使用 SELECT {mapper.columns} 保证列顺序一致
+    """
+
+    def __init__(self, *fields):
+        self.keys = tuple(name for name, _ in fields)
+        self.columns = ', '.join(self.keys)
+        self.converters = tuple((name, convert) for name, convert in fields if convert is not None)
+
+    def __call__(self, row):
+        result = dict(zip(self.keys, row))
+        for name, convert in self.converters:
+            result[name] = convert(result[name])
+        return result
+
+
+# 同一用户的日记往往只使用少数几种标签组合，按tags原文缓存解析结果，
+# 列表中每种组合只解析一次。数组返回元组，避免共享的结果被调用方修改（编码为JSON时与列表相同）；
+# 创建和更新接口都接受 "tags": null 等非数组的值，这些值按解析结果原样返回
+TAGS_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=TAGS_CACHE_SIZE)
+def _parse_tags(value):
+    tags = json_loads(value)
+    return tuple(tags) if isinstance(tags, list) else tags
+
+
+def _tags(value):
+    # 绝大多数日记没有标签，跳过空数组的解析
+    if value == '[]':
+        return ()
+    return _parse_tags(value)
+
+
+JOURNAL_MAPPER = RowMapper(
+    ('id', None),
+    ('category_id', None),
+    ('title', None),
+    ('content', None),  # 直接返回加密后的内容，不要进行JSON解析
+    ('tags', _tags),
+    ('date', None),
+    ('created_at', None),
+    ('updated_at', None),
+    ('user_id', None),
+)
+
+CATEGORY_MAPPER = RowMapper(
+    ('id', None),
+    ('name', None),
+    ('type', None),
+    ('created_at', None),
+    ('updated_at', None),
+    ('user_id', None),
+)
+
+HABIT_MAPPER = RowMapper(
+    ('id', None),
+    ('name', None),
+    ('description', None),
+    ('frequency', None),
+    ('target', None),
+    ('start_date', None),
+    ('end_date', None),
+    ('created_at', None),
+    ('updated_at', None),
+    ('user_id', None),
+)
+
+TODO_MAPPER = RowMapper(
+    ('id', None),
+    ('title', None),
+    ('description', None),
+    ('is_completed', bool),
+    ('due_date', None),
+    ('priority', None),
+    ('created_at', None),
+    ('updated_at', None),
+    ('user_id', None),
+)
+
+# 表名到映射器的对应关系
+MAPPERS = {
+    'journals': JOURNAL_MAPPER,
+    'categories': CATEGORY_MAPPER,
+    'habits': HABIT_MAPPER,
+    'todos': TODO_MAPPER,
+}
@@ -0,0 +1,80 @@
+from migrations import CHECKIN_STAT_BUCKETS, STAT_BUCKETS, STAT_COUNTERS
+
+# 用户统计
+#
+# 计数由 migrations.py 中第10、16个迁移创建的触发器在每次写入时增量维护，
+# 这里只按主键读取 user_stats 的一行，以及 user_stat_buckets 中最近的若干个分组。
+
+# 各分组维度默认/最多返回的分组数（按分组值倒序，即最近的在前）
+DEFAULT_BUCKET_LIMITS = {
+    'day': 30,
+    'week': 12,
+    'month': 12,
+    'start_month': 12,
+    'frequency': 50,
+}
+MAX_BUCKET_LIMIT = 366
+
+# 查询参数名到分组维度的对应关系，例如 ?days=7 只返回最近7天的日记数
+BUCKET_LIMIT_ARGS = {
+    'days': 'day',
+    'weeks': 'week',
+    'months': 'month',
+}
+
+# 资源 -> 分组维度
+BUCKET_RESOURCES = {table: [dimension for dimension, _, _ in buckets] for table, buckets in STAT_BUCKETS.items()}
+BUCKET_RESOURCES['habit_checkins'] = [dimension for dimension, _ in CHECKIN_STAT_BUCKETS]
+
+BUCKETS_SQL = '''
+    SELECT bucket, count FROM user_stat_buckets
+    WHERE user_id = ? AND resource = ? AND dimension = ?
+    ORDER BY bucket DESC
+    LIMIT ?
+'''
+
+
+def parse_stats_args(args):
+    """解析各维度返回的分组数，返回 {维度: 数量}，参数不合法时抛出 ValueError"""
+    limits = dict(DEFAULT_BUCKET_LIMITS)
+    for name, dimension in BUCKET_LIMIT_ARGS.items():
+        value = args.get(name)
+        if value is None:
+            continue
+        try:
+            value = int(value)
+        except ValueError:
+            raise ValueError(f'Invalid {name} parameter')
+        if value < 0:
+            raise ValueError(f'Invalid {name} parameter')
+        limits[dimension] = min(value, MAX_BUCKET_LIMIT)
+    return limits
+
+
+def read_stats(cursor, user_id, limits=None):
+    """
+    读取用户的统计数据
+
+    返回 {资源: {count, 各维度的分组计数}}，待办事项另有 completed 和 completion_ratio，
+    habit_checkins 只有按天/月的打卡次数；分组计数为 [{bucket, count}] 列表，按分组值倒序
+    """
+    limits = limits or DEFAULT_BUCKET_LIMITS
+    cursor.execute(f"SELECT {', '.join(STAT_COUNTERS)}, todos_completed FROM user_stats WHERE user_id = ?",
+                   (user_id,))
+    row = cursor.fetchone() or (0,) * (len(STAT_COUNTERS) + 1)
+    counts = dict(zip(STAT_COUNTERS, row))
+
+    result = {table: {'count': counts[table]} for table in STAT_COUNTERS}
+    completed = row[-1]
+    result['todos']['completed'] = completed
+    result['todos']['completion_ratio'] = round(completed / counts['todos'], 4) if counts['todos'] else 0.0
+
+    for table, dimensions in BUCKET_RESOURCES.items():
+        for dimension in dimensions:
+            limit = limits.get(dimension, DEFAULT_BUCKET_LIMITS[dimension])
+            buckets = []
+            if limit:
+                cursor.execute(BUCKETS_SQL, (user_id, table, dimension, limit))
+                buckets = [{'bucket': bucket, 'count': count} for bucket, count in cursor.fetchall()]
+            result.setdefault(table, {})[f'by_{dimension}'] = buckets
+    return result
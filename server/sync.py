@@ -0,0 +1,116 @@
+import datetime
+
+from migrations import SYNC_TABLES
+from pagination import encode_cursor, decode_cursor
+from serializers import MAPPERS
+
+# 删除墓碑的保留天数，早于该时间的墓碑会被清理；
+# 同步位置早于已清理范围的客户端需要重新全量同步
+SYNC_TOMBSTONE_RETENTION_DAYS = 90
+
+
+def encode_sync_token(seq):
+    return encode_cursor([seq])
+
+
+def decode_sync_token(token):
+    """解析同步令牌，返回同步序号；令牌为空表示首次同步，返回0"""
+    if not token:
+        return 0
+    seq = decode_cursor(token, 1)[0]
+    if not isinstance(seq, int) or seq < 0:
+        raise ValueError('Invalid sync token')
+    return seq
+
+
+def table_version(cursor, table, user_id):
+    """
+    返回用户在某张表上的数据版本号
+
+    取该用户现存行和删除墓碑中最大的同步序号，任何新增、修改或删除都会使其增大；
+    两次查询都只是一次索引查找，不读取数据行
+    """
+    cursor.execute(f'SELECT MAX(sync_seq) FROM {table} WHERE user_id = ?', (user_id,))
+    row_seq = cursor.fetchone()[0] or 0
+    cursor.execute('SELECT MAX(sync_seq) FROM sync_tombstones WHERE user_id = ? AND resource = ?',
+                   (user_id, table))
+    tombstone_seq = cursor.fetchone()[0] or 0
+    return max(row_seq, tombstone_seq)
+
+
+# 按id读取版本号时强制使用的覆盖索引
+# SQLite会优先选择主键的唯一索引，而日记行较大，需要显式指定覆盖索引以避免读取数据行
+ROW_VERSION_INDEXES = {
+    'journals': 'idx_journals_id_user_sync',
+}
+
+
+def row_version(cursor, table, record_id):
+    """返回单条记录的 (同步序号, 所属用户id)，记录不存在时返回None"""
+    indexed_by = f' INDEXED BY {ROW_VERSION_INDEXES[table]}' if table in ROW_VERSION_INDEXES else ''
+    cursor.execute(f'SELECT sync_seq, user_id FROM {table}{indexed_by} WHERE id = ?', (record_id,))
+    row = cursor.fetchone()
+    return (row[0], row[1]) if row else None
+
+
+def collect_changes(conn, user_id, since):
+    """
+    在同一个读事务中收集用户自 since 之后的全部变更
+
+    返回字典：
+    - rows: {表名: 变更后的行列表}
+    - deleted: {表名: 被删除的id列表}
+    - seq: 本次同步的高水位序号
+    - reset: 客户端的同步位置早于已清理的墓碑，需要丢弃本地数据按全量结果重建
+    """
+    cursor = conn.cursor()
+    # WAL模式下读事务看到的是一致的快照，各表之间不会出现半截的写入
+    cursor.execute('BEGIN')
+    try:
+        cursor.execute('SELECT seq, pruned_seq FROM sync_state WHERE id = 1')
+        state = cursor.fetchone()
+        high_water = state['seq']
+
+        # 墓碑已被清理，或令牌不属于当前数据库时，退回全量同步
+        reset = since > 0 and (since < state['pruned_seq'] or since > high_water)
+        if reset:
+            since = 0
+
+        # 迁移前已存在的行 sync_seq 为0，只会出现在全量同步中
+        lower = since if since else -1
+        rows = {}
+        for table in SYNC_TABLES:
+            cursor.execute(
+                f'SELECT {MAPPERS[table].columns} FROM {table} WHERE user_id = ? AND sync_seq > ? AND sync_seq <= ?',
+                (user_id, lower, high_water)
+            )
+            rows[table] = cursor.fetchall()
+
+        deleted = {table: [] for table in SYNC_TABLES}
+        if since:
+            cursor.execute(
+                'SELECT resource, id FROM sync_tombstones WHERE user_id = ? AND sync_seq > ? AND sync_seq <= ?',
+                (user_id, since, high_water)
+            )
+            for tombstone in cursor.fetchall():
+                deleted[tombstone['resource']].append(tombstone['id'])
+    finally:
+        conn.rollback()
+
+    return {'rows': rows, 'deleted': deleted, 'seq': high_water, 'reset': reset}
+
+
+def prune_tombstones(conn, retention_days=SYNC_TOMBSTONE_RETENTION_DAYS):
+    """清理过期的删除墓碑，并记录已清理到的序号"""
+    cutoff = (datetime.datetime.now() - datetime.timedelta(days=retention_days)).isoformat()
+    cursor = conn.cursor()
+    cursor.execute('SELECT MAX(sync_seq) AS max_seq FROM sync_tombstones WHERE deleted_at < ?', (cutoff,))
+    max_seq = cursor.fetchone()['max_seq']
+    if max_seq is None:
+        return 0
+
+    cursor.execute('DELETE FROM sync_tombstones WHERE deleted_at < ?', (cutoff,))
+    removed = cursor.rowcount
+    cursor.execute('UPDATE sync_state SET pruned_seq = MAX(pruned_seq, ?) WHERE id = 1', (max_seq,))
+    conn.commit()
+    return removed
@@ -0,0 +1,56 @@
+import os
+import tempfile
+import unittest
+
+from app import create_app, init_db
+
+
+# 测试共用的应用夹具：每个测试在临时目录中使用新的数据库和上传目录
+
+TEST_CONFIG = {
+    'BLOB_GC_ENABLED': False,
+    'LOG_LEVEL': 'WARNING',
+}
+
+# 需要注册/登录的测试使用较快的密码哈希，并关闭登录限流
+AUTH_CONFIG = {
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    'LOGIN_RATE_LIMIT_ENABLED': False,
+}
+
+
+def make_app(tmpdir, **overrides):
+    """在 tmpdir 中初始化数据库并创建应用，overrides 覆盖默认的测试配置；同一目录多次调用时共用数据库"""
+    database = os.path.join(tmpdir, 'test.db')
+    init_db(database)
+    return create_app({
+        'DATABASE': database,
+        'UPLOAD_FOLDER': os.path.join(tmpdir, 'uploads'),
+        **TEST_CONFIG,
+        **overrides,
+    })
+
+
+def login(client, name, password='secret'):
+    """注册（已存在时忽略）并登录用户 name，返回登录响应的JSON"""
+    account = {'username': name, 'email': f'{name}@example.com', 'password': password}
+    client.post('/api/auth/register', json=account)
+    response = client.post('/api/auth/login', json=account)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()
+
+
+def bearer(tokens):
+    return {'Authorization': f"Bearer {tokens['access_token']}"}
+
+
+class AppTestCase(unittest.TestCase):
+    """每个测试创建一个应用（self.app）和测试客户端（self.client），子类可通过 config 覆盖配置"""
+
+    config = {}
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.app = make_app(self.tmp.name, **self.config)
+        self.client = self.app.test_client()
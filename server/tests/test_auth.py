@@ -0,0 +1,113 @@
+import sqlite3
+import unittest
+from unittest import mock
+
+import auth
+from auth import TokenBucketLimiter
+from tests import AppTestCase
+
+
+class TokenBucketLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(auth.time, 'monotonic', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_refill(self):
+        limiter = TokenBucketLimiter(rate_per_minute=6, burst=2)
+        self.assertEqual(limiter.acquire('ip:a'), (True, 0))
+        self.assertEqual(limiter.acquire('ip:a'), (True, 0))
+        allowed, wait = limiter.acquire('ip:a')
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(wait, 10)
+
+        # 每10秒补充一个令牌
+        self.now += 10
+        self.assertTrue(limiter.acquire('ip:a')[0])
+        self.assertFalse(limiter.acquire('ip:a')[0])
+        self.assertEqual(limiter.stats()['limited'], 2)
+
+    def test_limited_key_does_not_consume_others(self):
+        limiter = TokenBucketLimiter(rate_per_minute=6, burst=1)
+        self.assertTrue(limiter.acquire('email:x')[0])
+        self.assertFalse(limiter.acquire('ip:a', 'email:x')[0])
+        # ip:a 的令牌没有被消耗
+        self.assertTrue(limiter.acquire('ip:a', 'email:y')[0])
+
+    def test_least_recently_used_keys_are_evicted(self):
+        limiter = TokenBucketLimiter(rate_per_minute=6, burst=1, max_keys=2)
+        for key in ('a', 'b', 'c'):
+            self.assertTrue(limiter.acquire(key)[0])
+        stats = limiter.stats()
+        self.assertEqual((stats['tracked_keys'], stats['evictions']), (2, 1))
+        # 被淘汰的键重新获得一个满桶
+        self.assertTrue(limiter.acquire('a')[0])
+        self.assertFalse(limiter.acquire('c')[0])
+
+    def test_disabled(self):
+        limiter = TokenBucketLimiter(burst=1, enabled=False)
+        for _ in range(5):
+            self.assertEqual(limiter.acquire('ip:a'), (True, 0))
+
+
+class LoginTest(AppTestCase):
+    config = {'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000', 'LOGIN_RATE_BURST': 2}
+
+    def setUp(self):
+        super().setUp()
+        self.account = {'username': 'alice', 'email': 'alice@example.com', 'password': 'secret'}
+        self.assertEqual(self.client.post('/api/auth/register', json=self.account).status_code, 201)
+        self.app.extensions['login_limiter'].enabled = False
+
+    def stored_password(self):
+        conn = sqlite3.connect(self.app.config['DATABASE'])
+        try:
+            return conn.execute('SELECT password FROM users WHERE email = ?', (self.account['email'],)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def set_stored_password(self, value):
+        conn = sqlite3.connect(self.app.config['DATABASE'])
+        with conn:
+            conn.execute('UPDATE users SET password = ? WHERE email = ?', (value, self.account['email']))
+        conn.close()
+
+    def login(self, password='secret', **environ):
+        return self.client.post('/api/auth/login', json={**self.account, 'password': password},
+                                environ_base=environ)
+
+    def test_password_is_stored_hashed(self):
+        self.assertTrue(self.stored_password().startswith('pbkdf2:sha256:1000$'))
+
+    def test_plaintext_password_is_upgraded_on_login(self):
+        self.set_stored_password('secret')
+        self.assertEqual(self.login().status_code, 200)
+        stored = self.stored_password()
+        self.assertTrue(stored.startswith('pbkdf2:sha256:1000$'))
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_changed_method_is_rehashed_on_login(self):
+        old = self.stored_password()
+        self.app.extensions['password_hasher'].method = 'pbkdf2:sha256:2000'
+        self.assertEqual(self.login().status_code, 200)
+        self.assertNotEqual(self.stored_password(), old)
+        self.assertTrue(self.stored_password().startswith('pbkdf2:sha256:2000$'))
+
+    def test_failed_login_does_not_rehash(self):
+        self.set_stored_password('secret')
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.assertEqual(self.stored_password(), 'secret')
+
+    def test_login_is_rate_limited_per_email(self):
+        self.app.extensions['login_limiter'].enabled = True
+        # 不同IP对同一邮箱的尝试共用邮箱的令牌桶
+        for address in ('203.0.113.1', '203.0.113.2'):
+            self.assertEqual(self.login('wrong', REMOTE_ADDR=address).status_code, 401)
+        response = self.login(REMOTE_ADDR='203.0.113.3')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response.headers['Retry-After']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import sqlite3
+import unittest
+
+from tests import AppTestCase
+
+
+# 批量写入：逐项返回结果，整个批次在一个事务中提交
+
+class BatchWriteTest(AppTestCase):
+    def create(self, resource, data):
+        response = self.client.post(f'/api/{resource}', json={**data, 'user_id': 'u1'})
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()['id']
+
+    def batch(self, operations):
+        return self.client.post('/api/batch', json={'user_id': 'u1', 'operations': operations})
+
+    def titles(self, resource):
+        return sorted(item['title'] for item in self.client.get(f'/api/{resource}?user_id=u1').get_json())
+
+    def test_mixed_operations(self):
+        journal_id = self.create('journals', {'title': 'old', 'content': 'c'})
+        habit_id = self.create('habits', {'name': 'h', 'frequency': 'daily', 'target': 1,
+                                          'start_date': '2026-01-01'})
+        self.assertEqual(self.titles('todos'), [])  # 列表进入缓存，批量写入后应失效
+
+        response = self.batch([
+            {'op': 'create', 'resource': 'todos', 'data': {'title': 'new'}},
+            {'op': 'update', 'resource': 'journals', 'id': journal_id, 'data': {'title': 'renamed'}},
+            {'op': 'delete', 'resource': 'habits', 'id': habit_id},
+        ])
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body['applied'], 3)
+        self.assertEqual([result['status'] for result in body['results']], [201, 200, 200])
+        self.assertEqual(body['results'][1]['id'], journal_id)
+
+        self.assertEqual(self.titles('todos'), ['new'])
+        self.assertEqual(self.titles('journals'), ['renamed'])
+        self.assertEqual(self.client.get(f'/api/habits/{habit_id}').status_code, 404)
+
+    def test_per_item_errors(self):
+        todo_id = self.create('todos', {'title': 't'})
+        response = self.batch([
+            'not an operation',
+            {'op': 'rename', 'resource': 'todos', 'id': todo_id},
+            {'op': 'create', 'resource': 'todos', 'data': {}},
+            {'op': 'update', 'resource': 'todos', 'data': {'title': 'x'}},
+            {'op': 'update', 'resource': 'todos', 'id': 'missing', 'data': {'title': 'x'}},
+            {'op': 'delete', 'resource': 'journals', 'id': 'missing'},
+            {'op': 'update', 'resource': 'todos', 'id': todo_id, 'data': {'title': 'ok'}},
+        ])
+        body = response.get_json()
+        self.assertEqual([result['status'] for result in body['results']], [400, 400, 400, 400, 404, 404, 200])
+        self.assertEqual([result['index'] for result in body['results']], list(range(7)))
+        self.assertEqual(body['applied'], 1)
+        self.assertEqual(self.titles('todos'), ['ok'])
+
+    def test_failure_rolls_back_whole_batch(self):
+        journal_id = self.create('journals', {'title': 'old', 'content': 'c'})
+        conn = sqlite3.connect(self.app.config['DATABASE'])
+        with conn:
+            conn.execute("CREATE TRIGGER fail_todo_insert BEFORE INSERT ON todos WHEN NEW.title = 'boom' "
+                         "BEGIN SELECT RAISE(ABORT, 'boom'); END")
+        conn.close()
+
+        response = self.batch([
+            {'op': 'update', 'resource': 'journals', 'id': journal_id, 'data': {'title': 'renamed'}},
+            {'op': 'create', 'resource': 'todos', 'data': {'title': 'fine'}},
+            {'op': 'delete', 'resource': 'journals', 'id': journal_id},
+            {'op': 'create', 'resource': 'todos', 'data': {'title': 'boom'}},
+        ])
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(self.titles('journals'), ['old'])
+        self.assertEqual(self.titles('todos'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from blobstore import BLOB_DIR, blob_path, spool_stream, store_file
+from tests import make_app
+
+
+class StoreFileTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        app = make_app(self.tmp.name)
+        self.upload_folder = app.config['UPLOAD_FOLDER']
+        self.conn = sqlite3.connect(app.config['DATABASE'], isolation_level=None)
+        self.addCleanup(self.conn.close)
+
+    def store(self, content, filename):
+        tmp_path, digest, size = spool_stream(self.upload_folder, io.BytesIO(content))
+        return store_file(self.conn, self.upload_folder, tmp_path, digest, size, 'u1', filename), digest
+
+    def test_failed_insert_removes_placed_blob(self):
+        self.store(b'first', 'a.txt')
+        # (user_id, filename) 已存在，登记映射失败，整个事务回滚
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.store(b'second', 'a.txt')
+
+        rows = self.conn.execute('SELECT COUNT(*) FROM media_blobs').fetchone()[0]
+        root = os.path.join(self.upload_folder, BLOB_DIR)
+        blobs = [name for directory, _, names in os.walk(root) for name in names
+                 if os.path.relpath(directory, root) != 'tmp']
+        self.assertEqual((rows, len(blobs)), (1, 1))
+
+    def test_deduplicated_content_is_kept_on_failure(self):
+        _, digest = self.store(b'same', 'a.txt')
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.store(b'same', 'a.txt')
+        self.assertTrue(os.path.exists(blob_path(self.upload_folder, digest)))
+        self.assertEqual(self.conn.execute('SELECT refcount FROM media_blobs').fetchone()[0], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
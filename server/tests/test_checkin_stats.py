@@ -0,0 +1,43 @@
+import unittest
+
+from tests import AppTestCase
+
+
+# 打卡次数的分组计数由 habit_checkins 上的触发器维护
+
+class CheckinStatsTest(AppTestCase):
+    def create_habit(self):
+        response = self.client.post('/api/habits', json={'name': 'h', 'frequency': 'daily', 'target': 1,
+                                                         'start_date': '2026-01-01', 'user_id': 'u1'})
+        return response.get_json()['id']
+
+    def checkins(self, method, items):
+        response = self.client.open('/api/checkins?user_id=u1', method=method, json={'checkins': items})
+        self.assertEqual(response.status_code, 200)
+
+    def checkin_stats(self):
+        stats = self.client.get('/api/stats?user_id=u1').get_json()['habit_checkins']
+        return ({item['bucket']: item['count'] for item in stats['by_day']},
+                {item['bucket']: item['count'] for item in stats['by_month']})
+
+    def test_counts_follow_checkins(self):
+        first, second = self.create_habit(), self.create_habit()
+        self.checkins('POST', [{'habit_id': first, 'date': '2026-01-30', 'count': 2},
+                               {'habit_id': second, 'date': '2026-01-30'},
+                               {'habit_id': first, 'date': '2026-02-01'}])
+        self.assertEqual(self.checkin_stats(), ({'2026-01-30': 3, '2026-02-01': 1}, {'2026-01': 3, '2026-02': 1}))
+
+        # 重复打卡覆盖当天的次数
+        self.checkins('POST', [{'habit_id': first, 'date': '2026-01-30', 'count': 5}])
+        self.assertEqual(self.checkin_stats(), ({'2026-01-30': 6, '2026-02-01': 1}, {'2026-01': 6, '2026-02': 1}))
+
+        self.checkins('DELETE', [{'habit_id': first, 'date': '2026-02-01'}])
+        self.assertEqual(self.checkin_stats(), ({'2026-01-30': 6}, {'2026-01': 6}))
+
+        # 删除习惯时其打卡记录一并扣除
+        self.assertEqual(self.client.delete(f'/api/habits/{first}?user_id=u1').status_code, 200)
+        self.assertEqual(self.checkin_stats(), ({'2026-01-30': 1}, {'2026-01': 1}))
+
+
+if __name__ == '__main__':
+    unittest.main()
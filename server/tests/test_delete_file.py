@@ -0,0 +1,73 @@
+import io
+import os
+import unittest
+
+from tests import AppTestCase
+
+
+class DeleteFileTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.upload_folder = self.app.config['UPLOAD_FOLDER']
+
+    def upload(self, user_id, content):
+        response = self.client.post('/api/upload', data={'user_id': user_id,
+                                                         'file': (io.BytesIO(content), 'note.txt')})
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()['filename']
+
+    def delete(self, file_path, **extra):
+        return self.client.delete('/api/delete_file', json={'file_path': file_path, **extra})
+
+    def blob_paths(self):
+        root = os.path.join(self.upload_folder, '.blobs')
+        paths = [os.path.relpath(os.path.join(directory, name), self.upload_folder)
+                 for directory, _, names in os.walk(root) for name in names]
+        return [path for path in paths if not path.startswith(os.path.join('.blobs', 'tmp'))]
+
+    def test_internal_directories_are_rejected(self):
+        self.upload('u1', b'shared content')
+        self.upload('u2', b'shared content')
+        blobs = self.blob_paths()
+        self.assertEqual(len(blobs), 1)
+
+        for path in (blobs[0], '.derivatives/thumb/aa/x.jpg', '../test.db', 'u1/../u2/x', 'u1/', 'a/b/c', '/etc/passwd',
+                     '.hidden/x'):
+            self.assertEqual(self.delete(path).status_code, 400, path)
+        self.assertTrue(os.path.exists(os.path.join(self.upload_folder, blobs[0])))
+
+        # 目录不能作为文件删除
+        os.makedirs(os.path.join(self.upload_folder, 'u3', 'sub'))
+        for path in ('u3', 'u3/sub'):
+            self.assertEqual(self.delete(path).status_code, 400, path)
+
+    def test_only_own_files_when_caller_is_known(self):
+        filename = self.upload('u1', b'mine')
+        self.assertEqual(self.delete(filename, user_id='u2').status_code, 403)
+        self.assertEqual(self.delete(filename, user_id='u1').status_code, 200)
+
+    def test_legacy_file_in_user_directory(self):
+        os.makedirs(os.path.join(self.upload_folder, 'u1'))
+        path = os.path.join(self.upload_folder, 'u1', 'old.txt')
+        with open(path, 'wb') as f:
+            f.write(b'legacy')
+        self.assertEqual(self.delete('u1/old.txt').status_code, 200)
+        self.assertFalse(os.path.exists(path))
+
+    def test_legacy_file_in_upload_root(self):
+        path = os.path.join(self.upload_folder, 'name.jpg')
+        with open(path, 'wb') as f:
+            f.write(b'legacy')
+        self.assertEqual(self.client.get('/uploads/name.jpg').status_code, 200)
+
+        # 根目录下的文件无法确定所有者，已知调用者时拒绝
+        self.assertEqual(self.delete('name.jpg', user_id='u1').status_code, 403)
+        self.assertTrue(os.path.exists(path))
+
+        self.assertEqual(self.delete('name.jpg').status_code, 200)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.client.get('/uploads/name.jpg').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+from tests import AUTH_CONFIG, AppTestCase, bearer, login
+
+
+# 单条记录的条件请求不能向其他用户泄露记录是否存在及其版本
+
+RESOURCES = (
+    ('journals', {'title': 't', 'content': 'c'}),
+    ('habits', {'name': 'h', 'frequency': 'daily', 'target': 1, 'start_date': '2026-01-01'}),
+    ('todos', {'title': 't'}),
+)
+
+
+class ItemEtagOwnershipTest(AppTestCase):
+    config = AUTH_CONFIG
+
+    def setUp(self):
+        super().setUp()
+        self.alice = bearer(login(self.client, 'alice'))
+        self.bob = bearer(login(self.client, 'bob'))
+
+    def test_other_users_etag_is_not_revalidated(self):
+        for resource, data in RESOURCES:
+            record_id = self.client.post(f'/api/{resource}', json=data, headers=self.alice).get_json()['id']
+            response = self.client.get(f'/api/{resource}/{record_id}', headers=self.alice)
+            etag = response.headers['ETag']
+
+            cached = self.client.get(f'/api/{resource}/{record_id}', headers={**self.alice, 'If-None-Match': etag})
+            self.assertEqual(cached.status_code, 304)
+
+            other = self.client.get(f'/api/{resource}/{record_id}', headers={**self.bob, 'If-None-Match': etag})
+            self.assertEqual(other.status_code, 404)
+            self.assertNotIn('ETag', other.headers)
+
+    def test_other_users_records_are_not_found(self):
+        for resource, data in RESOURCES:
+            record_id = self.client.post(f'/api/{resource}', json=data, headers=self.alice).get_json()['id']
+            url = f'/api/{resource}/{record_id}'
+
+            self.assertEqual(self.client.get(url, headers=self.bob).status_code, 404, resource)
+            self.assertEqual(self.client.put(url, json=data, headers=self.bob).status_code, 404, resource)
+            self.assertEqual(self.client.delete(url, headers=self.bob).status_code, 404, resource)
+
+            # 记录未被修改或删除，所有者仍可正常读取
+            self.assertEqual(self.client.get(url, headers=self.alice).status_code, 200, resource)
+            self.assertEqual(self.client.delete(url, headers=self.alice).status_code, 200, resource)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+
+from serializers import JOURNAL_MAPPER
+from tests import AppTestCase
+
+
+# 日记的 tags 按客户端提交的JSON原样保存，可能不是数组（例如 "tags": null）
+
+class JournalTagsTest(AppTestCase):
+    def create_journal(self, title, tags):
+        response = self.client.post('/api/journals', json={'title': title, 'content': 'c', 'tags': tags,
+                                                           'user_id': 'u1'})
+        self.assertEqual(response.status_code, 201)
+        return response.get_json()['id']
+
+    def test_non_list_tags_are_returned_unchanged(self):
+        null_id = self.create_journal('null', None)
+        string_id = self.create_journal('string', 'abc')
+        list_id = self.create_journal('list', ['a', 'b'])
+
+        for stream in (True, False):
+            self.app.config['STREAM_LIST_RESPONSES'] = stream
+            self.app.config['LIST_CACHE_ENABLED'] = False
+            response = self.client.get('/api/journals?user_id=u1')
+            self.assertEqual(response.status_code, 200)
+            tags = {item['id']: item['tags'] for item in response.get_json()}
+            self.assertEqual(tags, {null_id: None, string_id: 'abc', list_id: ['a', 'b']})
+
+        self.assertIsNone(self.client.get(f'/api/journals/{null_id}?user_id=u1').get_json()['tags'])
+
+    def test_update_to_null_tags(self):
+        journal_id = self.create_journal('j', ['a'])
+        response = self.client.put(f'/api/journals/{journal_id}', json={'tags': None})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/journals?user_id=u1').get_json()[0]['tags'], None)
+
+    def test_mapper(self):
+        row = ('j', '', 't', 'c', 'null', 'd', 'd', 'd', 'u1')
+        self.assertIsNone(JOURNAL_MAPPER(row)['tags'])
+        self.assertEqual(JOURNAL_MAPPER(row[:4] + ('"abc"',) + row[5:])['tags'], 'abc')
+        self.assertEqual(JOURNAL_MAPPER(row[:4] + ('["x"]',) + row[5:])['tags'], ('x',))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import sqlite3
+import unittest
+
+from cache import create_list_cache
+from tests import AppTestCase
+
+
+# 进程内列表缓存收不到其他工作进程写入后的失效，这里直接写数据库模拟另一个进程的写入
+
+class ListCacheRevalidationTest(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.database = self.app.config['DATABASE']
+
+    def write_elsewhere(self, sql, params):
+        conn = sqlite3.connect(self.database)
+        with conn:
+            conn.execute(sql, params)
+        conn.close()
+
+    def test_write_from_another_process_is_visible(self):
+        self.client.post('/api/todos', json={'title': 'first', 'user_id': 'u1'})
+        first = self.client.get('/api/todos?user_id=u1')
+        self.assertEqual(len(first.get_json()), 1)
+        self.assertEqual(len(self.client.get('/api/todos?user_id=u1').get_json()), 1)
+
+        self.write_elsewhere("INSERT INTO todos (id, title, description, is_completed, priority, created_at, "
+                             "updated_at, user_id) VALUES ('t2', 'second', '', 0, 'medium', 'x', 'x', 'u1')", ())
+        second = self.client.get('/api/todos?user_id=u1', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(len(second.get_json()), 2)
+
+        stats = self.client.get('/admin/cache_stats').get_json()
+        self.assertEqual(stats['stale_hits'], 1)
+
+    def test_tags_are_revalidated(self):
+        self.client.post('/api/journals', json={'title': 't', 'content': 'c', 'tags': ['a'], 'user_id': 'u1'})
+        self.assertEqual(self.client.get('/api/tags?user_id=u1').get_json(), [{'tag': 'a', 'count': 1}])
+
+        self.write_elsewhere("UPDATE journals SET tags = ? WHERE user_id = 'u1'", ('["b"]',))
+        self.assertEqual(self.client.get('/api/tags?user_id=u1').get_json(), [{'tag': 'b', 'count': 1}])
+
+    def test_unchanged_list_is_served_from_cache(self):
+        self.client.post('/api/todos', json={'title': 'first', 'user_id': 'u1'})
+        first = self.client.get('/api/todos?user_id=u1')
+        first.get_data()  # 流式响应发送完毕后才写入缓存
+        cached = self.client.get('/api/todos?user_id=u1', headers={'If-None-Match': first.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        stats = self.client.get('/admin/cache_stats').get_json()
+        self.assertEqual((stats['hits'], stats['stale_hits']), (1, 0))
+
+
+class ListCacheConfigTest(unittest.TestCase):
+    def test_redis_backend_requires_url(self):
+        with self.assertRaisesRegex(RuntimeError, 'LIST_CACHE_REDIS_URL'):
+            create_list_cache({'LIST_CACHE_BACKEND': 'redis', 'LIST_CACHE_REDIS_URL': None})
+
+
+if __name__ == '__main__':
+    unittest.main()
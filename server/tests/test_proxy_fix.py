@@ -0,0 +1,36 @@
+import tempfile
+import unittest
+
+from tests import make_app
+
+
+# 反向代理之后按 X-Forwarded-For 中的客户端地址限流
+
+class ProxyFixRateLimitTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def client(self, **config):
+        return make_app(self.tmp.name, PASSWORD_HASH_METHOD='pbkdf2:sha256:1000', LOGIN_RATE_BURST=1,
+                        **config).test_client()
+
+    def register(self, client, index, forwarded_for):
+        account = {'username': f'user{index}', 'email': f'user{index}@example.com', 'password': 'secret'}
+        return client.post('/api/auth/register', json=account,
+                           headers={'X-Forwarded-For': forwarded_for}).status_code
+
+    def test_clients_behind_proxy_get_separate_buckets(self):
+        client = self.client(PROXY_FIX_X_FOR=1)
+        self.assertEqual(self.register(client, 1, '203.0.113.1'), 201)
+        self.assertEqual(self.register(client, 2, '203.0.113.2'), 201)
+        self.assertEqual(self.register(client, 3, '203.0.113.1'), 429)
+
+    def test_forwarded_header_is_ignored_by_default(self):
+        client = self.client()
+        self.assertEqual(self.register(client, 1, '203.0.113.1'), 201)
+        self.assertEqual(self.register(client, 2, '203.0.113.2'), 429)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import io
+import threading
+import time
+import unittest
+from unittest import mock
+
+import thumbnails
+from thumbnails import ThumbnailPool
+from tests import AppTestCase
+
+
+# 生成过程用替身代替，不依赖Pillow：Image 换成占位对象使线程池可用，render_derivative 换成总是失败的函数
+
+class FakePillowMixin:
+    def setUp(self):
+        self.renders = []
+        self.rendered = threading.Event()
+        for name, value in (('Image', object()), ('render_derivative', self.broken_render)):
+            patcher = mock.patch.object(thumbnails, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        super().setUp()
+
+    def broken_render(self, source_path, target_path, max_side):
+        self.renders.append(target_path)
+        self.rendered.set()
+        raise OSError('cannot identify image file')
+
+
+class ThumbnailPoolTest(FakePillowMixin, unittest.TestCase):
+    def test_full_queue_waits_at_most_timeout(self):
+        pool = ThumbnailPool(workers=1, queue_size=1)  # 不启动工作线程，队列不会被消费
+        self.assertIsNotNone(pool.submit('a.jpg', 'a-thumb.jpg', 256))
+
+        started = time.monotonic()
+        self.assertIsNone(pool.submit('b.jpg', 'b-thumb.jpg', 256, wait=True, timeout=0.05))
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(pool.stats()['dropped'], 1)
+
+    def test_failed_render_is_not_retried_until_ttl(self):
+        pool = ThumbnailPool(workers=1, failure_ttl=60).start()
+        future = pool.submit('bad.jpg', 'bad-thumb.jpg', 256, wait=True, timeout=1)
+        with self.assertRaises(OSError):
+            future.result(timeout=5)
+        self.assertTrue(self.rendered.wait(5))
+
+        self.assertIsNone(pool.submit('bad.jpg', 'bad-thumb.jpg', 256, wait=True, timeout=1))
+        self.assertEqual(self.renders, ['bad-thumb.jpg'])
+        stats = pool.stats()
+        self.assertEqual((stats['failed'], stats['skipped'], stats['recent_failures']), (1, 1, 1))
+
+        with mock.patch.object(thumbnails.time, 'monotonic', lambda: time.time() + 10 ** 9):
+            self.assertIsNotNone(pool.submit('bad.jpg', 'bad-thumb.jpg', 256))
+
+
+class ThumbnailRouteTest(FakePillowMixin, AppTestCase):
+    """?size= 请求无法得到派生图时返回原图"""
+
+    config = {'THUMBNAIL_WAIT_TIMEOUT': 0.05}
+    content = b'not really a png'
+
+    def upload(self):
+        response = self.client.post('/api/upload', data={'user_id': 'u1',
+                                                         'file': (io.BytesIO(self.content), 'photo.png')})
+        self.assertEqual(response.status_code, 201)
+        return '/uploads/' + response.get_json()['filename']
+
+    def get(self, url):
+        response = self.client.get(url)
+        response.direct_passthrough = False
+        self.assertEqual(response.status_code, 200)
+        return response.get_data()
+
+    def test_failed_render_serves_original(self):
+        url = self.upload()
+        # 上传后在后台生成各尺寸，全部失败
+        pool = self.app.extensions['thumbnails']
+        deadline = time.monotonic() + 5
+        while (pool.stats()['failed'] < len(thumbnails.SIZES) or pool.stats()['in_flight']) \
+                and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        for _ in range(2):
+            self.assertEqual(self.get(f'{url}?size=thumb'), self.content)
+        # 最近失败过的派生图不再重新生成
+        self.assertEqual(len(self.renders), len(thumbnails.SIZES))
+        self.assertGreaterEqual(pool.stats()['skipped'], 2)
+
+    def test_invalid_size(self):
+        url = self.upload()
+        self.assertEqual(self.client.get(f'{url}?size=huge').status_code, 400)
+
+
+class ThumbnailQueueFullRouteTest(FakePillowMixin, AppTestCase):
+    # 没有工作线程，上传时排入的任务占满队列
+    config = {'THUMBNAIL_WORKERS': 0, 'THUMBNAIL_QUEUE_SIZE': 1, 'THUMBNAIL_WAIT_TIMEOUT': 0.05}
+
+    def test_full_queue_serves_original(self):
+        content = b'not really a png'
+        response = self.client.post('/api/upload', data={'user_id': 'u1',
+                                                         'file': (io.BytesIO(content), 'photo.png')})
+        url = '/uploads/' + response.get_json()['filename']
+        self.assertEqual(self.app.extensions['thumbnails'].stats()['queue_depth'], 1)
+
+        for size in thumbnails.SIZES:
+            started = time.monotonic()
+            response = self.client.get(f'{url}?size={size}')
+            response.direct_passthrough = False
+            self.assertEqual((response.status_code, response.get_data()), (200, content), size)
+            self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(self.renders, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
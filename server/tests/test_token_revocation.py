@@ -0,0 +1,30 @@
+import tempfile
+import unittest
+
+from tests import AUTH_CONFIG, bearer, login, make_app
+
+
+# 两个应用实例共用同一个数据库，模拟gunicorn的两个工作进程
+
+class TokenRevocationTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        config = {**AUTH_CONFIG, 'TOKEN_REVOCATION_SYNC_INTERVAL': 0}
+        self.worker_a = make_app(self.tmp.name, **config).test_client()
+        self.worker_b = make_app(self.tmp.name, **config).test_client()
+
+    def test_logout_is_seen_by_other_workers(self):
+        headers = bearer(login(self.worker_a, 'alice'))
+
+        self.assertEqual(self.worker_b.get('/api/todos', headers=headers).status_code, 200)
+        self.assertEqual(self.worker_a.post('/api/auth/logout', headers=headers).status_code, 200)
+
+        for worker in (self.worker_a, self.worker_b):
+            response = worker.get('/api/todos', headers=headers)
+            self.assertEqual(response.status_code, 401)
+            self.assertEqual(response.get_json()['error'], 'Token revoked')
+
+
+if __name__ == '__main__':
+    unittest.main()
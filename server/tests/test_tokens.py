@@ -0,0 +1,70 @@
+import unittest
+
+from tests import AUTH_CONFIG, AppTestCase, bearer, login
+
+
+# 访问令牌的签发与校验、刷新令牌的轮换与重复使用检测
+
+class TokenTest(AppTestCase):
+    config = AUTH_CONFIG
+
+    def refresh(self, refresh_token):
+        return self.client.post('/api/auth/refresh', json={'refresh_token': refresh_token})
+
+    def test_login_issues_token_pair(self):
+        tokens = login(self.client, 'alice')
+        self.assertEqual(tokens['token_type'], 'Bearer')
+        self.assertEqual(tokens['expires_in'], self.app.config['ACCESS_TOKEN_TTL'])
+        self.assertTrue(tokens['refresh_token'])
+
+        self.client.post('/api/todos', json={'title': 't'}, headers=bearer(tokens))
+        # 令牌中的用户即数据所有者，不需要再传 user_id
+        todos = self.client.get(f"/api/todos?user_id={tokens['id']}").get_json()
+        self.assertEqual([todo['title'] for todo in todos], ['t'])
+
+    def test_invalid_tokens_are_rejected(self):
+        tokens = login(self.client, 'alice')
+        payload, signature = tokens['access_token'].split('.')
+        for token in (f'{payload}.{signature[:-2]}AA', 'garbage', tokens['refresh_token']):
+            response = self.client.get('/api/todos', headers={'Authorization': f'Bearer {token}'})
+            self.assertEqual(response.status_code, 401, token)
+
+        # 令牌中的用户与请求参数中的 user_id 不一致
+        response = self.client.get('/api/todos?user_id=someone-else', headers=bearer(tokens))
+        self.assertEqual(response.status_code, 403)
+
+    def test_refresh_rotates_tokens(self):
+        tokens = login(self.client, 'alice')
+        response = self.refresh(tokens['refresh_token'])
+        self.assertEqual(response.status_code, 200)
+        rotated = response.get_json()
+        self.assertNotEqual(rotated['refresh_token'], tokens['refresh_token'])
+        self.assertEqual(self.client.get('/api/todos', headers=bearer(rotated)).status_code, 200)
+
+        # 新的刷新令牌可以继续轮换
+        self.assertEqual(self.refresh(rotated['refresh_token']).status_code, 200)
+
+    def test_reused_refresh_token_revokes_family(self):
+        tokens = login(self.client, 'alice')
+        rotated = self.refresh(tokens['refresh_token']).get_json()
+
+        reused = self.refresh(tokens['refresh_token'])
+        self.assertEqual(reused.status_code, 401)
+        self.assertEqual(reused.get_json()['error'], 'Refresh token reused or revoked')
+        # 同一次登录签发的刷新令牌全部作废
+        self.assertEqual(self.refresh(rotated['refresh_token']).status_code, 401)
+
+        # 其他登录不受影响
+        other = login(self.client, 'alice')
+        self.assertEqual(self.refresh(other['refresh_token']).status_code, 200)
+
+    def test_logout_revokes_refresh_family(self):
+        tokens = login(self.client, 'alice')
+        response = self.client.post('/api/auth/logout', json={'refresh_token': tokens['refresh_token']},
+                                    headers=bearer(tokens))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(tokens['refresh_token']).status_code, 401)
+
+
+if __name__ == '__main__':
+    unittest.main()
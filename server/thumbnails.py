@@ -0,0 +1,196 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+
+from blobstore import DERIVATIVE_DIR
+
+# Pillow 为可选依赖（pip install Pillow）；未安装时 ?size= 请求直接返回原图
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+# 图片缩略图与预览图
+#
+# 图片上传后把生成任务放入后台队列，由固定数量的工作线程生成各尺寸的派生图，上传请求不等待；
+# 请求 /uploads/<user_id>/<filename>?size=thumb 时若派生图还不存在，则立即排队生成并等待结果。
+# 派生图按原图内容哈希存放在 UPLOAD_FOLDER/.derivatives/<尺寸>/ 下，相同内容只生成一次。
+
+# 尺寸名称 -> 最长边像素
+SIZES = {
+    'thumb': 256,
+    'preview': 1024,
+}
+
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+
+JPEG_QUALITY = 82
+
+# 延迟统计保留最近的任务数
+_LATENCY_WINDOW = 500
+
+
+def is_image(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in IMAGE_EXTENSIONS
+
+
+def derivative_key(source_path, digest):
+    """派生图的文件名主体：去重存储中的文件用内容哈希，旧版文件用路径哈希"""
+    if digest:
+        return digest
+    return 'p' + hashlib.sha256(os.path.abspath(source_path).encode('utf-8')).hexdigest()
+
+
+def derivative_path(upload_folder, size, key, filename):
+    # 有透明通道的格式输出PNG，其余输出JPEG
+    ext = 'jpg' if filename.rsplit('.', 1)[-1].lower() in ('jpg', 'jpeg') else 'png'
+    return os.path.join(upload_folder, DERIVATIVE_DIR, size, key[:2], f'{key}.{ext}')
+
+
+def derivative_is_fresh(path, source_path):
+    try:
+        return os.path.getmtime(path) >= os.path.getmtime(source_path)
+    except FileNotFoundError:
+        return False
+
+
+def render_derivative(source_path, target_path, max_side):
+    """生成一张最长边不超过 max_side 的派生图，写入临时文件后原子替换"""
+    with Image.open(source_path) as image:
+        # JPEG可以在解码时直接按比例缩小，大图只需解码一小部分像素
+        image.draft('RGB', (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side))
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_path = f'{target_path}.{uuid.uuid4().hex}.tmp'
+        try:
+            if target_path.endswith('.jpg'):
+                image.convert('RGB').save(tmp_path, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+            else:
+                if image.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+                    image = image.convert('RGBA')
+                image.save(tmp_path, 'PNG', optimize=True)
+            os.replace(tmp_path, target_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+class ThumbnailPool:
+    """
+    有界队列 + 固定数量工作线程的派生图生成池
+
+    同一派生图同时只会生成一次，重复提交返回同一个 Future；
+    队列已满时 submit(wait=False) 直接放弃，等到首次请求该尺寸时再生成。
+    生成失败（如图片损坏）的派生图在 failure_ttl 秒内不再重试，避免每次请求都重新解码
+    """
+
+    def __init__(self, workers=2, queue_size=256, failure_ttl=300):
+        self.workers = workers
+        self.failure_ttl = failure_ttl
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = {}  # 目标路径 -> Future
+        self._failures = {}  # 目标路径 -> 可以重试的时间
+        self._lock = threading.Lock()
+        self._threads = []
+        self._latencies = deque(maxlen=_LATENCY_WINDOW)
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'dropped': 0, 'skipped': 0}
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def start(self):
+        if self.available and not self._threads:
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f'thumbnail-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        return self
+
+    def submit(self, source_path, target_path, max_side, wait=False, timeout=None):
+        """
+        提交一个生成任务，返回 Future；无法排队或最近生成失败过时返回None
+
+        wait=True 表示调用方会等待结果（请求时按需生成），队列满时最多阻塞排队 timeout 秒而不是立即放弃
+        """
+        if not self.available:
+            return None
+        with self._lock:
+            future = self._pending.get(target_path)
+            if future is not None:
+                return future
+            retry_at = self._failures.get(target_path)
+            if retry_at is not None:
+                if time.monotonic() < retry_at:
+                    self._stats['skipped'] += 1
+                    return None
+                del self._failures[target_path]
+            future = Future()
+            self._pending[target_path] = future
+            self._stats['submitted'] += 1
+        job = (source_path, target_path, max_side, future, time.monotonic())
+        try:
+            self._queue.put(job, block=wait, timeout=timeout)
+        except queue.Full:
+            with self._lock:
+                self._pending.pop(target_path, None)
+                self._stats['dropped'] += 1
+            return None
+        return future
+
+    def _run(self):
+        while True:
+            source_path, target_path, max_side, future, queued_at = self._queue.get()
+            started = time.monotonic()
+            try:
+                render_derivative(source_path, target_path, max_side)
+            except Exception as e:
+                with self._lock:
+                    self._stats['failed'] += 1
+                    self._remember_failure(target_path)
+                future.set_exception(e)
+            else:
+                finished = time.monotonic()
+                with self._lock:
+                    self._stats['completed'] += 1
+                    self._latencies.append((started - queued_at, finished - started))
+                future.set_result(target_path)
+            finally:
+                with self._lock:
+                    self._pending.pop(target_path, None)
+                self._queue.task_done()
+
+    def _remember_failure(self, target_path):
+        # 调用方需持有 self._lock；顺带清理已过期的记录，避免字典无限增长
+        now = time.monotonic()
+        for path in [path for path, retry_at in self._failures.items() if retry_at <= now]:
+            del self._failures[path]
+        if self.failure_ttl > 0:
+            self._failures[target_path] = now + self.failure_ttl
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            latencies = list(self._latencies)
+            in_flight = len(self._pending)
+            failures = len(self._failures)
+        snapshot.update({
+            'available': self.available,
+            'workers': len(self._threads),
+            'queue_depth': self._queue.qsize(),
+            'in_flight': in_flight,
+            'recent_failures': failures,
+        })
+        for index, name in ((0, 'wait'), (1, 'render')):
+            values = sorted(item[index] for item in latencies)
+            if values:
+                snapshot[f'{name}_ms_avg'] = round(sum(values) / len(values) * 1000, 2)
+                snapshot[f'{name}_ms_p95'] = round(values[max(int(len(values) * 0.95) - 1, 0)] * 1000, 2)
+        return snapshot
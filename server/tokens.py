@@ -0,0 +1,227 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+
+# 无状态访问令牌
+#
+# 令牌格式为 base64url(载荷JSON) + '.' + base64url(HMAC-SHA256签名)，载荷字段：
+# - sub: 用户id   - exp: 过期时间（Unix秒）   - jti: 令牌id   - typ: 'access' / 'refresh'
+# - fam: 刷新令牌所属的家族（同一次登录后轮换出的所有刷新令牌属于同一家族）
+#
+# 访问令牌有效期短，校验只做签名比较、过期检查和吊销检查；退出登录时令牌id写入 revoked_tokens 表，
+# 各工作进程的吊销缓存定期增量读取该表，在令牌过期前拒绝它（见 RevocationCache）。
+# 刷新令牌每次使用后即作废并签发新的一对令牌（轮换），已使用过的刷新令牌再次出现时
+# 说明令牌可能已泄露，整个家族随之作废。刷新请求频率很低，刷新令牌的状态保存在 refresh_tokens 表中。
+
+ACCESS_TOKEN_TTL = 15 * 60  # 秒
+REFRESH_TOKEN_TTL = 30 * 24 * 60 * 60  # 秒
+
+
+class TokenError(Exception):
+    """令牌无效、已过期或已被吊销"""
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def load_secret(secret, database):
+    """
+    返回签名密钥
+
+    配置了 TOKEN_SECRET 时直接使用；否则读取数据库旁的 <数据库>.token_secret 文件，
+    不存在时生成一个随机密钥写入该文件。多个工作进程并发启动时只有一个能创建成功，
+    其余进程读取同一个文件，保证所有进程使用相同的密钥
+    """
+    if secret:
+        return secret.encode('utf-8') if isinstance(secret, str) else secret
+    path = f'{database}.token_secret'
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        pass
+    else:
+        with os.fdopen(fd, 'w') as f:
+            f.write(secrets.token_hex(32))
+    for _ in range(50):
+        with open(path) as f:
+            value = f.read().strip()
+        if value:
+            return value.encode('utf-8')
+        time.sleep(0.01)  # 其他进程刚创建文件，尚未写入
+    raise RuntimeError(f'Token secret file is empty: {path}')
+
+
+class RevocationCache:
+    """
+    已吊销访问令牌的缓存
+
+    提供 connect（返回数据库连接）时，吊销记录同时写入 revoked_tokens 表；校验令牌时最多每
+    sync_interval 秒按自增id增量读取一次其他进程新增的记录，校验本身仍只查内存。
+    因此在一个进程退出登录后，其他进程最多在 sync_interval 秒内仍接受该令牌。
+
+    令牌id只需保存到令牌本身过期为止，过期的条目在写入时顺带清理；
+    超过 max_entries 时丢弃最早过期的条目
+    """
+
+    def __init__(self, max_entries=10000, connect=None, sync_interval=1.0):
+        self.max_entries = max_entries
+        self.connect = connect
+        self.sync_interval = sync_interval
+        self._entries = {}  # jti -> 过期时间
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_at = None
+        self._last_id = 0
+
+    def revoke(self, jti, expires_at):
+        self._remember(jti, expires_at)
+        if self.connect is None:
+            return
+        conn = self.connect()
+        try:
+            conn.execute('DELETE FROM revoked_tokens WHERE expires_at <= ?', (int(time.time()),))
+            conn.execute('INSERT OR IGNORE INTO revoked_tokens (jti, expires_at) VALUES (?, ?)', (jti, expires_at))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _sync(self):
+        """距上次读取超过 sync_interval 秒时读取新增的吊销记录；已有线程在读取时直接返回"""
+        if self.connect is None:
+            return
+        now = time.monotonic()
+        if self._synced_at is not None and now - self._synced_at < self.sync_interval:
+            return
+        if not self._sync_lock.acquire(blocking=False):
+            return
+        try:
+            conn = self.connect()
+            try:
+                rows = conn.execute('SELECT id, jti, expires_at FROM revoked_tokens WHERE id > ? ORDER BY id',
+                                    (self._last_id,)).fetchall()
+            finally:
+                conn.close()
+            for row_id, jti, expires_at in rows:
+                self._remember(jti, expires_at)
+                self._last_id = row_id
+            self._synced_at = now
+        finally:
+            self._sync_lock.release()
+
+    def _remember(self, jti, expires_at):
+        now = time.time()
+        with self._lock:
+            self._entries[jti] = expires_at
+            if len(self._entries) > self.max_entries:
+                for key in [key for key, exp in self._entries.items() if exp <= now]:
+                    del self._entries[key]
+                while len(self._entries) > self.max_entries:
+                    del self._entries[min(self._entries, key=self._entries.get)]
+
+    def is_revoked(self, jti):
+        self._sync()
+        return jti in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TokenSigner:
+    """签发和校验令牌"""
+
+    def __init__(self, secret, access_ttl=ACCESS_TOKEN_TTL, refresh_ttl=REFRESH_TOKEN_TTL, revocations=None):
+        self._secret = secret
+        self.access_ttl = access_ttl
+        self.refresh_ttl = refresh_ttl
+        self.revocations = revocations if revocations is not None else RevocationCache()
+
+    def _sign(self, payload):
+        return hmac.new(self._secret, payload, hashlib.sha256).digest()
+
+    def encode(self, claims):
+        payload = json.dumps(claims, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        return f'{_b64encode(payload)}.{_b64encode(self._sign(payload))}'
+
+    def decode(self, token, typ):
+        """校验签名、类型和有效期，返回载荷；令牌无效时抛出 TokenError"""
+        try:
+            payload_part, signature_part = token.split('.')
+            payload = _b64decode(payload_part)
+            signature = _b64decode(signature_part)
+        except (ValueError, UnicodeError):
+            raise TokenError('Invalid token')
+        if not hmac.compare_digest(signature, self._sign(payload)):
+            raise TokenError('Invalid token')
+        claims = json.loads(payload)
+        if claims.get('typ') != typ:
+            raise TokenError('Invalid token')
+        if claims['exp'] <= time.time():
+            raise TokenError('Token expired')
+        if typ == 'access' and self.revocations.is_revoked(claims['jti']):
+            raise TokenError('Token revoked')
+        return claims
+
+    def issue(self, user_id, family=None):
+        """签发一对访问令牌和刷新令牌，返回 (响应字典, 刷新令牌载荷)"""
+        now = int(time.time())
+        access = {'sub': user_id, 'exp': now + self.access_ttl, 'jti': secrets.token_hex(8), 'typ': 'access'}
+        refresh = {'sub': user_id, 'exp': now + self.refresh_ttl, 'jti': secrets.token_hex(16), 'typ': 'refresh',
+                   'fam': family or secrets.token_hex(16)}
+        return {
+            'access_token': self.encode(access),
+            'refresh_token': self.encode(refresh),
+            'token_type': 'Bearer',
+            'expires_in': self.access_ttl,
+        }, refresh
+
+
+def store_refresh_token(cursor, claims):
+    cursor.execute('INSERT INTO refresh_tokens (jti, user_id, family, expires_at) VALUES (?, ?, ?, ?)',
+                   (claims['jti'], claims['sub'], claims['fam'], claims['exp']))
+
+
+def rotate_refresh_token(conn, signer, token):
+    """
+    使用刷新令牌换取新的一对令牌，返回响应字典
+
+    刷新令牌只能使用一次：已使用过的令牌再次出现时作废整个家族并抛出 TokenError
+    """
+    claims = signer.decode(token, 'refresh')
+    cursor = conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('DELETE FROM refresh_tokens WHERE expires_at <= ?', (int(time.time()),))
+        cursor.execute('UPDATE refresh_tokens SET used = 1 WHERE jti = ? AND used = 0', (claims['jti'],))
+        if cursor.rowcount != 1:
+            cursor.execute('DELETE FROM refresh_tokens WHERE family = ?', (claims['fam'],))
+            conn.commit()
+            raise TokenError('Refresh token reused or revoked')
+        tokens, refresh = signer.issue(claims['sub'], claims['fam'])
+        store_refresh_token(cursor, refresh)
+        conn.commit()
+    except TokenError:
+        raise
+    except Exception:
+        conn.rollback()
+        raise
+    return tokens
+
+
+def revoke_refresh_family(conn, signer, token):
+    """作废刷新令牌所在的整个家族（退出登录），令牌无效时忽略"""
+    try:
+        claims = signer.decode(token, 'refresh')
+    except TokenError:
+        return
+    conn.execute('DELETE FROM refresh_tokens WHERE family = ?', (claims['fam'],))
+    conn.commit()
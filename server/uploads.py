@@ -0,0 +1,245 @@
+import datetime
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# 分块续传上传
+#
+# 协议分三步：
+#   1. POST   /api/uploads                      创建上传会话，声明文件名、总大小和（可选）SHA-256
+#   2. PUT    /api/uploads/<id>?offset=N        上传一个分块，offset 必须等于服务端已接收的字节数
+#      GET    /api/uploads/<id>                 查询已接收的字节数，断线后从该位置继续
+#   3. POST   /api/uploads/<id>/complete        校验大小和SHA-256，把临时文件登记到去重存储（见 blobstore.py）
+#      DELETE /api/uploads/<id>                 放弃上传
+#
+# 分块直接从请求流按 STREAM_BLOCK_SIZE 写入用户目录下的临时文件，内存占用只与块大小有关；
+# 会话状态保存在 upload_sessions 表中，多个工作进程可以接力处理同一个上传。
+
+STREAM_BLOCK_SIZE = 64 * 1024
+
+# 临时文件与去重存储在同一文件系统，完成时只需一次 rename
+PARTIAL_SUFFIX = '.part'
+
+# 已完成的字节范围对应的SHA-256增量状态，按上传id缓存在进程内。
+# 同一进程连续收到分块时直接续算，完成时无需重新读取整个文件；
+# 缓存缺失（分块由其他进程处理或进程重启）时从磁盘重新计算已接收部分
+_HASHER_CACHE_SIZE = 256
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+
+# 过期会话的清理间隔（秒），在创建新会话时顺带执行
+PRUNE_INTERVAL = 10 * 60
+_last_prune = 0.0
+
+
+class UploadError(Exception):
+    """上传协议错误，status 为对应的HTTP状态码，extra 为附加到响应中的字段"""
+
+    def __init__(self, message, status=400, **extra):
+        super().__init__(message)
+        self.status = status
+        self.extra = extra
+
+
+def partial_path(upload_folder, session):
+    return os.path.join(upload_folder, session['user_id'], f".{session['id']}{PARTIAL_SUFFIX}")
+
+
+def _now():
+    return datetime.datetime.now()
+
+
+def _is_expired(session, ttl):
+    updated_at = datetime.datetime.fromisoformat(session['updated_at'])
+    return _now() - updated_at > datetime.timedelta(seconds=ttl)
+
+
+def _take_hasher(upload_id, offset):
+    with _hashers_lock:
+        entry = _hashers.pop(upload_id, None)
+    if entry is not None and entry[0] == offset:
+        return entry[1]
+    return None
+
+
+def _put_hasher(upload_id, offset, hasher):
+    with _hashers_lock:
+        _hashers[upload_id] = (offset, hasher)
+        _hashers.move_to_end(upload_id)
+        while len(_hashers) > _HASHER_CACHE_SIZE:
+            _hashers.popitem(last=False)
+
+
+def _drop_hasher(upload_id):
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+
+
+def _hash_file(path, length):
+    hasher = hashlib.sha256()
+    remaining = length
+    with open(path, 'rb') as f:
+        while remaining > 0:
+            block = f.read(min(STREAM_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def create_session(conn, upload_folder, user_id, filename, size, sha256, max_size):
+    """创建上传会话并预先创建空的临时文件，返回会话字典"""
+    if not isinstance(size, int) or size < 0:
+        raise UploadError('Invalid size')
+    if size > max_size:
+        raise UploadError('File too large', status=413, max_size=max_size)
+    if sha256 is not None and (not isinstance(sha256, str) or len(sha256) != 64):
+        raise UploadError('Invalid sha256')
+
+    now = _now().isoformat()
+    session = {
+        'id': str(uuid.uuid4()),
+        'user_id': user_id,
+        'filename': filename,
+        'size': size,
+        'received': 0,
+        'sha256': sha256.lower() if sha256 else None,
+        'created_at': now,
+        'updated_at': now,
+    }
+    path = partial_path(upload_folder, session)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+
+    conn.execute('''
+        INSERT INTO upload_sessions (id, user_id, filename, size, received, sha256, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', tuple(session.values()))
+    conn.commit()
+    return session
+
+
+def get_session(conn, upload_id, ttl, user_id=None):
+    """读取上传会话，不存在、已过期或不属于 user_id（提供时）时抛出 UploadError"""
+    row = conn.execute('SELECT * FROM upload_sessions WHERE id = ?', (upload_id,)).fetchone()
+    if row is None or (user_id is not None and row['user_id'] != user_id):
+        raise UploadError('Upload not found', status=404)
+    session = dict(row)
+    if _is_expired(session, ttl):
+        raise UploadError('Upload expired', status=410)
+    return session
+
+
+def write_chunk(conn, upload_folder, session, offset, stream, length, chunk_sha256=None):
+    """
+    把请求流中的一个分块写入临时文件，返回写入后的已接收字节数
+
+    offset 必须等于已接收的字节数，否则返回409和服务端的当前位置，客户端据此续传；
+    提供 chunk_sha256 时校验该分块，不一致时丢弃该分块
+    """
+    received = session['received']
+    if offset != received:
+        raise UploadError('Offset mismatch', status=409, offset=received)
+    if length is None:
+        raise UploadError('Missing Content-Length', status=411)
+    if received + length > session['size']:
+        raise UploadError('Chunk exceeds declared size', status=413, offset=received)
+
+    hasher = _take_hasher(session['id'], received)
+    path = partial_path(upload_folder, session)
+    if hasher is None:
+        hasher = _hash_file(path, received)
+    chunk_hasher = hashlib.sha256() if chunk_sha256 else None
+
+    written = 0
+    with open(path, 'r+b') as f:
+        f.seek(received)
+        while written < length:
+            block = stream.read(min(STREAM_BLOCK_SIZE, length - written))
+            if not block:
+                break
+            f.write(block)
+            hasher.update(block)
+            if chunk_hasher is not None:
+                chunk_hasher.update(block)
+            written += len(block)
+        # 客户端中途断开或分块校验失败时回退到分块开始的位置，已接收部分保持不变
+        failed = written != length or (chunk_hasher is not None
+                                      and chunk_hasher.hexdigest() != chunk_sha256.lower())
+        if failed:
+            f.truncate(received)
+    if written != length:
+        raise UploadError('Incomplete chunk', offset=received)
+    if failed:
+        raise UploadError('Chunk checksum mismatch', offset=received)
+
+    # 以已接收字节数作为条件更新，并发写同一个分块时只有一个请求生效
+    new_received = received + written
+    cursor = conn.execute(
+        'UPDATE upload_sessions SET received = ?, updated_at = ? WHERE id = ? AND received = ?',
+        (new_received, _now().isoformat(), session['id'], received)
+    )
+    conn.commit()
+    if cursor.rowcount != 1:
+        raise UploadError('Offset mismatch', status=409, offset=received)
+
+    _put_hasher(session['id'], new_received, hasher)
+    session['received'] = new_received
+    return new_received
+
+
+def complete_session(conn, upload_folder, session, publish):
+    """
+    校验并完成上传，返回文件的SHA-256
+
+    大小和哈希校验通过后调用 publish(临时文件路径, 哈希) 把临时文件登记为正式文件，
+    成功后才删除会话；publish 失败时会话保留，客户端可以重试完成请求
+    """
+    if session['received'] != session['size']:
+        raise UploadError('Upload incomplete', status=409, offset=session['received'])
+
+    path = partial_path(upload_folder, session)
+    hasher = _take_hasher(session['id'], session['received']) or _hash_file(path, session['received'])
+    digest = hasher.hexdigest()
+    if session['sha256'] and digest != session['sha256']:
+        # 内容与声明不符，整个上传作废
+        abort_session(conn, upload_folder, session)
+        raise UploadError('Checksum mismatch', status=422, sha256=digest)
+
+    publish(path, digest)
+    conn.execute('DELETE FROM upload_sessions WHERE id = ?', (session['id'],))
+    conn.commit()
+    return digest
+
+
+def abort_session(conn, upload_folder, session):
+    conn.execute('DELETE FROM upload_sessions WHERE id = ?', (session['id'],))
+    conn.commit()
+    _drop_hasher(session['id'])
+    try:
+        os.remove(partial_path(upload_folder, session))
+    except FileNotFoundError:
+        pass
+
+
+def prune_sessions(conn, upload_folder, ttl):
+    """清理超过 ttl 秒未更新的上传会话及其临时文件，返回清理的数量"""
+    cutoff = (_now() - datetime.timedelta(seconds=ttl)).isoformat()
+    rows = conn.execute('SELECT id, user_id FROM upload_sessions WHERE updated_at < ?', (cutoff,)).fetchall()
+    for row in rows:
+        abort_session(conn, upload_folder, dict(row))
+    return len(rows)
+
+
+def prune_sessions_if_due(conn, upload_folder, ttl):
+    """距离上次清理超过 PRUNE_INTERVAL 时执行一次 prune_sessions"""
+    global _last_prune
+    now = time.monotonic()
+    if now - _last_prune < PRUNE_INTERVAL:
+        return 0
+    _last_prune = now
+    return prune_sessions(conn, upload_folder, ttl)
@@ -0,0 +1,163 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from metrics import DURATION_BUCKETS, Histogram
+
+# 合并写入（group commit）
+#
+# 每个写请求单独提交时，一次写入就是一次fsync；多个工作线程同时写入还会在数据库写锁上
+# 反复等待（SQLITE_BUSY 后按 busy_timeout 重试）。启用 WRITE_COALESCING_ENABLED 后，
+# 单条写接口把本次请求的写语句（一个函数）交给每个工作进程唯一的写线程：
+# 写线程取到第一个任务后最多再等待 linger 秒，把期间到达的任务（最多 max_batch 个）
+# 放进同一个 BEGIN IMMEDIATE 事务依次执行，提交一次后再逐个返回结果。
+#
+# 每个任务在自己的 SAVEPOINT 中执行，任务抛出异常时只回滚该任务的语句，不影响同批的其他任务；
+# 提交失败时同批所有任务都收到该异常。任务的结果在提交成功后才返回，调用方拿到结果时数据已经落盘。
+
+# 批大小直方图的分桶
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+# 延迟统计保留最近的批次数
+_LATENCY_WINDOW = 500
+
+
+class WriterSaturated(Exception):
+    """写入队列已满"""
+
+
+class GroupCommitWriter:
+    """
+    单写线程 + 有界队列的合并写入器
+
+    run(func, *args) 在写线程中以 func(cursor, *args) 执行一次请求的全部写语句并等待提交，
+    返回 func 的返回值；队列已满时抛出 WriterSaturated。connect 返回一个数据库连接（连接池借出的连接）
+    """
+
+    def __init__(self, connect, max_batch=64, linger=0.002, queue_size=1024):
+        self.connect = connect
+        self.max_batch = max_batch
+        self.linger = linger
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._batch_sizes = Histogram(BATCH_SIZE_BUCKETS)
+        self._waits = Histogram(DURATION_BUCKETS)
+        self._latencies = deque(maxlen=_LATENCY_WINDOW)  # (批大小, 最长排队时间, 执行并提交的耗时)
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'batches': 0,
+                       'commit_failures': 0}
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+            self._thread.start()
+        return self
+
+    def submit(self, func, *args):
+        future = Future()
+        try:
+            self._queue.put_nowait((func, args, future, time.monotonic()))
+        except queue.Full:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise WriterSaturated()
+        with self._lock:
+            self._stats['submitted'] += 1
+        return future
+
+    def run(self, func, *args):
+        # 不设超时：写线程总会在事务结束后设置结果，超时返回反而会让调用方误以为写入失败
+        return self.submit(func, *args).result()
+
+    def _collect(self):
+        """取出一批任务：阻塞等待第一个，之后最多再等待 linger 秒"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._execute(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _execute(self, batch):
+        started = time.monotonic()
+        outcomes = []
+        conn = None
+        try:
+            conn = self.connect()
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            for func, args, future, _ in batch:
+                cursor.execute('SAVEPOINT write_job')
+                try:
+                    result = func(cursor, *args)
+                except Exception as e:
+                    cursor.execute('ROLLBACK TO write_job')
+                    outcomes.append((future, None, e))
+                else:
+                    outcomes.append((future, result, None))
+                cursor.execute('RELEASE write_job')
+            conn.commit()
+        except Exception as e:
+            # 开始事务、回滚到保存点或提交失败：整批都没有写入，未提交的事务在连接归还时回滚
+            outcomes = [(future, None, e) for _, _, future, _ in batch]
+            with self._lock:
+                self._stats['commit_failures'] += 1
+        finally:
+            if conn is not None:
+                conn.close()
+
+        finished = time.monotonic()
+        failed = sum(1 for _, _, error in outcomes if error is not None)
+        with self._lock:
+            self._stats['batches'] += 1
+            self._stats['completed'] += len(batch) - failed
+            self._stats['failed'] += failed
+            self._batch_sizes.observe(len(batch))
+            for _, _, _, queued_at in batch:
+                self._waits.observe(started - queued_at)
+            self._latencies.append((len(batch), started - batch[0][3], finished - started))
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def histograms(self):
+        """返回 (批大小直方图, 排队时间直方图) 的副本，用于 /metrics"""
+        with self._lock:
+            return self._batch_sizes.copy(), self._waits.copy()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            latencies = list(self._latencies)
+        snapshot.update({
+            'max_batch': self.max_batch,
+            'linger_ms': round(self.linger * 1000, 3),
+            'queue_depth': self._queue.qsize(),
+            'queue_size': self._queue.maxsize,
+        })
+        if latencies:
+            snapshot['batch_size_avg'] = round(sum(item[0] for item in latencies) / len(latencies), 2)
+            snapshot['batch_size_max'] = max(item[0] for item in latencies)
+        for index, name in ((1, 'wait'), (2, 'commit')):
+            values = sorted(item[index] for item in latencies)
+            if values:
+                snapshot[f'{name}_ms_avg'] = round(sum(values) / len(values) * 1000, 2)
+                snapshot[f'{name}_ms_p95'] = round(values[max(int(len(values) * 0.95) - 1, 0)] * 1000, 2)
+        return snapshot
+
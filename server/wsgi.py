@@ -0,0 +1,11 @@
+"""
+生产环境WSGI入口
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+只创建应用，不执行表结构初始化；gunicorn.conf.py 会在主进程启动时执行一次 init_db()。
+使用其他WSGI服务器时，请先运行 python migrations.py <数据库路径> 完成表结构升级
+"""
+from app import create_app
+
+app = create_app()